@@ -0,0 +1,105 @@
+"""Low-resolution, low frame rate proxy of a recording for model analysis.
+
+The archival encoder hands every frame it encodes to the proxy (see
+StreamingVideoEncoder.taps), so both files come out of one capture pass.
+The proxy keeps one frame every 1/fps seconds, shrinks it by an integer
+factor with block averaging and encodes it into a file next to the
+recording.
+"""
+import math
+
+import cv2
+import numpy as np
+
+from encoders import PIXEL_FORMATS, FFmpegPipeEncoder, StreamingVideoEncoder
+
+
+def area_downscale(frame, factor):
+    """Shrink a (height, width, channels) uint8 frame by averaging factor x factor blocks.
+
+    Equivalent to an area (box) filter for integer factors. Rows of each
+    block are summed as contiguous slices first, then the columns, in a
+    16-bit accumulator when it cannot overflow.
+    """
+    if factor == 1:
+        return frame
+    height, width, channels = frame.shape
+    out_height, out_width = height // factor, width // factor
+    frame = frame[:out_height * factor, :out_width * factor]
+    dtype = np.uint16 if factor * factor * 255 <= 0xFFFF else np.uint32
+
+    rows = frame[0::factor].astype(dtype)
+    for offset in range(1, factor):
+        rows += frame[offset::factor]
+    blocks = rows.reshape(out_height, out_width, factor, channels)
+    total = blocks[:, :, 0].copy()
+    for offset in range(1, factor):
+        total += blocks[:, :, offset]
+    total += factor * factor // 2
+    total //= factor * factor
+    return total.astype(np.uint8)
+
+
+class AnalysisProxy:
+    """Second, small output fed from the archival encoder's frames.
+
+    Frames are reduced by the smallest integer factor that brings the width
+    down to `max_width` and sampled at `fps`. Downscaling runs on the
+    archival encoder's thread, never on the capture thread. Proxy frames
+    are dropped rather than slow that thread down, unless `drop_policy`
+    says otherwise.
+    """
+    def __init__(self, path, width, height, input_format='bgr', fps=2, max_width=960,
+                 backend='ffmpeg', time_map=None, drop_policy='drop_oldest'):
+        self.path = str(path)
+        self.fps = fps
+        self.factor = max(1, math.ceil(width / max_width))
+        self.width = (width // self.factor) & ~1
+        self.height = (height // self.factor) & ~1
+        self.frames_offered = 0
+        self._next_due = 0.0
+        encoder_class = FFmpegPipeEncoder if backend == 'ffmpeg' else StreamingVideoEncoder
+        channels = PIXEL_FORMATS[input_format][0]
+        self.encoder = encoder_class(self.path, self.width, self.height, fps=fps,
+                                     input_format=input_format,
+                                     buffer_bytes=8 * self.width * self.height * channels,
+                                     drop_policy=drop_policy, time_map=time_map,
+                                     profile='analysis')
+
+    def start(self):
+        self.encoder.start()
+
+    def offer(self, frame, timestamp):
+        """Take an archival frame if the next proxy frame is due"""
+        if timestamp < self._next_due:
+            return
+        self._next_due = (math.floor(timestamp * self.fps) + 1) / self.fps
+        small = area_downscale(frame, self.factor)[:self.height, :self.width]
+        self.encoder.write(small, timestamp)
+        self.frames_offered += 1
+
+    def close(self, end_timestamp=None):
+        return self.encoder.close(end_timestamp=end_timestamp)
+
+
+def proxy_from_video(video_path, path, fps=2, max_width=960, backend='ffmpeg'):
+    """Build the proxy of a finished recording, e.g. one recovered after a crash"""
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise IOError(f"Could not open video {video_path}")
+    try:
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        proxy = AnalysisProxy(path, width, height, fps=fps, max_width=max_width,
+                              backend=backend, drop_policy='block')
+        proxy.start()
+        timestamp = 0.0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            proxy.offer(frame, timestamp)
+    finally:
+        capture.release()
+    return proxy.close(end_timestamp=timestamp)
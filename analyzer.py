@@ -10,7 +10,8 @@ class InteractionAnalyzer:
         interactions = data["recording_data"]["interactions"]
         
         for interaction in interactions:
-            if interaction["type"] == "click":
+            if interaction["type"] == "click" or (
+                    interaction["type"] == "mouse_down" and "element" in interaction):
                 element = interaction["element"]
                 position = element.get("position", {"x": 0, "y": 0})  # Get position from element if available
                 self.workflow_steps.append({
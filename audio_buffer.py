@@ -0,0 +1,147 @@
+import wave
+from collections import deque
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # WAV output falls back to the standard library
+    soundfile = None
+
+
+class AudioChunkBuffer:
+    """Chunked ring buffer for audio blocks from a real-time callback.
+
+    Blocks are copied in place into preallocated chunks of `chunk_frames`
+    frames. Full chunks are handed to the consumer through a deque and come
+    back through another once written, so a single producer and a single
+    consumer never share a lock and memory stays constant. If the consumer
+    falls behind the buffer grows by one chunk at a time up to `max_chunks`;
+    beyond that incoming frames are dropped and counted.
+    """
+    def __init__(self, channels, chunk_frames, initial_chunks=4, max_chunks=64, dtype=np.float32):
+        self.channels = channels
+        self.chunk_frames = chunk_frames
+        self.max_chunks = max_chunks
+        self.dtype = dtype
+        self.chunks = [self._allocate() for _ in range(initial_chunks)]
+        self.dropped_frames = 0
+        self._free = deque(range(1, initial_chunks))
+        self._filled = deque()
+        self._current = 0
+        self._fill = 0
+
+    def _allocate(self):
+        return np.empty((self.chunk_frames, self.channels), dtype=self.dtype)
+
+    @property
+    def nbytes(self):
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+    def _next_chunk(self):
+        if self._free:
+            return self._free.popleft()
+        if len(self.chunks) < self.max_chunks:
+            self.chunks.append(self._allocate())
+            return len(self.chunks) - 1
+        return None
+
+    def write(self, block):
+        """Producer side: copy a (frames, channels) block into the buffer"""
+        offset = 0
+        frames = len(block)
+        while offset < frames:
+            if self._current is None:
+                self._current = self._next_chunk()
+                if self._current is None:
+                    self.dropped_frames += frames - offset
+                    return
+            count = min(frames - offset, self.chunk_frames - self._fill)
+            self.chunks[self._current][self._fill:self._fill + count] = block[offset:offset + count]
+            self._fill += count
+            offset += count
+            if self._fill == self.chunk_frames:
+                self._filled.append((self._current, self._fill))
+                self._current = None
+                self._fill = 0
+
+    def finish(self):
+        """Hand over the partly filled chunk; call once the producer stopped"""
+        if self._current is not None and self._fill:
+            self._filled.append((self._current, self._fill))
+            self._current = None
+            self._fill = 0
+
+    def drain(self):
+        """Consumer side: yield views of filled chunks, recycling each after use"""
+        while self._filled:
+            index, frames = self._filled.popleft()
+            try:
+                yield self.chunks[index][:frames]
+            finally:
+                self._free.append(index)
+
+
+class AudioFileWriter:
+    """Streams float32 audio blocks to WAV or FLAC files.
+
+    `path` may contain a `%05d` chunk number, in which case a new file is
+    started every `split_frames` frames. Uses soundfile when installed;
+    otherwise WAV files are written as 16-bit PCM with the wave module,
+    which rewrites the header on every write so a crash leaves a valid file.
+    """
+    def __init__(self, path, sample_rate, channels, split_frames=None):
+        self.path = str(path)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.split_frames = split_frames if '%' in self.path else None
+        self.paths = []
+        self.frames_written = 0
+        self._file = None
+        self._file_frames = 0
+
+    def _open(self):
+        path = self.path % len(self.paths) if self.split_frames else self.path
+        if soundfile is not None:
+            subtype = 'PCM_24' if path.lower().endswith('.flac') else 'FLOAT'
+            self._file = soundfile.SoundFile(path, 'w', samplerate=self.sample_rate,
+                                             channels=self.channels, subtype=subtype)
+        elif path.lower().endswith('.wav'):
+            self._file = wave.open(path, 'wb')
+            self._file.setnchannels(self.channels)
+            self._file.setsampwidth(2)
+            self._file.setframerate(self.sample_rate)
+        else:
+            raise RuntimeError(f"Writing {path} requires the soundfile package")
+        self.paths.append(path)
+        self._file_frames = 0
+
+    def write(self, block):
+        offset = 0
+        while offset < len(block):
+            if self._file is None:
+                self._open()
+            count = len(block) - offset
+            if self.split_frames:
+                count = min(count, self.split_frames - self._file_frames)
+            self._write_frames(block[offset:offset + count])
+            self._file_frames += count
+            self.frames_written += count
+            offset += count
+            if self.split_frames and self._file_frames >= self.split_frames:
+                self._close_file()
+
+    def _write_frames(self, frames):
+        if soundfile is not None:
+            self._file.write(frames)
+        else:
+            pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype('<i2')
+            self._file.writeframes(pcm.tobytes())
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self._close_file()
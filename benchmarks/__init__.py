@@ -0,0 +1,8 @@
+"""Performance benchmarks for the recording pipeline.
+
+Run individual benchmarks from the repository root, e.g.
+``python -m benchmarks.bench_gdi_capture``. ``python -m
+benchmarks.bench_recorders`` runs every recorder against synthetic
+sources and compares the results with a stored baseline. The
+``check_*`` modules assert on behaviour and exit non-zero on failure.
+"""
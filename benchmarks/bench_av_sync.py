@@ -0,0 +1,179 @@
+"""A/V drift: how well audio and video stay aligned on the shared session clock.
+
+Simulates an audio device whose sample clock runs `--drift-ppm` fast or
+slow, with jittered callbacks, and feeds its blocks through
+AudioClockSync exactly as AudioRecorder does. Reports the estimated drift
+and, for video frames spread over the session, the A/V offset with and
+without mapping frame times onto the audio clock.
+
+With `--encode`, frames from the synthetic capture backend are also piped
+through FFmpegPipeEncoder at jittered capture times and the presentation
+timestamps ffmpeg wrote are compared with the expected ones. This only
+reports; check_av_sync asserts on the same measurements.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+from fractions import Fraction
+
+import numpy as np
+
+from encoders import FFmpegPipeEncoder
+from recording_clock import AudioClockSync
+
+AUDIO_START = 0.15
+
+
+class SimulatedClock:
+    """RecordingClock stand-in driven by the simulation"""
+    def __init__(self):
+        self.origin = 0.0
+        self.time = 0.0
+
+    def now(self):
+        return self.time
+
+
+def simulate_audio(sync, seconds, drift_ppm, frame_times, block_frames=4410, latency_ms=5.0,
+                   jitter_ms=3.0, adc_noise_ms=0.2, stream_offset=1234.5, start=AUDIO_START, seed=0):
+    """Drive `sync` with simulated callbacks.
+
+    Returns the device's true rate and the media times of `frame_times`,
+    each mapped as soon as the session clock passes it, the way a live
+    encoder maps frames with the fit known at that moment.
+
+    The first sample reaches the ADC `start` seconds into the session. Each
+    callback arrives `latency_ms` plus exponential jitter after its block
+    was complete; the stream clock is the session clock plus
+    `stream_offset`, and reported ADC times carry `adc_noise_ms` of
+    gaussian noise. Leading silence is fixed after the first second of
+    audio, as AudioRecorder does on its first drain.
+    """
+    rng = random.Random(seed)
+    clock = sync.clock
+    true_rate = sync.sample_rate * (1 + drift_ppm / 1e6)
+    samples = 0
+    mapped = []
+    pending = iter(frame_times)
+    frame = next(pending, None)
+    while samples / true_rate < seconds:
+        adc = start + samples / true_rate
+        clock.time = adc + block_frames / true_rate + latency_ms / 1000 + rng.expovariate(1000 / jitter_ms)
+        reported_adc = adc + stream_offset + rng.gauss(0, adc_noise_ms / 1000)
+        sync.observe(block_frames, reported_adc, clock.time + stream_offset)
+        samples += block_frames
+        if sync.pad_start is None and samples >= sync.sample_rate:
+            sync.leading_frames()
+        while frame is not None and frame <= clock.time:
+            mapped.append(sync.media_time(frame))
+            frame = next(pending, None)
+    while frame is not None:
+        mapped.append(sync.media_time(frame))
+        frame = next(pending, None)
+    return true_rate, np.array(mapped)
+
+
+def measure_offsets(sync, true_rate, times, mapped, start=AUDIO_START):
+    """A/V offset of video frames, with and without the audio clock mapping.
+
+    A frame captured at session time t should be shown while the sample
+    captured at t plays. That sample plays at pad_start + n / nominal rate.
+    """
+    played = sync.pad_start + (times - start) * true_rate / sync.sample_rate
+    mapped_error = np.abs(mapped - played) * 1000
+    raw_error = np.abs(times - played) * 1000
+    return {
+        "uncorrected_max_ms": float(raw_error.max()),
+        "uncorrected_end_ms": float(raw_error[-1]),
+        "corrected_max_ms": float(mapped_error.max()),
+        "corrected_end_ms": float(mapped_error[-1]),
+    }
+
+
+def capture_times(frames, fps, seed=0):
+    """Capture timestamps of an uneven capture loop: jitter and skipped ticks"""
+    rng = random.Random(seed)
+    times = []
+    slot = 0
+    for _ in range(frames):
+        times.append(slot / fps + rng.uniform(0, 0.4) / fps)
+        slot += 1 if rng.random() > 0.1 else rng.randint(2, 4)
+    return times
+
+
+def read_video_pts(path):
+    """Presentation times (seconds) of the video packets ffmpeg wrote"""
+    output = subprocess.run(
+        ['ffmpeg', '-loglevel', 'error', '-i', path, '-map', '0:v:0', '-c', 'copy', '-f', 'framemd5', '-'],
+        check=True, capture_output=True, text=True
+    ).stdout
+    time_base = None
+    pts = []
+    for line in output.splitlines():
+        if line.startswith('#tb 0:'):
+            time_base = Fraction(line.split(':', 1)[1].strip())
+        elif line and not line.startswith('#'):
+            pts.append(int(line.split(',')[2]))
+    return sorted(float(value * time_base) for value in pts)
+
+
+def bench_encode(sync, frames, fps, directory):
+    # Imported here: the recorder module needs the full desktop dependencies
+    from recorder import create_screen_recorder
+
+    source = create_screen_recorder('synthetic', width=640, height=360)
+    path = os.path.join(directory, "av_sync.mp4")
+    encoder = FFmpegPipeEncoder(path, source.width, source.height, fps=fps,
+                                input_format=source.pixel_format, time_map=sync.media_time)
+    encoder.start()
+    times = capture_times(frames, fps)
+    for timestamp in times:
+        encoder.write(source.capture_raw(), timestamp)
+    end = times[-1] + 1 / fps
+    encoder.close(end_timestamp=end)
+
+    expected = [0.0] + [sync.media_time(t) for t in times[1:]] + [sync.media_time(end)]
+    written = read_video_pts(path)
+    errors = [abs(a - b) * 1000 for a, b in zip(expected, written)]
+    return {
+        "frames_captured": len(times),
+        "frames_written": encoder.frames_written,
+        "packets_read": len(written),
+        "pts_max_error_ms": max(errors) if errors else None,
+        "duration_s": written[-1] if written else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=3600)
+    parser.add_argument("--drift-ppm", type=float, default=120)
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--encode", action="store_true",
+                        help="also encode synthetic frames and check the written timestamps")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=30)
+    args = parser.parse_args()
+
+    sync = AudioClockSync(args.rate, SimulatedClock())
+    times = np.arange(0.0, args.seconds, 1 / args.fps)
+    true_rate, mapped = simulate_audio(sync, args.seconds, args.drift_ppm, times)
+    summary = sync.summary()
+    results = {
+        "seconds": args.seconds,
+        "true_drift_ppm": args.drift_ppm,
+        "estimated_drift_ppm": summary["drift_ppm"],
+        "estimated_start_ms": summary["audio_start_ms"],
+        "offsets": measure_offsets(sync, true_rate, times, mapped),
+    }
+    if args.encode:
+        with tempfile.TemporaryDirectory() as directory:
+            results["encode"] = bench_encode(sync, args.frames, args.fps, directory)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Per-frame capture latency: the original pywin32 capture vs a persistent session.
+
+The baseline is the capture_screen that GdiCaptureSession replaced:
+pywin32 DCs and a compatible bitmap created for every frame, read back
+with GetBitmapBits and converted with cvtColor. The session is timed both
+with that conversion (the same BGR result) and as the raw BGRA view that
+capture_raw hands the encoder.
+
+The baseline needs Windows. Elsewhere the session runs against a fake GDI
+and only its lifecycle overhead is measured.
+"""
+import argparse
+import ctypes
+import json
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from gdi_capture import GdiCaptureSession, GdiOps, Win32GdiOps
+
+
+class FakeGdiOps(GdiOps):
+    """In-memory stand-in for GDI that records the session lifecycle"""
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+        self.blits = 0
+        self.fail_next_blit = False
+        self._buffers = {}
+
+    def open(self, width, height):
+        buffer = (ctypes.c_ubyte * (width * height * 4))()
+        handle = self.opened
+        self._buffers[handle] = (buffer, width, height)
+        self.opened += 1
+        return handle, ctypes.addressof(buffer)
+
+    def blit(self, handles, left, top, width, height):
+        if self.fail_next_blit:
+            self.fail_next_blit = False
+            return False
+        buffer, _, _ = self._buffers[handles]
+        view = np.frombuffer(buffer, dtype=np.uint8)
+        view[::4096] = self.blits & 0xFF
+        self.blits += 1
+        return True
+
+    def close(self, handles):
+        del self._buffers[handles]
+        self.closed += 1
+
+
+def _percentiles(samples):
+    ordered = np.sort(np.asarray(samples)) * 1000
+    return {
+        "mean_ms": float(ordered.mean()),
+        "p50_ms": float(np.percentile(ordered, 50)),
+        "p99_ms": float(np.percentile(ordered, 99)),
+    }
+
+
+def capture_pywin32(width, height):
+    """The original WindowsScreenRecorder.capture_screen, kept for comparison"""
+    import win32con
+    import win32gui
+    import win32ui
+
+    hwnd = win32gui.GetDesktopWindow()
+    window_dc = win32gui.GetWindowDC(hwnd)
+    img_dc = win32ui.CreateDCFromHandle(window_dc)
+    mem_dc = img_dc.CreateCompatibleDC()
+
+    screenshot = win32ui.CreateBitmap()
+    screenshot.CreateCompatibleBitmap(img_dc, width, height)
+    mem_dc.SelectObject(screenshot)
+    mem_dc.BitBlt((0, 0), (width, height), img_dc, (0, 0), win32con.SRCCOPY)
+
+    bmp_str = screenshot.GetBitmapBits(True)
+    img = np.frombuffer(bmp_str, dtype='uint8')
+    img.shape = (height, width, 4)
+
+    mem_dc.DeleteDC()
+    win32gui.DeleteObject(screenshot.GetHandle())
+    img_dc.DeleteDC()
+    win32gui.ReleaseDC(hwnd, window_dc)
+    return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+
+
+def bench_original(width, height, frames):
+    samples = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        capture_pywin32(width, height)
+        samples.append(time.perf_counter() - start)
+    return _percentiles(samples)
+
+
+def bench_persistent_session(ops, width, height, frames, convert=False):
+    samples = []
+    with GdiCaptureSession(width, height, ops=ops) as session:
+        converted = np.empty((height, width, 3), dtype=np.uint8)
+        for _ in range(frames):
+            start = time.perf_counter()
+            frame = session.grab()
+            if convert:
+                cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=converted)
+            samples.append(time.perf_counter() - start)
+    return _percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--fake", action="store_true", help="Use the fake GDI even on Windows")
+    args = parser.parse_args()
+
+    use_fake = args.fake or platform.system() != 'Windows'
+    ops = FakeGdiOps() if use_fake else Win32GdiOps()
+
+    results = {
+        "backend": "fake" if use_fake else "gdi",
+        "resolution": f"{args.width}x{args.height}",
+        "frames": args.frames,
+        "original_pywin32": None if use_fake else bench_original(args.width, args.height, args.frames),
+        "persistent_session_bgr": bench_persistent_session(ops, args.width, args.height, args.frames,
+                                                           convert=True),
+        "persistent_session_raw": bench_persistent_session(ops, args.width, args.height, args.frames),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
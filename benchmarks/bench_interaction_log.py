@@ -0,0 +1,150 @@
+"""Interaction storage: dicts dumped as indented JSON vs the binary event log.
+
+Feeds the same synthetic form-filling event stream through both approaches
+and reports the per-event append cost, the time to save and the size on
+disk, plus the event count and size of the exported JSON with and without
+path simplification and scroll/keystroke coalescing.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from interaction_log import BUTTON_CODES, EVENT_CODES, InteractionLog, export_log_json, iter_log_records
+
+KEYS = list("abcdefghijklmnopqrstuvwxyz") + ["space", "backspace", "shift"]
+
+
+def synthetic_events(count, seed=0):
+    """Yield (offset_ns, event_type, x, y, button, key) for a form-filling session.
+
+    The pointer glides to a field (100 Hz move samples), clicks it, the user
+    types a value and tabs on; now and then the page is scrolled.
+    """
+    rng = random.Random(seed)
+    x, y = 640, 360
+    now = 0
+    produced = 0
+    while produced < count:
+        target_x, target_y = rng.randint(100, 1800), rng.randint(100, 1000)
+        steps = rng.randint(20, 60)
+        for step in range(1, steps + 1):
+            now += 10_000_000
+            yield now, "mouse_move", x + (target_x - x) * step // steps, y + (target_y - y) * step // steps, None, None
+        x, y = target_x, target_y
+        for event_type in ("mouse_down", "mouse_up"):
+            now += 80_000_000
+            yield now, event_type, x, y, "left", None
+        for _ in range(rng.randint(4, 16)):
+            now += rng.randint(60, 200) * 1_000_000
+            yield now, "keypress", 0, 0, None, rng.choice(KEYS)
+        now += 150_000_000
+        yield now, "keypress", 0, 0, None, "tab"
+        if rng.random() < 0.3:
+            for _ in range(rng.randint(3, 12)):
+                now += 40_000_000
+                yield now, "scroll", x, y, None, None
+        produced += steps + 20
+
+
+def bench_json_dicts(events, directory):
+    """The previous InteractionRecorder: dicts with ISO timestamps, one dump at the end"""
+    interactions = []
+    start = time.perf_counter()
+    for _, event_type, x, y, button, key in events:
+        event = {"timestamp": datetime.now().isoformat(), "type": event_type}
+        if event_type == "keypress":
+            event["key"] = key
+        else:
+            if button is not None:
+                event["button"] = button
+            elif event_type == "scroll":
+                event["direction"] = "down"
+            event["position"] = {"x": x, "y": y}
+        interactions.append(event)
+    append_seconds = time.perf_counter() - start
+
+    path = os.path.join(directory, "interactions.json")
+    start = time.perf_counter()
+    ordered = sorted(interactions, key=lambda e: e["timestamp"])
+    with open(path, "w") as f:
+        json.dump({"recording_data": {
+            "start_time": ordered[0]["timestamp"] if ordered else None,
+            "end_time": ordered[-1]["timestamp"] if ordered else None,
+            "platform": platform.system(),
+            "interactions": ordered,
+        }}, f, indent=2)
+    save_seconds = time.perf_counter() - start
+    return _result(len(events), append_seconds, save_seconds, os.path.getsize(path))
+
+
+def bench_binary_log(events, directory):
+    path = os.path.join(directory, "interactions.cbin")
+    log = InteractionLog(path)
+    origin = time.perf_counter_ns()
+    start = time.perf_counter()
+    for offset, event_type, x, y, button, key in events:
+        log.append(EVENT_CODES[event_type], origin + offset, x, y,
+                   detail=BUTTON_CODES.get(button, 0), text=key)
+    append_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    log.close()
+    save_seconds = time.perf_counter() - start
+    result = _result(len(events), append_seconds, save_seconds, os.path.getsize(path))
+
+    start = time.perf_counter()
+    read = sum(1 for _ in iter_log_records(path))
+    result["stream_read_s"] = time.perf_counter() - start
+    result["records_read"] = read
+
+    json_path = os.path.join(directory, "exported.json")
+    start = time.perf_counter()
+    export_log_json(path, json_path)
+    result["json_export_s"] = time.perf_counter() - start
+    result["json_export_bytes"] = os.path.getsize(json_path)
+    result["json_export_events"] = _event_count(json_path)
+
+    # Every record as its own event, without simplification or coalescing
+    export_log_json(path, json_path, move_tolerance=None, coalesce=False)
+    result["json_raw_export_bytes"] = os.path.getsize(json_path)
+    result["json_raw_export_events"] = _event_count(json_path)
+    return result
+
+
+def _event_count(json_path):
+    with open(json_path) as f:
+        return len(json.load(f)["recording_data"]["interactions"])
+
+
+def _result(count, append_seconds, save_seconds, size):
+    return {
+        "append_us_per_event": append_seconds / count * 1e6,
+        "save_s": save_seconds,
+        "bytes": size,
+        "bytes_per_event": size / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    events = list(synthetic_events(args.events, args.seed))
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "events": len(events),
+            "json_dicts": bench_json_dicts(events, directory),
+            "binary_log": bench_binary_log(events, directory),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
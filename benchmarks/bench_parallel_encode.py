@@ -0,0 +1,72 @@
+"""Encode time: one OpenCV writer thread vs chunks on a pool of processes.
+
+Queues `--frames` synthetic screen frames as fast as the encoder accepts
+them (the 'block' policy, so nothing is dropped) and times until the file
+is finalized, which is what stop_recording() waits for once the encoder
+has fallen behind. ParallelChunkEncoder is run for each `--workers` count.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from encoders import StreamingVideoEncoder
+from parallel_encoder import ParallelChunkEncoder
+
+
+def screen_frames(count, width, height, seed=0):
+    """Yield BGRA frames of a static noisy desktop with a moving window"""
+    rng = np.random.default_rng(seed)
+    desktop = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    frame = desktop.copy()
+    box = max(16, height // 8)
+    for index in range(count):
+        x = (index * 8) % max(1, width - box)
+        frame[:] = desktop
+        frame[box:2 * box, x:x + box] = 255
+        yield frame
+
+
+def bench(encoder_class, path, args, **kwargs):
+    encoder = encoder_class(path, args.width, args.height, fps=args.fps, input_format='bgra',
+                            drop_policy='block', **kwargs)
+    encoder.start()
+    start = time.perf_counter()
+    for index, frame in enumerate(screen_frames(args.frames, args.width, args.height)):
+        encoder.write(frame, index / args.fps)
+    frames = encoder.close(end_timestamp=args.frames / args.fps)
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 1),
+        "bytes": os.path.getsize(path),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    results = {"frames": args.frames, "size": f"{args.width}x{args.height}"}
+    with tempfile.TemporaryDirectory() as directory:
+        single = bench(StreamingVideoEncoder, os.path.join(directory, "single.mp4"), args)
+        results["single"] = single
+        for workers in sorted(set(args.workers)):
+            path = os.path.join(directory, f"parallel_{workers}.mp4")
+            result = bench(ParallelChunkEncoder, path, args, workers=workers)
+            result["speedup"] = round(single["seconds"] / result["seconds"], 2)
+            results[f"parallel_{workers}"] = result
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Encoding profiles on screen content: speed, CPU time, size and fidelity.
+
+Encodes the same frames under each profile through FFmpegPipeEncoder, the
+way a recording is encoded, and reports encode fps, CPU time of this
+process and of ffmpeg, output bytes and PSNR against the source frames.
+Frames come from `--input` (a reference screen recording) or, without it,
+from a generated desktop with typing, scrolling and a moving pointer.
+Frames are queued with the 'block' policy, so the fps is what the profile
+sustains, not what a recording would keep.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from encoders import FFmpegPipeEncoder
+from encoding_profiles import PROFILES
+
+try:
+    import resource
+except ImportError:  # Windows: ffmpeg's CPU time is not reported
+    resource = None
+
+TEXT = ("def record(self, frame, timestamp):  # encode while capturing, "
+        "keep the capture time, drop frames only when the budget is spent")
+
+
+def generated_frames(count, width, height, fps):
+    """BGR frames of an editor window: typing, periodic scrolling, a moving pointer"""
+    scale = height / 1080
+    line_height = max(12, int(28 * scale))
+    lines = height // line_height
+    background = np.full((height, width, 3), 245, dtype=np.uint8)
+    cv2.rectangle(background, (0, 0), (width, 3 * line_height // 2), (60, 60, 60), -1)
+    cv2.rectangle(background, (0, 0), (width // 6, height), (225, 225, 230), -1)
+    rows = [TEXT[(7 * row) % len(TEXT):] + TEXT for row in range(lines)]
+    for index in range(count):
+        frame = background.copy()
+        seconds = index / fps
+        first = int(seconds // 3) * 4  # scroll 4 lines every 3 seconds
+        typed = int(seconds * 12)  # 12 characters a second on the last line
+        for row in range(2, lines):
+            text = rows[(first + row) % len(rows)]
+            if row == lines - 1:
+                text = text[:typed % len(text)]
+            cv2.putText(frame, text, (width // 6 + 8, row * line_height), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.7 * scale, (30, 30, 30), 1, cv2.LINE_AA)
+        x = int((0.5 + 0.4 * np.sin(seconds)) * width)
+        y = int((0.5 + 0.4 * np.cos(seconds * 0.7)) * height)
+        cv2.fillPoly(frame, [np.array([[x, y], [x, y + 20], [x + 12, y + 14]])], (0, 0, 0))
+        yield frame
+
+
+def input_frames(path, count):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video {path}")
+    try:
+        for _ in range(count):
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+def psnr(path, frames):
+    """Mean PSNR (dB) of the decoded output against the source frames"""
+    capture = cv2.VideoCapture(path)
+    values = []
+    for source in frames:
+        ok, decoded = capture.read()
+        if not ok:
+            break
+        values.append(cv2.PSNR(source, decoded))
+    capture.release()
+    return round(float(np.mean(values)), 2) if values else None
+
+
+def children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench_profile(name, frames, fps, directory):
+    height, width = frames[0].shape[:2]
+    path = os.path.join(directory, f"{name}.mp4")
+    encoder = FFmpegPipeEncoder(path, width, height, fps=fps, drop_policy='block', profile=name)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    ffmpeg_cpu = children_cpu()
+    encoder.start()
+    for index, frame in enumerate(frames):
+        encoder.write(frame, index / fps)
+    written = encoder.close()
+    wall = time.perf_counter() - wall
+    result = {
+        "frames": written,
+        "fps": round(written / wall, 1),
+        "cpu_seconds": round(time.process_time() - cpu, 2),
+        "ffmpeg_cpu_seconds": round(children_cpu() - ffmpeg_cpu, 2) if resource else None,
+        "bytes": os.path.getsize(path),
+        "psnr_db": psnr(path, frames),
+    }
+    result["bytes_per_frame"] = result["bytes"] // max(1, written)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--input", help="reference screen recording (default: generated frames)")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    if args.input:
+        frames = list(input_frames(args.input, args.frames))
+    else:
+        frames = list(generated_frames(args.frames, args.width, args.height, args.fps))
+    if not frames:
+        parser.error("No frames to encode")
+
+    height, width = frames[0].shape[:2]
+    results = {"source": args.input or "generated", "frames": len(frames), "size": f"{width}x{height}"}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.profiles:
+            results[name] = bench_profile(name, frames, args.fps, directory)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""Recorder performance suite with a stored baseline.
+
+Runs CrossPlatformScreenRecorder, mss.ScreenRecorder, AudioRecorder and
+InteractionRecorder against the synthetic sources in synthetic_sources
+for each configured resolution, every scenario in a fresh process so peak
+RSS is its own. For each scenario it reports achieved fps, dropped
+frames, p50/p99 capture latency (tick to frame queued; the callback time
+for audio and the hook time for input), peak RSS, finalize time (stop
+until the outputs are on disk) and output size, as JSON.
+
+Results are compared with the baseline file; a metric worse than the
+baseline by more than `--tolerance` (plus a small absolute slack), or a
+scenario the baseline does not have, is a regression and the suite exits
+with status 1. A missing baseline is an
+error unless `--no-baseline` is given. Record a baseline on the reference
+machine with `--save-baseline`:
+
+    python -m benchmarks.bench_recorders --save-baseline
+    python -m benchmarks.bench_recorders --output results.json
+    python -m benchmarks.bench_recorders --no-baseline --output results.json
+"""
+import argparse
+import ctypes
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "recorder_baseline.json"
+RECORDERS = ('cross_platform', 'mss', 'audio', 'interaction')
+RESULT_PREFIX = "RESULT "
+
+# Compared metrics: (whether higher is better, absolute slack)
+METRICS = {
+    "fps": (True, 0.5),
+    "frames_dropped": (False, 2),
+    "capture_p50_ms": (False, 0.5),
+    "capture_p99_ms": (False, 2.0),
+    "peak_rss_mb": (False, 16),
+    "finalize_s": (False, 0.25),
+    "output_bytes": (False, 64 * 1024),
+    "events_per_s": (True, 1.0),
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, KiB elsewhere
+        return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                "PagefileUsage", "PeakPagefileUsage")]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                             ctypes.byref(counters), counters.cb)
+    return counters.PeakWorkingSetSize / (1024 * 1024)
+
+
+def output_bytes(*paths):
+    return sum(os.path.getsize(path) for path in paths if path and os.path.exists(path))
+
+
+def latency_ms(stats):
+    """p50/p99 of a TickStats of seconds, in milliseconds"""
+    return {
+        "capture_p50_ms": round(stats.percentile(0.5) * 1000, 3),
+        "capture_p99_ms": round(stats.percentile(0.99) * 1000, 3),
+    }
+
+
+def load_mss_recorder():
+    """Import this repo's mss.py under another name, leaving `mss` to python-mss"""
+    from recorder import _import_mss_package
+
+    try:
+        _import_mss_package()
+    except ImportError:
+        pass
+    spec = importlib.util.spec_from_file_location("mss_recorder", ROOT / "mss.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_cross_platform(config, directory):
+    from recorder import CrossPlatformScreenRecorder
+    from benchmarks.synthetic_sources import SyntheticAudioSource, SyntheticInputHooks
+
+    recorder = CrossPlatformScreenRecorder(None, backend='synthetic', backend_options={
+        "width": config["width"], "height": config["height"], "pattern": config["pattern"]})
+    recorder.fps = config["fps"]
+    recorder.segment_seconds = config["segment_seconds"] or None
+    recorder.output_dir = Path(directory)
+    recorder.audio_recorder.input_stream = SyntheticAudioSource().open
+    hooks = SyntheticInputHooks(config["event_rate"], config["width"], config["height"])
+    recorder.interaction_recorder.input_hooks = hooks
+    recorder.interaction_recorder.element_resolver = None
+
+    recorder.start_recording()
+    if not recorder.recording:
+        raise RuntimeError("CrossPlatformScreenRecorder did not start")
+    time.sleep(config["duration"])
+    start = time.perf_counter()
+    video_path, interactions_path = recorder.stop_recording()
+    finalize = time.perf_counter() - start
+    if video_path is None:
+        raise RuntimeError("CrossPlatformScreenRecorder produced no output")
+
+    seconds = recorder.end_time - recorder.start_time
+    return {
+        "frames": recorder.frame_count,
+        "fps": round(recorder.frame_count / seconds, 2),
+        "frames_dropped": recorder.capture_stats.dropped + recorder.encoder.frames_dropped,
+        **latency_ms(recorder.capture_latency),
+        "finalize_s": round(finalize, 3),
+        "output_bytes": output_bytes(video_path, interactions_path,
+                                     recorder.session_paths["proxy"]),
+        "events": hooks.emitted,
+    }
+
+
+def run_mss(config, directory):
+    from benchmarks.synthetic_sources import SyntheticAudioSource, SyntheticGrabber
+
+    module = load_mss_recorder()
+    recorder = module.ScreenRecorder(sct=SyntheticGrabber(config["width"], config["height"],
+                                                          config["pattern"]))
+    recorder.fps = config["fps"]
+    recorder.frame_time = 1 / config["fps"]
+    recorder.input_stream = SyntheticAudioSource().open
+
+    recorder.start_recording()
+    started = time.perf_counter()
+    time.sleep(config["duration"])
+    start = time.perf_counter()
+    video_path, _ = recorder.stop_recording()
+    finalize = time.perf_counter() - start
+    if video_path is None:
+        raise RuntimeError("mss.ScreenRecorder produced no output")
+
+    return {
+        "frames": recorder.frame_count,
+        "fps": round(recorder.frame_count / (start - started), 2),
+        "frames_dropped": recorder.capture_stats.dropped,
+        **latency_ms(recorder.capture_latency),
+        "finalize_s": round(finalize, 3),
+        "output_bytes": output_bytes(video_path),
+    }
+
+
+def run_audio(config, directory):
+    from recorder import AudioRecorder
+    from benchmarks.synthetic_sources import SyntheticAudioSource, percentile
+
+    source = SyntheticAudioSource()
+    recorder = AudioRecorder()
+    recorder.input_stream = source.open
+    recorder.output_path = os.path.join(directory, "audio.wav")
+
+    recorder.start_recording()
+    time.sleep(config["duration"])
+    start = time.perf_counter()
+    recorder.stop_recording()
+    finalize = time.perf_counter() - start
+
+    callbacks = source.callback_seconds
+    return {
+        "blocks": len(callbacks),
+        "frames_dropped": recorder.buffer.dropped_frames,
+        "capture_p50_ms": round(percentile(callbacks, 0.5) * 1000, 3),
+        "capture_p99_ms": round(percentile(callbacks, 0.99) * 1000, 3),
+        "finalize_s": round(finalize, 3),
+        "output_bytes": output_bytes(recorder.output_path),
+    }
+
+
+def run_interaction(config, directory):
+    from recorder import InteractionRecorder
+    from benchmarks.synthetic_sources import SyntheticInputHooks
+
+    hooks = SyntheticInputHooks(config["event_rate"], config["width"], config["height"])
+    recorder = InteractionRecorder()
+    recorder.input_hooks = hooks
+    recorder.element_resolver = None
+    path = os.path.join(directory, "interactions.json")
+
+    recorder.start_recording()
+    started = time.perf_counter()
+    time.sleep(config["duration"])
+    start = time.perf_counter()
+    recorder.stop_recording()
+    recorder.save_interactions(path)
+    finalize = time.perf_counter() - start
+
+    latency = recorder.hook_latency()
+    return {
+        "events": hooks.emitted,
+        "events_per_s": round(hooks.emitted / (start - started), 2),
+        "capture_p50_ms": round(latency.get("p50_us", 0.0) / 1000, 4),
+        "capture_p99_ms": round(latency.get("p99_us", 0.0) / 1000, 4),
+        "finalize_s": round(finalize, 3),
+        "output_bytes": output_bytes(path),
+    }
+
+
+RUNNERS = {
+    'cross_platform': run_cross_platform,
+    'mss': run_mss,
+    'audio': run_audio,
+    'interaction': run_interaction,
+}
+
+
+def run_in_process(config):
+    """Run one scenario here; recorders write relative paths, so work in a temp dir"""
+    sys.path.insert(0, str(ROOT))
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            result = RUNNERS[config["recorder"]](config, directory)
+        finally:
+            os.chdir(ROOT)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def run_scenario(config):
+    """Run one scenario in a fresh interpreter and return its metrics"""
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_recorders', '--scenario', json.dumps(config)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    output = "\n".join(completed.stdout.splitlines()[-20:])
+    raise RuntimeError(f"Scenario {config['name']} failed:\n{output}\n{completed.stderr}")
+
+
+def scenarios(args):
+    """Scenario configs: video recorders at every resolution, the others once"""
+    configs = []
+    for recorder in args.recorders:
+        resolutions = args.resolutions if recorder in ('cross_platform', 'mss') else args.resolutions[:1]
+        for resolution in resolutions:
+            width, height = (int(part) for part in resolution.split('x'))
+            name = f"{recorder}_{resolution}" if recorder in ('cross_platform', 'mss') else recorder
+            configs.append({
+                "name": name,
+                "recorder": recorder,
+                "width": width,
+                "height": height,
+                "duration": args.duration,
+                "fps": args.fps,
+                "event_rate": args.event_rate,
+                "pattern": args.pattern,
+                "segment_seconds": args.segment_seconds,
+            })
+    return configs
+
+
+def compare(results, baseline, tolerance):
+    """Return regression messages for metrics worse than the baseline.
+
+    Scenarios and metrics the baseline does not have count as regressions
+    too, so a new or renamed one cannot pass unchecked.
+    """
+    regressions = []
+    for name, metrics in results["scenarios"].items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            regressions.append(f"{name}: missing from the baseline; re-record it with --save-baseline")
+            continue
+        for metric, (higher_is_better, slack) in METRICS.items():
+            if metric not in metrics:
+                continue
+            if metric not in reference:
+                regressions.append(f"{name}.{metric}: missing from the baseline")
+                continue
+            value, base = metrics[metric], reference[metric]
+            if higher_is_better:
+                worse = value < base * (1 - tolerance) - slack
+            else:
+                worse = value > base * (1 + tolerance) + slack
+            if worse:
+                regressions.append(f"{name}.{metric}: {value} vs baseline {base}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recorders", nargs="+", default=list(RECORDERS), choices=RECORDERS)
+    parser.add_argument("--resolutions", nargs="+", default=["1280x720", "1920x1080"])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--event-rate", type=float, default=50, help="input events per second")
+    parser.add_argument("--pattern", default="moving_box", help="synthetic frame pattern")
+    parser.add_argument("--segment-seconds", type=float, default=10,
+                        help="CrossPlatformScreenRecorder session segments (0: one file)")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the baseline instead of comparing")
+    parser.add_argument("--no-baseline", action="store_true",
+                        help="only report the results, without comparing them")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative change before a metric counts as a regression")
+    parser.add_argument("--output", help="also write the results JSON here")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        result = run_in_process(json.loads(args.scenario))
+        print(RESULT_PREFIX + json.dumps(result))
+        return 0
+
+    if args.save_baseline and args.no_baseline:
+        parser.error("--save-baseline and --no-baseline are exclusive")
+    compare_baseline = not (args.save_baseline or args.no_baseline)
+    if compare_baseline and not os.path.exists(args.baseline):
+        parser.error(f"No baseline at {args.baseline}; run with --save-baseline to create "
+                     f"one or --no-baseline to skip the comparison")
+
+    configs = scenarios(args)
+    results = {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "config": {key: value for key, value in vars(args).items()
+                   if key in ("duration", "fps", "event_rate", "pattern", "segment_seconds")},
+        "scenarios": {},
+    }
+    failed = []
+    for config in configs:
+        try:
+            results["scenarios"][config["name"]] = run_scenario(config)
+        except Exception as e:
+            print(f"Error running {config['name']}: {e}", file=sys.stderr)
+            failed.append(config["name"])
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(output)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 1 if failed else 0
+
+    regressions = []
+    if compare_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            print(f"Warning: baseline was recorded with {baseline.get('config')}", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+
+    for message in regressions:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    if failed:
+        print(f"FAILED {', '.join(failed)}", file=sys.stderr)
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
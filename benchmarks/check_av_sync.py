@@ -0,0 +1,89 @@
+"""Checks A/V sync against a 120 ppm audio device; exits non-zero on failure.
+
+    python -m benchmarks.check_av_sync
+
+The synthetic audio device runs 120 ppm fast for a few seconds in real
+time, the simulated one from bench_av_sync for an hour of session time.
+Frames from the synthetic capture backend are then encoded on the audio
+clock the real-time run measured, and the written timestamps are checked.
+Needs ffmpeg on PATH.
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_av_sync import SimulatedClock, bench_encode, measure_offsets, simulate_audio
+from benchmarks.synthetic_sources import SyntheticAudioSource
+from recording_clock import AudioClockSync, RecordingClock
+
+DRIFT_PPM = 120
+RATE = 44100
+FPS = 30
+
+
+def synthetic_device_sync(seconds=4.0):
+    """AudioClockSync fed by the synthetic device, as AudioRecorder feeds it"""
+    clock = RecordingClock()
+    clock.start()
+    sync = AudioClockSync(RATE, clock)
+
+    def callback(indata, frames, time_info, status):
+        sync.observe(frames, time_info.inputBufferAdcTime, time_info.currentTime)
+        if sync.pad_start is None and sync.samples >= RATE:
+            sync.leading_frames()
+
+    stream = SyntheticAudioSource(DRIFT_PPM).open(channels=2, samplerate=RATE,
+                                                  blocksize=RATE // FPS, callback=callback)
+    with stream:
+        time.sleep(seconds)
+    return sync
+
+
+def check_synthetic_device(sync):
+    drift = sync.summary()["drift_ppm"]
+    assert abs(drift - DRIFT_PPM) < 10, f"estimated {drift:.1f} ppm, expected {DRIFT_PPM}"
+
+
+def check_simulated_hour():
+    seconds = 3600
+    sync = AudioClockSync(RATE, SimulatedClock())
+    times = np.arange(0.0, seconds, 1 / FPS)
+    true_rate, mapped = simulate_audio(sync, seconds, DRIFT_PPM, times)
+    drift = sync.summary()["drift_ppm"]
+    assert abs(drift - DRIFT_PPM) < 2, f"estimated {drift:.2f} ppm, expected {DRIFT_PPM}"
+    offsets = measure_offsets(sync, true_rate, times, mapped)
+    # Uncorrected, 120 ppm is 432 ms apart after an hour
+    assert offsets["corrected_max_ms"] < 5, offsets
+    assert offsets["corrected_max_ms"] < offsets["uncorrected_max_ms"] / 20, offsets
+
+
+def check_written_pts(sync):
+    with tempfile.TemporaryDirectory() as directory:
+        result = bench_encode(sync, 150, FPS, directory)
+    # Every captured frame plus the one closing the last frame's duration
+    assert result["packets_read"] == result["frames_written"] == result["frames_captured"] + 1, result
+    assert result["pts_max_error_ms"] < 1, result
+
+
+def main():
+    failed = 0
+    sync = synthetic_device_sync()
+    checks = [
+        (check_synthetic_device, (sync,)),
+        (check_simulated_hour, ()),
+        (check_written_pts, (sync,)),
+    ]
+    for check, args in checks:
+        try:
+            check(*args)
+            print(f"ok {check.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAILED {check.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
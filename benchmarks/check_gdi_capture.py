@@ -0,0 +1,71 @@
+"""Checks the GdiCaptureSession lifecycle against FakeGdiOps; exits non-zero on failure.
+
+    python -m benchmarks.check_gdi_capture
+"""
+from benchmarks.bench_gdi_capture import FakeGdiOps
+from gdi_capture import GdiCaptureSession
+
+
+def check_reuse():
+    ops = FakeGdiOps()
+    with GdiCaptureSession(64, 32, ops=ops) as session:
+        for _ in range(5):
+            frame = session.grab()
+        assert frame.shape == (32, 64, 4), frame.shape
+        assert ops.opened == 1 and ops.blits == 5, (ops.opened, ops.blits)
+    assert ops.closed == 1, ops.closed
+
+
+def check_stale_dc_rebuilt():
+    ops = FakeGdiOps()
+    session = GdiCaptureSession(64, 32, ops=ops)
+    session.grab()
+    ops.fail_next_blit = True
+    frame = session.grab()
+    assert frame is not None and frame.shape == (32, 64, 4)
+    assert session.reopen_count == 1, session.reopen_count
+    # The stale resources were released before the new ones were opened
+    assert (ops.opened, ops.closed) == (2, 1), (ops.opened, ops.closed)
+    session.close()
+    assert ops.closed == 2 and not ops._buffers
+
+
+def check_close():
+    ops = FakeGdiOps()
+    session = GdiCaptureSession(64, 32, ops=ops)
+    session.close()
+    assert ops.closed == 0, "closing an unopened session released resources"
+    session.grab()
+    session.close()
+    session.close()
+    assert ops.closed == 1, ops.closed
+    assert not session.is_open and session.frame is None
+    # A closed session reopens on the next grab
+    session.grab()
+    assert ops.opened == 2
+    session.close()
+
+
+def check_resize():
+    ops = FakeGdiOps()
+    session = GdiCaptureSession(64, 32, ops=ops)
+    session.grab()
+    session.resize(64, 32, left=10, top=10)
+    assert session.is_open, "moving the region must not reallocate"
+    session.resize(32, 16)
+    assert not session.is_open and ops.closed == 1
+    assert session.grab().shape == (16, 32, 4)
+    session.close()
+
+
+CHECKS = [check_reuse, check_stale_dc_rebuilt, check_close, check_resize]
+
+
+def main():
+    for check in CHECKS:
+        check()
+        print(f"ok {check.__name__}")
+
+
+if __name__ == "__main__":
+    main()
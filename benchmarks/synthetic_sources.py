@@ -0,0 +1,190 @@
+"""Synthetic audio, input and screen sources for driving the real recorders.
+
+Each stands in for one OS-facing dependency through the recorders' own
+extension points, so everything behind it (buffers, clocks, encoders,
+logs) runs unchanged:
+
+- SyntheticAudioSource.open replaces `sd.InputStream` (AudioRecorder and
+  mss.ScreenRecorder `input_stream`)
+- SyntheticInputHooks replaces SystemInputHooks (InteractionRecorder
+  `input_hooks`)
+- SyntheticGrabber replaces the mss instance of mss.ScreenRecorder (`sct`)
+
+Frames for CrossPlatformScreenRecorder come from the 'synthetic' capture
+backend.
+"""
+import math
+import random
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# The fields of PortAudio's time info that the recorders read
+StreamTime = namedtuple('StreamTime', 'inputBufferAdcTime currentTime outputBufferDacTime')
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SyntheticInputStream:
+    """sd.InputStream stand-in that delivers a tone in real time.
+
+    Blocks are delivered on a thread once they would have been complete,
+    with ADC and current times on a stream clock offset from perf_counter.
+    The device clock runs `drift_ppm` fast (or slow when negative). The
+    time spent in the callback is kept in `callback_seconds`.
+    """
+    def __init__(self, channels, samplerate, blocksize, callback, drift_ppm=0.0,
+                 frequency=440.0, **kwargs):
+        self.channels = channels
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.rate = samplerate * (1 + drift_ppm / 1e6)
+        self.frequency = frequency
+        self.stream_offset = 1000.0
+        self.blocks = 0
+        self.callback_seconds = array('d')
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop_event.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        start = time.perf_counter()
+        phase = 2 * math.pi * self.frequency / self.samplerate
+        samples = 0
+        while True:
+            ready = start + (samples + self.blocksize) / self.rate
+            if self._stop_event.wait(max(0.0, ready - time.perf_counter())):
+                break
+            positions = np.arange(samples, samples + self.blocksize)
+            tone = (0.1 * np.sin(positions * phase)).astype(np.float32)
+            indata = np.repeat(tone[:, None], self.channels, axis=1)
+            now = time.perf_counter()
+            time_info = StreamTime(start + samples / self.rate + self.stream_offset,
+                                   now + self.stream_offset, 0.0)
+            self.callback(indata, self.blocksize, time_info, None)
+            self.callback_seconds.append(time.perf_counter() - now)
+            samples += self.blocksize
+            self.blocks += 1
+
+
+class SyntheticAudioSource:
+    """Factory for SyntheticInputStream that keeps the streams it opened"""
+    def __init__(self, drift_ppm=0.0):
+        self.drift_ppm = drift_ppm
+        self.streams = []
+
+    def open(self, **kwargs):
+        kwargs.setdefault('drift_ppm', self.drift_ppm)
+        stream = SyntheticInputStream(**kwargs)
+        self.streams.append(stream)
+        return stream
+
+    @property
+    def callback_seconds(self):
+        return [value for stream in self.streams for value in stream.callback_seconds]
+
+
+class SyntheticInputHooks:
+    """Generates mouse and keyboard events at `rate` events per second.
+
+    Mostly pointer moves along straight glides, with clicks, key presses
+    and wheel steps mixed in, delivered as the mouse and keyboard
+    packages' event objects on a thread of their own, like OS hooks.
+    """
+    def __init__(self, rate=50, width=1920, height=1080, seed=0):
+        self.rate = rate
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.emitted = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def position(self):
+        return self.width // 2, self.height // 2
+
+    def install(self, callback):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def remove(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def events(self):
+        """Endless stream of mouse and keyboard events"""
+        import keyboard
+        import mouse
+
+        rng = random.Random(self.seed)
+        x, y = self.position()
+        while True:
+            target_x, target_y = rng.randrange(self.width), rng.randrange(self.height)
+            steps = rng.randint(10, 40)
+            for step in range(1, steps + 1):
+                yield mouse.MoveEvent(x + (target_x - x) * step // steps,
+                                      y + (target_y - y) * step // steps, time.time())
+            x, y = target_x, target_y
+            choice = rng.random()
+            if choice < 0.5:
+                for event_type in (mouse.DOWN, mouse.UP):
+                    yield mouse.ButtonEvent(event_type, mouse.LEFT, time.time())
+            elif choice < 0.9:
+                for _ in range(rng.randint(2, 10)):
+                    name = rng.choice("abcdefghijklmnopqrstuvwxyz")
+                    for event_type in (keyboard.KEY_DOWN, keyboard.KEY_UP):
+                        yield keyboard.KeyboardEvent(event_type, 0, name=name, time=time.time())
+            else:
+                for _ in range(rng.randint(2, 6)):
+                    yield mouse.WheelEvent(rng.choice((-1.0, 1.0)), time.time())
+
+    def _run(self, callback):
+        interval = 1 / self.rate
+        deadline = time.perf_counter()
+        for event in self.events():
+            deadline += interval
+            if self._stop_event.wait(max(0.0, deadline - time.perf_counter())):
+                break
+            callback(event)
+            self.emitted += 1
+
+
+class SyntheticGrabber:
+    """mss stand-in that grabs BGRA frames from the synthetic capture backend"""
+    def __init__(self, width=1920, height=1080, pattern='moving_box'):
+        from recorder import create_screen_recorder
+
+        self.source = create_screen_recorder('synthetic', width=width, height=height,
+                                             pattern=pattern)
+        monitor = {"left": 0, "top": 0, "width": self.source.width, "height": self.source.height}
+        self.monitors = [monitor, dict(monitor)]
+        self._frame = None
+
+    def grab(self, monitor):
+        frame = self.source.capture_raw()
+        self._frame = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=self._frame)
+        return self._frame[monitor["top"]:monitor["top"] + monitor["height"],
+                           monitor["left"]:monitor["left"] + monitor["width"]]
@@ -0,0 +1,317 @@
+"""Capture targets: which part of the desktop a recording covers.
+
+A target resolves to a Region in desktop coordinates (the virtual desktop
+spanning every monitor, as used by the OS input hooks). CaptureArea keeps
+the frame size fixed for the encoder, follows tracked windows and maps
+desktop coordinates into frame coordinates for the interaction log.
+"""
+import platform
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+Region = namedtuple('Region', 'left top width height')
+
+
+class TargetOps:
+    """Platform calls used to resolve capture targets"""
+    def monitors(self):
+        """Monitor regions; index 0 is the whole virtual desktop, as in mss"""
+        raise NotImplementedError
+
+    def find_window(self, title):
+        """Handle of the first visible window whose title contains `title`"""
+        raise NotImplementedError("Window targets are not supported on this platform")
+
+    def window_region(self, handle):
+        """Current window rectangle, or None while it cannot be captured"""
+        raise NotImplementedError("Window targets are not supported on this platform")
+
+
+class Win32TargetOps(TargetOps):
+    SM_XVIRTUALSCREEN = 76
+    SM_YVIRTUALSCREEN = 77
+    SM_CXVIRTUALSCREEN = 78
+    SM_CYVIRTUALSCREEN = 79
+
+    def __init__(self):
+        import win32api
+        import win32gui
+
+        self.win32api = win32api
+        self.win32gui = win32gui
+
+    def monitors(self):
+        metrics = self.win32api.GetSystemMetrics
+        desktop = Region(metrics(self.SM_XVIRTUALSCREEN), metrics(self.SM_YVIRTUALSCREEN),
+                         metrics(self.SM_CXVIRTUALSCREEN), metrics(self.SM_CYVIRTUALSCREEN))
+        monitors = [Region(left, top, right - left, bottom - top)
+                    for _, _, (left, top, right, bottom) in self.win32api.EnumDisplayMonitors()]
+        return [desktop] + monitors
+
+    def find_window(self, title):
+        title = title.lower()
+        matches = []
+
+        def visit(handle, _):
+            if self.win32gui.IsWindowVisible(handle) and title in self.win32gui.GetWindowText(handle).lower():
+                matches.append(handle)
+            return True
+
+        self.win32gui.EnumWindows(visit, None)
+        return matches[0] if matches else None
+
+    def window_region(self, handle):
+        if not self.win32gui.IsWindow(handle) or self.win32gui.IsIconic(handle):
+            return None
+        left, top, right, bottom = self.win32gui.GetWindowRect(handle)
+        return Region(left, top, right - left, bottom - top)
+
+
+class MssTargetOps(TargetOps):
+    """Monitor layout from python-mss; no window lookup"""
+    def __init__(self, mss_module):
+        self.mss = mss_module
+
+    def monitors(self):
+        with self.mss.mss() as sct:
+            return [Region(m["left"], m["top"], m["width"], m["height"]) for m in sct.monitors]
+
+
+class QuartzTargetOps(TargetOps):
+    """Display layout and window lookup through Quartz; no python-mss needed"""
+    MAX_DISPLAYS = 16
+
+    def __init__(self):
+        import Quartz
+
+        self.Quartz = Quartz
+
+    def monitors(self):
+        error, displays, count = self.Quartz.CGGetActiveDisplayList(self.MAX_DISPLAYS, None, None)
+        if error:
+            raise OSError(f"CGGetActiveDisplayList failed with error {error}")
+        # The main display first, as mss lists it
+        main = self.Quartz.CGMainDisplayID()
+        displays = sorted(displays[:count], key=lambda display: display != main)
+        monitors = []
+        for display in displays:
+            bounds = self.Quartz.CGDisplayBounds(display)
+            monitors.append(Region(int(bounds.origin.x), int(bounds.origin.y),
+                                   int(bounds.size.width), int(bounds.size.height)))
+        left = min(m.left for m in monitors)
+        top = min(m.top for m in monitors)
+        right = max(m.left + m.width for m in monitors)
+        bottom = max(m.top + m.height for m in monitors)
+        return [Region(left, top, right - left, bottom - top)] + monitors
+
+    def find_window(self, title):
+        title = title.lower()
+        windows = self.Quartz.CGWindowListCopyWindowInfo(
+            self.Quartz.kCGWindowListOptionOnScreenOnly | self.Quartz.kCGWindowListExcludeDesktopElements,
+            self.Quartz.kCGNullWindowID
+        )
+        for info in windows:
+            name = f"{info.get('kCGWindowOwnerName', '')} {info.get('kCGWindowName', '')}"
+            if title in name.lower():
+                return int(info['kCGWindowNumber'])
+        return None
+
+    def window_region(self, handle):
+        windows = self.Quartz.CGWindowListCopyWindowInfo(
+            self.Quartz.kCGWindowListOptionIncludingWindow, handle)
+        if not windows:
+            return None
+        bounds = windows[0]['kCGWindowBounds']
+        return Region(int(bounds['X']), int(bounds['Y']), int(bounds['Width']), int(bounds['Height']))
+
+
+class StaticTargetOps(TargetOps):
+    """Fixed layout for synthetic sources and benchmarks.
+
+    `windows` maps handles to (title, Region); entries can be replaced
+    while recording to simulate moves and resizes.
+    """
+    def __init__(self, monitors, windows=None):
+        self._monitors = list(monitors)
+        self.windows = dict(windows or {})
+
+    def monitors(self):
+        return self._monitors
+
+    def find_window(self, title):
+        for handle, (window_title, _) in self.windows.items():
+            if title.lower() in window_title.lower():
+                return handle
+        return None
+
+    def window_region(self, handle):
+        window = self.windows.get(handle)
+        return window[1] if window is not None else None
+
+
+def default_target_ops(mss_module=None):
+    """Return the TargetOps for this platform; `mss_module` is only used on Linux"""
+    system = platform.system()
+    if system == 'Windows':
+        return Win32TargetOps()
+    if system == 'Darwin':
+        return QuartzTargetOps()
+    return MssTargetOps(mss_module)
+
+
+class CaptureTarget:
+    """Part of the desktop to record"""
+    # Whether the region can change while recording
+    tracking = False
+
+    def region(self, ops):
+        raise NotImplementedError
+
+
+class MonitorTarget(CaptureTarget):
+    """One monitor by mss-style index (1 is the first, 0 all of them)"""
+    def __init__(self, index=1):
+        self.index = index
+
+    def region(self, ops):
+        monitors = ops.monitors()
+        if not 0 <= self.index < len(monitors):
+            raise ValueError(f"Monitor {self.index} not found; {len(monitors) - 1} available")
+        return monitors[self.index]
+
+
+class RectTarget(CaptureTarget):
+    """A fixed rectangle in desktop coordinates"""
+    def __init__(self, left, top, width, height):
+        self.rect = Region(left, top, width, height)
+
+    def region(self, ops):
+        return self.rect
+
+
+class WindowTarget(CaptureTarget):
+    """A window, by handle or by (case-insensitive) title substring.
+
+    The capture follows the window when it moves or is resized; while it
+    is minimized the last region keeps being captured.
+    """
+    tracking = True
+
+    def __init__(self, title=None, handle=None):
+        if title is None and handle is None:
+            raise ValueError("WindowTarget needs a title or a handle")
+        self.title = title
+        self.handle = handle
+
+    def region(self, ops):
+        if self.handle is None:
+            self.handle = ops.find_window(self.title)
+            if self.handle is None:
+                raise ValueError(f"No window titled '{self.title}'")
+        return ops.window_region(self.handle)
+
+
+def parse_capture_target(spec):
+    """Build a target from 'monitor:N', 'rect:LEFT,TOP,WIDTH,HEIGHT' or 'window:TITLE'"""
+    kind, _, value = spec.partition(':')
+    if kind == 'monitor':
+        return MonitorTarget(int(value or 1))
+    if kind == 'rect':
+        return RectTarget(*(int(part) for part in value.split(',')))
+    if kind == 'window':
+        return WindowTarget(title=value)
+    raise ValueError(f"Unknown capture target '{spec}'. Use monitor:N, rect:L,T,W,H or window:TITLE")
+
+
+class CaptureArea:
+    """A target's current region and its mapping into frame coordinates.
+
+    The frame size is the target's size when recording starts, rounded down
+    to even dimensions for the encoder. Tracked targets are re-resolved at
+    most every `poll_interval` seconds: a moved window is captured at its
+    new position, a larger one is scaled down to fit the frame and a
+    smaller one is padded. Regions are clipped to the desktop.
+    """
+    def __init__(self, target, ops, poll_interval=0.25):
+        self.target = target
+        self.ops = ops
+        self.poll_interval = poll_interval
+        self.desktop = ops.monitors()[0]
+        region = self._clip(target.region(ops))
+        if region is None or region.width < 2 or region.height < 2:
+            raise ValueError("Capture target is empty or off screen")
+        self.width = region.width - region.width % 2
+        self.height = region.height - region.height % 2
+        # Region to grab and its scale into the frame, swapped as one so
+        # other threads always see a consistent pair
+        self._placement = (Region(region.left, region.top, self.width, self.height), 1.0)
+        self._next_poll = 0.0
+        self._canvas = None
+
+    @property
+    def region(self):
+        return self._placement[0]
+
+    @property
+    def scale(self):
+        return self._placement[1]
+
+    def _clip(self, region):
+        if region is None:
+            return None
+        desktop = self.desktop
+        left = max(region.left, desktop.left)
+        top = max(region.top, desktop.top)
+        right = min(region.left + region.width, desktop.left + desktop.width)
+        bottom = min(region.top + region.height, desktop.top + desktop.height)
+        if right <= left or bottom <= top:
+            return None
+        return Region(left, top, right - left, bottom - top)
+
+    def update(self, now=None):
+        """Re-resolve a tracked target when due; returns the region to grab"""
+        if not self.target.tracking:
+            return self.region
+        now = time.perf_counter() if now is None else now
+        if now < self._next_poll:
+            return self.region
+        self._next_poll = now + self.poll_interval
+
+        try:
+            region = self._clip(self.target.region(self.ops))
+        except Exception as e:
+            print(f"Error tracking capture target: {e}")
+            region = None
+        if region is not None and region != self.region:
+            # Odd sizes are cropped by a pixel rather than rescaled
+            scale = min(1.0, self.width / (region.width - region.width % 2 or 1),
+                        self.height / (region.height - region.height % 2 or 1))
+            self._placement = (region, scale)
+        return self.region
+
+    def fit(self, frame):
+        """Place a grab of the current region into a frame of the capture size"""
+        height, width = frame.shape[:2]
+        if (width, height) == (self.width, self.height):
+            return frame
+
+        if self._canvas is None or self._canvas.shape[2] != frame.shape[2]:
+            self._canvas = np.zeros((self.height, self.width, frame.shape[2]), dtype=np.uint8)
+        canvas = self._canvas
+        canvas[:] = 0
+        scale = self.scale
+        if scale < 1.0:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        rows = min(self.height, frame.shape[0])
+        columns = min(self.width, frame.shape[1])
+        canvas[:rows, :columns] = frame[:rows, :columns]
+        return canvas
+
+    def to_capture(self, x, y):
+        """Map a desktop point to frame coordinates (may fall outside the frame)"""
+        region, scale = self._placement
+        return int(round((x - region.left) * scale)), int(round((y - region.top) * scale))
@@ -0,0 +1,111 @@
+import platform
+from collections import OrderedDict
+
+
+class ElementOps:
+    """Platform calls used by ElementResolver"""
+    def window_from_point(self, x, y):
+        raise NotImplementedError
+
+    def class_name(self, handle):
+        raise NotImplementedError
+
+    def window_text(self, handle):
+        raise NotImplementedError
+
+    def foreground_window(self):
+        raise NotImplementedError
+
+
+class Win32ElementOps(ElementOps):
+    """win32gui implementation; GetWindowText sends a message to the owning
+    process, which is what makes uncached lookups slow"""
+    def __init__(self):
+        import win32gui
+
+        self.win32gui = win32gui
+
+    def window_from_point(self, x, y):
+        return self.win32gui.WindowFromPoint((x, y))
+
+    def class_name(self, handle):
+        return self.win32gui.GetClassName(handle)
+
+    def window_text(self, handle):
+        return self.win32gui.GetWindowText(handle)
+
+    def foreground_window(self):
+        return self.win32gui.GetForegroundWindow()
+
+
+def default_element_ops():
+    """Return the ElementOps for this platform, or None if unsupported"""
+    if platform.system() == 'Windows':
+        return Win32ElementOps()
+    return None
+
+
+class ElementResolver:
+    """Resolves the UI element under a screen point with an LRU cache.
+
+    Entries are keyed by window handle. Class names never change for a
+    handle; window texts are dropped whenever the foreground window or its
+    title changes, which is checked once per batch instead of per click.
+    """
+    def __init__(self, ops, max_entries=256):
+        self.ops = ops
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._foreground = None
+
+    def _check_focus(self):
+        handle = self.ops.foreground_window()
+        foreground = (handle, self.ops.window_text(handle) if handle else "")
+        if foreground != self._foreground:
+            self._foreground = foreground
+            for element in self._cache.values():
+                element["text"] = None
+
+    def _element(self, handle):
+        element = self._cache.get(handle)
+        if element is None:
+            self.misses += 1
+            element = {"class": self.ops.class_name(handle), "text": None, "window_handle": handle}
+            self._cache[handle] = element
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(handle)
+        if element["text"] is None:
+            element["text"] = self.ops.window_text(handle)
+        return element
+
+    def resolve_batch(self, points):
+        """Resolve a list of (x, y) points; returns element dicts or None"""
+        try:
+            self._check_focus()
+        except Exception as e:
+            print(f"Error checking foreground window: {e}")
+
+        results = []
+        handles = {}
+        for point in points:
+            try:
+                # Several clicks on the same spot share one lookup
+                handle = handles.get(point)
+                if handle is None:
+                    handle = handles[point] = self.ops.window_from_point(*point)
+                results.append(dict(self._element(handle)) if handle else None)
+            except Exception as e:
+                print(f"Error resolving element: {e}")
+                results.append(None)
+        return results
+
+    def resolve(self, x, y):
+        return self.resolve_batch([(x, y)])[0]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache)}
@@ -0,0 +1,409 @@
+import os
+import platform
+import queue
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+
+from encoding_profiles import get_profile
+from frame_store import FrameStore
+from matroska_stream import MatroskaVideoStream
+
+# Capture pixel formats: channel count, OpenCV conversion to BGR, ffmpeg pix_fmt
+PIXEL_FORMATS = {
+    'bgr': (3, None, 'bgr24'),
+    'bgra': (4, cv2.COLOR_BGRA2BGR, 'bgra'),
+    'rgba': (4, cv2.COLOR_RGBA2BGR, 'rgba'),
+}
+
+
+def to_bgr(frame, pixel_format, dst=None):
+    """Convert a captured frame to BGR, writing into `dst` when given"""
+    code = PIXEL_FORMATS[pixel_format][1]
+    if code is None:
+        if dst is None:
+            return frame
+        np.copyto(dst, frame)
+        return dst
+    return cv2.cvtColor(frame, code, dst=dst)
+
+
+class StreamingVideoEncoder:
+    """Encodes frames on a background thread while the recording is running.
+
+    Frames are copied into a FrameStore of preallocated buffers in their
+    native capture format, bounded by `buffer_bytes`; colour conversion
+    happens on the encoder thread, off the capture critical path.
+    `drop_policy` decides what happens when the encoder falls behind; with
+    'spill' the backlog goes to a memory-mapped file at `spill_path`.
+
+    With `segment_seconds` the output is split into files of that length
+    and `path` must contain a `%05d` segment number, so a crash only loses
+    the segment being written.
+
+    `time_map` converts capture timestamps to media time, e.g. onto the
+    audio device's sample clock (see AudioClockSync.media_time), so video
+    follows the audio instead of the audio being resampled.
+
+    Callables in `taps` get every (frame, timestamp) on the encoder thread
+    before it is encoded, e.g. AnalysisProxy.offer; the frame is only valid
+    during the call.
+
+    `profile` names the encoding settings (see encoding_profiles); OpenCV
+    only takes its fourcc.
+    """
+    def __init__(self, path, width, height, fps=30, input_format='bgr',
+                 buffer_bytes=256 * 1024 * 1024, drop_policy='drop_newest',
+                 spill_path=None, segment_seconds=None, time_map=None, profile=None):
+        self.path = str(path)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.input_format = input_format
+        self.segment_seconds = segment_seconds
+        self.segment_frames = int(round(segment_seconds * fps)) if segment_seconds else None
+        self.segment_paths = []
+        self.time_map = time_map
+        self.profile = get_profile(profile)
+        self.taps = []
+        channels = PIXEL_FORMATS[input_format][0]
+        self.store = FrameStore((height, width, channels), budget_bytes=buffer_bytes,
+                                policy=drop_policy, spill_path=spill_path)
+        self.frames_written = 0
+        self._end_timestamp = None
+        self._next_slot = 0
+        self._held_slot = None
+        self._last_prepared = None
+        self._converted = None
+        self._writer = None
+        self._thread = None
+
+    def start(self):
+        """Open the output and start the encoder thread"""
+        self._open_output()
+        self._thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def frames_dropped(self):
+        return self.store.dropped
+
+    def write(self, frame, timestamp):
+        """Queue a frame captured `timestamp` seconds into the recording.
+
+        The frame is copied, so capture buffers can be reused immediately.
+        Dropped frames are covered by repeating the previous one in their
+        slot; only the 'block' policy ever makes the caller wait.
+        """
+        return self.store.put(frame, timestamp)
+
+    def close(self, end_timestamp=None):
+        """Flush queued frames and finalize the file.
+
+        When `end_timestamp` is given the last frame is held until then, for
+        producers that only submit frames when the screen changed.
+        """
+        if self._thread is None:
+            return self.frames_written
+
+        self._end_timestamp = end_timestamp
+        self.store.close()
+        self._thread.join()
+        self._thread = None
+        self._close_output()
+        if self.store.spilled:
+            print(f"Encoder spilled {self.store.spilled} frames to disk")
+        self.store.discard_spill()
+        return self.frames_written
+
+    def _open_output(self):
+        path = self.path % len(self.segment_paths) if self.segment_frames else self.path
+        self._writer = cv2.VideoWriter(
+            path,
+            cv2.VideoWriter_fourcc(*self.profile.fourcc),
+            self.fps,
+            (self.width, self.height)
+        )
+        if not self._writer.isOpened():
+            raise IOError(f"Could not open video writer for {path}")
+        self.segment_paths.append(path)
+
+    def _start_segment(self):
+        """Finish the current segment file and open the next one"""
+        self._close_output()
+        self._open_output()
+
+    def _prepare(self, frame):
+        """Convert a stored frame into what the output accepts"""
+        if PIXEL_FORMATS[self.input_format][1] is None:
+            return frame
+        if self._converted is None:
+            self._converted = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        return to_bgr(frame, self.input_format, dst=self._converted)
+
+    def _write_frame(self, frame):
+        self._writer.write(frame)
+
+    def _close_output(self):
+        self._writer.release()
+
+    def _media_time(self, timestamp):
+        return timestamp if self.time_map is None else self.time_map(timestamp)
+
+    def _encode_loop(self):
+        while True:
+            item = self.store.get()
+            if item is None:
+                try:
+                    if self._end_timestamp is not None and self._last_prepared is not None:
+                        self._finish()
+                except Exception as e:
+                    print(f"Error encoding frame: {e}")
+                self._release_held()
+                break
+            slot, timestamp = item
+            for tap in self.taps:
+                try:
+                    tap(self.store.frame(slot), timestamp)
+                except Exception as e:
+                    print(f"Error in encoder tap: {e}")
+            try:
+                self._write_timed(slot, timestamp)
+            except Exception as e:
+                print(f"Error encoding frame: {e}")
+
+    def _finish(self):
+        """Hold the last frame until the end timestamp"""
+        self._fill_until(int(round(self._media_time(self._end_timestamp) * self.fps)) + 1)
+
+    def _fill_until(self, target):
+        while self._next_slot < target:
+            if self.segment_frames and self._next_slot and not self._next_slot % self.segment_frames:
+                self._start_segment()
+            self._write_frame(self._last_prepared)
+            self._next_slot += 1
+            self.frames_written += 1
+
+    def _release_held(self):
+        if self._held_slot is not None:
+            self.store.release(self._held_slot)
+            self._held_slot = None
+        self._last_prepared = None
+
+    def _write_timed(self, slot, timestamp):
+        """Place the frame on the constant frame rate grid.
+
+        Slots the capture missed are filled with the previous frame so the
+        video stays in sync with the wall clock (and therefore the audio).
+        """
+        target = int(round(self._media_time(timestamp) * self.fps))
+        if target < self._next_slot:
+            # Another frame already landed in this slot
+            self.store.release(slot)
+            return
+
+        if self._last_prepared is not None:
+            self._fill_until(target)
+
+        # The first frame also back-fills any slots before it
+        self._last_prepared = self._prepare(self.store.frame(slot))
+        self._fill_until(target + 1)
+
+        # Keep this frame's buffer until a newer one replaces it
+        if self._held_slot is not None:
+            self.store.release(self._held_slot)
+        self._held_slot = slot
+
+
+class FFmpegPipeEncoder(StreamingVideoEncoder):
+    """Single-pass encoder that pipes raw frames and audio into one ffmpeg process.
+
+    Video goes to ffmpeg's stdin as a live Matroska stream of raw frames in
+    the capture's native pixel format, so no conversion happens in Python
+    and every frame keeps its exact capture time: the output has a variable
+    frame rate and nothing is duplicated to fill a grid. Audio is fed
+    through a second pipe (an inherited file descriptor on POSIX, a named
+    pipe on Windows) and starts at media time 0, like the video.
+    ffmpeg writes the final H.264/AAC file directly, so there is no
+    temporary video to re-read and remux when the recording stops.
+    Segments are written by ffmpeg's segment muxer as MPEG-TS, which stays
+    playable up to the last packet if the process is killed.
+    """
+    def __init__(self, path, width, height, fps=30, input_format='bgr',
+                 buffer_bytes=256 * 1024 * 1024, drop_policy='drop_newest',
+                 spill_path=None, segment_seconds=None, time_map=None, profile=None,
+                 audio_rate=None, audio_channels=2):
+        super().__init__(path, width, height, fps=fps, input_format=input_format,
+                         buffer_bytes=buffer_bytes, drop_policy=drop_policy,
+                         spill_path=spill_path, segment_seconds=segment_seconds,
+                         time_map=time_map, profile=profile)
+        self.audio_rate = audio_rate
+        self.audio_channels = audio_channels
+        self.audio_queue = queue.Queue()
+        self.process = None
+        self._stream = None
+        self._last_pts = None
+        self._audio_fd = None
+        self._audio_pipe = None
+        self._audio_thread = None
+
+    def write_audio(self, block):
+        """Queue a float32 block of shape (frames, channels) for muxing"""
+        if self._audio_thread is not None:
+            self.audio_queue.put(block.tobytes())
+
+    def build_command(self, audio_input=None):
+        command = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'matroska',
+            '-thread_queue_size', '512',
+            '-probesize', '32',
+            '-i', 'pipe:0',
+        ]
+        if audio_input is not None:
+            command += [
+                '-f', 'f32le',
+                '-ar', str(self.audio_rate),
+                '-ac', str(self.audio_channels),
+                '-thread_queue_size', '512',
+                # Raw inputs need no probing; without this ffmpeg waits for
+                # seconds of audio before it starts reading video
+                '-probesize', '32',
+                '-analyzeduration', '0',
+                '-i', audio_input,
+            ]
+        command += ['-map', '0:v:0'] + self.profile.ffmpeg_args(self.fps)
+        # Keep the capture timestamps instead of a fixed rate
+        command += ['-fps_mode', 'passthrough']
+        if audio_input is not None:
+            command += ['-map', '1:a:0', '-c:a', 'aac']
+        if self.segment_seconds:
+            # Keyframes on the segment grid so every segment can be cut there
+            command += [
+                '-force_key_frames', f"expr:gte(t,n_forced*{self.segment_seconds})",
+                '-f', 'segment',
+                '-segment_time', str(self.segment_seconds),
+                '-segment_format', 'mpegts',
+                '-reset_timestamps', '0',
+            ]
+        command.append(self.path)
+        return command
+
+    def _open_output(self):
+        popen_kwargs = {"stdin": subprocess.PIPE}
+        audio_input = None
+
+        if self.audio_rate:
+            if platform.system() == 'Windows':
+                audio_input = self._create_named_pipe()
+            else:
+                read_fd, self._audio_fd = os.pipe()
+                audio_input = f"pipe:{read_fd}"
+                popen_kwargs["pass_fds"] = (read_fd,)
+
+        try:
+            self.process = subprocess.Popen(self.build_command(audio_input), **popen_kwargs)
+        finally:
+            if "pass_fds" in popen_kwargs:
+                os.close(popen_kwargs["pass_fds"][0])
+
+        if audio_input is not None:
+            self._audio_thread = threading.Thread(target=self._audio_loop, daemon=True)
+            self._audio_thread.start()
+
+        self._stream = MatroskaVideoStream(self.process.stdin.write, self.width, self.height,
+                                           self.input_format)
+        self._stream.write_header()
+        self._last_pts = None
+
+    def _create_named_pipe(self):
+        import win32pipe
+
+        name = rf"\\.\pipe\crewbuilder_audio_{os.getpid()}_{id(self)}"
+        self._audio_pipe = win32pipe.CreateNamedPipe(
+            name,
+            win32pipe.PIPE_ACCESS_OUTBOUND,
+            win32pipe.PIPE_TYPE_BYTE | win32pipe.PIPE_WAIT,
+            1, 1 << 20, 1 << 20, 0, None
+        )
+        return name
+
+    def _audio_loop(self):
+        """Forward queued audio to ffmpeg until the end-of-stream marker"""
+        try:
+            if self._audio_pipe is not None:
+                import win32file
+                import win32pipe
+
+                win32pipe.ConnectNamedPipe(self._audio_pipe, None)
+                write = lambda data: win32file.WriteFile(self._audio_pipe, data)
+            else:
+                write = lambda data: os.write(self._audio_fd, data)
+
+            while True:
+                data = self.audio_queue.get()
+                if data is None:
+                    break
+                view = memoryview(data)
+                while view:
+                    written = write(view)
+                    if isinstance(written, tuple):
+                        written = written[1]
+                    view = view[written:]
+        except Exception as e:
+            print(f"Error writing audio to ffmpeg: {e}")
+        finally:
+            self._close_audio_pipe()
+
+    def _close_audio_pipe(self):
+        if self._audio_fd is not None:
+            os.close(self._audio_fd)
+            self._audio_fd = None
+        if self._audio_pipe is not None:
+            import win32file
+
+            win32file.CloseHandle(self._audio_pipe)
+            self._audio_pipe = None
+
+    def _write_frame(self, frame, pts):
+        self._stream.write_frame(frame, pts)
+        self._last_pts = pts
+        self.frames_written += 1
+
+    def _write_timed(self, slot, timestamp):
+        """Write the frame once, at its own capture time"""
+        pts = self._stream.timestamp(self._media_time(timestamp))
+        if self._last_pts is None:
+            # The first frame starts the stream at 0, where the audio starts
+            pts = 0
+        elif pts <= self._last_pts:
+            self.store.release(slot)
+            return
+
+        self._last_prepared = self.store.frame(slot)
+        self._write_frame(self._last_prepared, pts)
+        # Keep this frame's buffer in case it has to be held at the end
+        if self._held_slot is not None:
+            self.store.release(self._held_slot)
+        self._held_slot = slot
+
+    def _finish(self):
+        # One more copy of the last frame marks where the recording ended
+        pts = self._stream.timestamp(self._media_time(self._end_timestamp))
+        if pts > self._last_pts:
+            self._write_frame(self._last_prepared, pts)
+
+    def _close_output(self):
+        # Video first: ffmpeg may hold back audio until it sees the end of
+        # the video stream
+        self.process.stdin.close()
+        if self._audio_thread is not None:
+            self.audio_queue.put(None)
+            self._audio_thread.join()
+            self._audio_thread = None
+
+        returncode = self.process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, 'ffmpeg')
@@ -0,0 +1,72 @@
+"""Named encoder settings, chosen per recording by what the file is for.
+
+ffmpeg arguments apply to FFmpegPipeEncoder; the OpenCV fallback can only
+pick a fourcc. Settings are tuned for screen content: large flat areas
+and sharp text that must stay legible. Compare them on real recordings
+with benchmarks/bench_profiles.py.
+"""
+
+
+class EncodingProfile:
+    """Encoder settings for one use of a recording.
+
+    `codec_args` are the ffmpeg video codec options. `keyframe_seconds`
+    caps the distance between keyframes, which is what makes seeking
+    cheap; None leaves it to the codec.
+    """
+    def __init__(self, name, codec_args, fourcc='mp4v', keyframe_seconds=None, description=''):
+        self.name = name
+        self.codec_args = list(codec_args)
+        self.fourcc = fourcc
+        self.keyframe_seconds = keyframe_seconds
+        self.description = description
+
+    def ffmpeg_args(self, fps):
+        """Video codec options for ffmpeg at `fps` frames per second"""
+        args = list(self.codec_args)
+        if self.keyframe_seconds:
+            args += ['-g', str(max(1, int(round(self.keyframe_seconds * fps))))]
+        return args
+
+    def __repr__(self):
+        return f"EncodingProfile({self.name!r})"
+
+
+PROFILES = {
+    'archival': EncodingProfile(
+        'archival',
+        ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-tune', 'stillimage',
+         '-pix_fmt', 'yuv420p'],
+        description="Kept recording: near-transparent text at real-time speed"
+    ),
+    'analysis': EncodingProfile(
+        'analysis',
+        ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-tune', 'stillimage',
+         '-pix_fmt', 'yuv420p'],
+        keyframe_seconds=2,
+        description="Input for models and keyframe extraction: small, fast to seek"
+    ),
+    'low_cpu_live': EncodingProfile(
+        'low_cpu_live',
+        ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-crf', '26',
+         '-pix_fmt', 'yuv420p'],
+        description="Busy or slow machines: least encoder CPU, larger files"
+    ),
+    'lossless': EncodingProfile(
+        'lossless',
+        ['-c:v', 'libx264rgb', '-preset', 'ultrafast', '-qp', '0'],
+        description="Exact pixels, e.g. reference material for benchmarks"
+    ),
+}
+
+DEFAULT_PROFILE = 'archival'
+
+
+def get_profile(profile=None):
+    """Return an EncodingProfile from a name, a profile or None for the default"""
+    if isinstance(profile, EncodingProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encoding profile '{name}'. Use one of: {', '.join(PROFILES)}")
+    return PROFILES[name]
@@ -0,0 +1,216 @@
+import bisect
+import threading
+
+import numpy as np
+
+from encoders import to_bgr
+
+
+def _pad_to_tiles(frame, tile_size):
+    """Pad a frame with zeros so both dimensions are multiples of tile_size"""
+    height, width = frame.shape[:2]
+    pad_h = -height % tile_size
+    pad_w = -width % tile_size
+    if pad_h or pad_w:
+        pad = ((0, pad_h), (0, pad_w)) + ((0, 0),) * (frame.ndim - 2)
+        frame = np.pad(frame, pad)
+    return np.ascontiguousarray(frame)
+
+
+def _tile_view(padded, tile_size):
+    """View a padded (H, W, C) frame as (rows, cols, tile, tile, C) without copying"""
+    height, width, channels = padded.shape
+    rows, cols = height // tile_size, width // tile_size
+    return padded.reshape(rows, tile_size, cols, tile_size, channels).swapaxes(1, 2)
+
+
+class TileHasher:
+    """Computes one 64-bit hash per screen tile in a single vectorized pass"""
+    def __init__(self, tile_size=32, seed=0x5EED):
+        if tile_size % 8:
+            raise ValueError("tile_size must be a multiple of 8")
+        self.tile_size = tile_size
+        self._seed = seed
+        self._weights = {}
+
+    def _get_weights(self, words_per_row):
+        weights = self._weights.get(words_per_row)
+        if weights is None:
+            rng = np.random.default_rng(self._seed)
+            weights = rng.integers(0, 2**63, size=(self.tile_size, 1, words_per_row),
+                                   dtype=np.uint64) | np.uint64(1)
+            self._weights[words_per_row] = weights
+        return weights
+
+    def hash_tiles(self, padded):
+        """Return a (rows, cols) uint64 array of tile hashes for a padded frame"""
+        height, width, channels = padded.shape
+        rows, cols = height // self.tile_size, width // self.tile_size
+        words_per_row = self.tile_size * channels // 8
+
+        # Each tile row is a run of uint64 words; weight them by position and
+        # sum so that any changed byte changes the hash (mod 2**64)
+        words = padded.reshape(height, width * channels).view(np.uint64)
+        words = words.reshape(rows, self.tile_size, cols, words_per_row)
+        weighted = words * self._get_weights(words_per_row)
+        return weighted.sum(axis=(1, 3), dtype=np.uint64)
+
+
+class ChangeDetector:
+    """Reports which tiles changed since the previous frame"""
+    def __init__(self, tile_size=32):
+        self.tile_size = tile_size
+        self.hasher = TileHasher(tile_size)
+        self._last_hashes = None
+
+    def dirty_tiles(self, padded):
+        """Return a (rows, cols) bool mask of changed tiles for a padded frame.
+
+        The first frame reports every tile as changed.
+        """
+        hashes = self.hasher.hash_tiles(padded)
+        if self._last_hashes is None or self._last_hashes.shape != hashes.shape:
+            dirty = np.ones(hashes.shape, dtype=bool)
+        else:
+            dirty = hashes != self._last_hashes
+        self._last_hashes = hashes
+        return dirty
+
+    def changed_tiles(self, frame):
+        """Return the number of tiles that changed in an unpadded frame"""
+        padded = _pad_to_tiles(frame, self.tile_size)
+        return int(np.count_nonzero(self.dirty_tiles(padded)))
+
+
+class DeltaFrameStore:
+    """Keeps recent frames as keyframes plus changed tiles, within a memory budget.
+
+    Each added frame is compared with the previous one by tile hash and only
+    the dirty tiles are kept, so memory grows with on-screen activity rather
+    than recording length; unchanged frames are not stored at all. A
+    keyframe starts a new group every `keyframe_interval` stored frames,
+    when `keyframe_ratio` of the tiles changed, or once the group's tiles
+    take more memory than a keyframe. When `budget_bytes` is used up the
+    oldest groups are dropped. reconstruct() and frame_at() rebuild full
+    frames on demand, e.g. for KeyframeExtractor.
+    """
+    def __init__(self, tile_size=32, keyframe_interval=300, keyframe_ratio=0.5,
+                 budget_bytes=256 * 1024 * 1024, pixel_format='bgr'):
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_ratio = keyframe_ratio
+        self.budget_bytes = budget_bytes
+        self.pixel_format = pixel_format
+        self.detector = ChangeDetector(tile_size)
+        # Stored frames from absolute index `first_index` on: (keyframe, rows, cols, tiles)
+        self.entries = []
+        self.timestamps = []
+        self.keyframe_indices = []
+        self.first_index = 0
+        self.frame_shape = None
+        self.memory_bytes = 0
+        self.frames_evicted = 0
+        self._group_bytes = 0
+        self._cursor_index = None
+        self._cursor_frame = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, frame, timestamp):
+        """Store a frame if it changed; returns the number of changed tiles.
+
+        Keyframes report every tile as changed.
+        """
+        if self.frame_shape is None:
+            self.frame_shape = frame.shape
+        elif frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match {self.frame_shape}")
+
+        padded = _pad_to_tiles(frame, self.tile_size)
+        dirty = self.detector.dirty_tiles(padded)
+        dirty_count = int(np.count_nonzero(dirty))
+        if not dirty_count:
+            return 0
+
+        with self._lock:
+            index = self.first_index + len(self.entries)
+            since_keyframe = index - self.keyframe_indices[-1] if self.keyframe_indices else None
+            if (since_keyframe is None or since_keyframe >= self.keyframe_interval
+                    or dirty_count >= self.keyframe_ratio * dirty.size
+                    or self._group_bytes >= padded.nbytes):
+                entry = (padded.copy(), None, None, None)
+                self.keyframe_indices.append(index)
+                self._group_bytes = 0
+                dirty_count = dirty.size
+            else:
+                rows, cols = np.nonzero(dirty)
+                tiles = _tile_view(padded, self.tile_size)[rows, cols]
+                entry = (None, rows.astype(np.int32), cols.astype(np.int32), tiles)
+                self._group_bytes += self._entry_bytes(entry)
+            self.entries.append(entry)
+            self.timestamps.append(timestamp)
+            self.memory_bytes += self._entry_bytes(entry)
+            self._evict()
+        return dirty_count
+
+    @staticmethod
+    def _entry_bytes(entry):
+        keyframe, rows, cols, tiles = entry
+        if keyframe is not None:
+            return keyframe.nbytes
+        return tiles.nbytes + rows.nbytes + cols.nbytes
+
+    def _evict(self):
+        """Drop the oldest keyframe groups until the store fits its budget"""
+        while self.memory_bytes > self.budget_bytes and len(self.keyframe_indices) > 1:
+            count = self.keyframe_indices[1] - self.first_index
+            self.memory_bytes -= sum(self._entry_bytes(entry) for entry in self.entries[:count])
+            del self.entries[:count]
+            del self.timestamps[:count]
+            self.keyframe_indices.pop(0)
+            self.first_index += count
+            self.frames_evicted += count
+            if self._cursor_index is not None and self._cursor_index < self.first_index:
+                self._cursor_index = self._cursor_frame = None
+
+    def reconstruct(self, index):
+        """Rebuild the full frame at absolute `index`, in the stored pixel format"""
+        with self._lock:
+            position = index - self.first_index
+            if not 0 <= position < len(self.entries):
+                raise IndexError(f"Frame {index} is not stored")
+
+            # Continue from the last reconstructed frame when walking forwards
+            # within the same keyframe group, otherwise restart at the keyframe
+            key_index = self.keyframe_indices[bisect.bisect_right(self.keyframe_indices, index) - 1]
+            if self._cursor_index is not None and key_index <= self._cursor_index <= index:
+                start = self._cursor_index + 1
+                canvas = self._cursor_frame
+            else:
+                start = key_index + 1
+                canvas = self.entries[key_index - self.first_index][0].copy()
+
+            tiles_view = _tile_view(canvas, self.tile_size)
+            for entry in self.entries[start - self.first_index:position + 1]:
+                _, rows, cols, tiles = entry
+                tiles_view[rows, cols] = tiles
+
+            self._cursor_index = index
+            self._cursor_frame = canvas
+            height, width = self.frame_shape[:2]
+            return canvas[:height, :width].copy()
+
+    def frame_at(self, t):
+        """Return (time, BGR frame) of the last stored frame at or before `t`.
+
+        Returns None when `t` is before the oldest frame still kept.
+        """
+        with self._lock:
+            position = bisect.bisect_right(self.timestamps, t + 1e-4) - 1
+            if position < 0:
+                return None
+            index = self.first_index + position
+            timestamp = self.timestamps[position]
+        return timestamp, to_bgr(self.reconstruct(index), self.pixel_format)
@@ -0,0 +1,30 @@
+import time
+
+
+class AdaptiveFrameScheduler:
+    """Chooses the capture interval from recent user and screen activity.
+
+    Capture runs at `idle_fps` while nothing happens and bursts back to
+    `active_fps` for `burst_window` seconds after any input event or
+    on-screen change. Times are RecordingClock (perf_counter) readings.
+    """
+    def __init__(self, active_fps=30, idle_fps=2, burst_window=1.5):
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.burst_window = burst_window
+        self.last_activity = None
+
+    def notify_activity(self, timestamp=None):
+        """Record activity; cheap enough to call from input hooks"""
+        self.last_activity = time.perf_counter() if timestamp is None else timestamp
+
+    def is_active(self, now=None):
+        if self.last_activity is None:
+            return False
+        now = time.perf_counter() if now is None else now
+        return now - self.last_activity <= self.burst_window
+
+    def interval(self, now=None):
+        """Seconds between captures at the current activity level"""
+        fps = self.active_fps if self.is_active(now) else self.idle_fps
+        return 1 / fps
@@ -0,0 +1,258 @@
+import os
+import struct
+import threading
+from array import array
+from collections import deque
+
+import numpy as np
+
+# Spill file layout: fixed header, then (float64 timestamp, raw frame) records.
+# The header's shape is followed by the number of records the encoder took.
+SPILL_MAGIC = b'CBFRAME1'
+SPILL_HEADER = struct.Struct('<8sIII')
+SPILL_TAKEN = struct.Struct('<I')
+SPILL_HEADER_SIZE = 64
+SPILL_TIMESTAMP = struct.Struct('<d')
+
+
+class SpillFile:
+    """Append-only raw frame file read back through memory maps.
+
+    Frames are written with plain file I/O and flushed to the page cache
+    right away, so they survive a crash of the recording process and can be
+    recovered with read_spill_file(). The header counts the frames handed
+    to the encoder, so recovery only returns the ones it never saw.
+    """
+    def __init__(self, path, shape):
+        self.path = str(path)
+        self.shape = tuple(shape)
+        self.frame_bytes = int(np.prod(self.shape))
+        self.record_bytes = SPILL_TIMESTAMP.size + self.frame_bytes
+        self.timestamps = array('d')
+        self._file = open(self.path, 'w+b')
+        self._write_header()
+
+    def _write_header(self):
+        height, width, channels = self.shape
+        header = SPILL_HEADER.pack(SPILL_MAGIC, height, width, channels)
+        self._file.write(header.ljust(SPILL_HEADER_SIZE, b'\0'))
+        self._file.flush()
+
+    def append(self, frame, timestamp):
+        """Write a frame and return its index"""
+        self._file.write(SPILL_TIMESTAMP.pack(timestamp))
+        self._file.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+        self._file.flush()
+        self.timestamps.append(timestamp)
+        return len(self.timestamps) - 1
+
+    def mark_taken(self, count):
+        """Record that the first `count` frames went to the encoder"""
+        position = self._file.tell()
+        self._file.seek(SPILL_HEADER.size)
+        self._file.write(SPILL_TAKEN.pack(count))
+        self._file.seek(position)
+        self._file.flush()
+
+    def read(self, index):
+        """Zero-copy view of a stored frame"""
+        offset = SPILL_HEADER_SIZE + index * self.record_bytes + SPILL_TIMESTAMP.size
+        return np.memmap(self.path, dtype=np.uint8, mode='r', offset=offset, shape=self.shape)
+
+    def reset(self):
+        """Discard all frames; only call when no views are in use"""
+        try:
+            self._file.truncate(SPILL_HEADER_SIZE)
+        except OSError:
+            # Windows refuses while a stale view is still mapped; keep appending
+            return
+        self.timestamps = array('d')
+        self.mark_taken(0)
+        self._file.seek(SPILL_HEADER_SIZE)
+
+    def close(self, delete=True):
+        self._file.close()
+        if delete and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                print(f"Error removing spill file: {e}")
+
+
+def read_spill_file(path):
+    """Yield (timestamp, frame) for every complete record the encoder never took.
+
+    Used to recover frames left behind by a recording that crashed.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        magic, height, width, channels = SPILL_HEADER.unpack(f.read(SPILL_HEADER.size))
+        taken, = SPILL_TAKEN.unpack(f.read(SPILL_TAKEN.size))
+    if magic != SPILL_MAGIC:
+        raise ValueError(f"{path} is not a frame spill file")
+
+    shape = (height, width, channels)
+    record_bytes = SPILL_TIMESTAMP.size + height * width * channels
+    records = (size - SPILL_HEADER_SIZE) // record_bytes
+    if records <= taken:
+        return
+    data = np.memmap(path, dtype=np.uint8, mode='r', offset=SPILL_HEADER_SIZE,
+                     shape=(records, record_bytes))
+    for record in data[taken:]:
+        timestamp = SPILL_TIMESTAMP.unpack(record[:SPILL_TIMESTAMP.size].tobytes())[0]
+        yield timestamp, record[SPILL_TIMESTAMP.size:].reshape(shape)
+
+
+class FrameStore:
+    """Bounded FIFO of frames backed by one preallocated array.
+
+    The number of slots is derived from a byte budget, so the store can
+    never grow beyond it. Producers copy frames in with put(); consumers
+    take the oldest slot with get(), read `frames[slot]` in place and hand
+    it back with release(). When every slot is taken, `policy` decides:
+
+    - 'drop_newest': reject the incoming frame
+    - 'drop_oldest': discard the oldest queued frame to make room
+    - 'block': wait for the consumer (back-pressure on the producer)
+    - 'spill': append the frame to a memory-mapped file at `spill_path`,
+      so the backlog is bounded by disk space instead of RAM
+
+    Pass `path` to back the slots with a memory-mapped file instead of RAM.
+    Handles returned by get() are read with frame(); spilled frames come
+    back as zero-copy views of the spill file.
+    """
+    POLICIES = ('drop_newest', 'drop_oldest', 'block', 'spill')
+
+    def __init__(self, shape, budget_bytes=256 * 1024 * 1024, policy='drop_newest',
+                 dtype=np.uint8, path=None, min_slots=2, spill_path=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown drop policy '{policy}'. Available: {', '.join(self.POLICIES)}")
+
+        self.shape = tuple(shape)
+        self.policy = policy
+        self.frame_bytes = int(np.prod(self.shape)) * np.dtype(dtype).itemsize
+        slots = budget_bytes // self.frame_bytes
+        if slots < min_slots:
+            raise ValueError(f"Budget of {budget_bytes} bytes holds fewer than {min_slots} "
+                             f"frames of {self.frame_bytes} bytes")
+
+        if path is None:
+            self.frames = np.empty((slots,) + self.shape, dtype=dtype)
+        else:
+            self.frames = np.memmap(path, dtype=dtype, mode='w+', shape=(slots,) + self.shape)
+        self.timestamps = np.zeros(slots, dtype=np.float64)
+        self.spill = None
+        if policy == 'spill':
+            if spill_path is None:
+                raise ValueError("The 'spill' policy needs a spill_path")
+            self.spill = SpillFile(spill_path, self.shape)
+        self.spilled = 0
+        self._spill_pending = 0
+        self._spill_lock = threading.Lock()
+        self.dropped = 0
+        self.closed = False
+        self._free = deque(range(slots))
+        self._queued = deque()
+        self._cond = threading.Condition()
+
+    @property
+    def capacity(self):
+        return len(self.frames)
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def __len__(self):
+        return len(self._queued)
+
+    def put(self, frame, timestamp, timeout=None):
+        """Copy a frame into the store. Returns False if it was dropped."""
+        with self._cond:
+            slot = self._acquire_slot(timeout)
+            if slot is None and self.spill is None:
+                self.dropped += 1
+                return False
+
+        if slot is None:
+            return self._put_spilled(frame, timestamp)
+
+        # Copy outside the lock; the slot is owned by this producer now
+        np.copyto(self.frames[slot], frame)
+        self.timestamps[slot] = timestamp
+
+        with self._cond:
+            self._queued.append(slot)
+            self._cond.notify_all()
+        return True
+
+    def _put_spilled(self, frame, timestamp):
+        with self._spill_lock:
+            index = self.spill.append(frame, timestamp)
+            self._spill_pending += 1
+        self.spilled += 1
+
+        with self._cond:
+            self._queued.append(self.capacity + index)
+            self._cond.notify_all()
+        return True
+
+    def _acquire_slot(self, timeout):
+        if self._free:
+            return self._free.popleft()
+        if self.policy == 'drop_oldest' and self._queued:
+            self.dropped += 1
+            return self._queued.popleft()
+        if self.policy == 'block':
+            ready = self._cond.wait_for(lambda: self._free or self.closed, timeout)
+            if ready and self._free:
+                return self._free.popleft()
+        return None
+
+    def get(self, timeout=None):
+        """Return (slot, timestamp) of the oldest frame.
+
+        Returns None on timeout, or once the store is closed and drained.
+        """
+        with self._cond:
+            ready = self._cond.wait_for(lambda: self._queued or self.closed, timeout)
+            if not ready or not self._queued:
+                return None
+            slot = self._queued.popleft()
+            if slot < self.capacity:
+                return slot, float(self.timestamps[slot])
+        index = slot - self.capacity
+        with self._spill_lock:
+            self.spill.mark_taken(index + 1)
+        return slot, self.spill.timestamps[index]
+
+    def frame(self, slot):
+        """Return the frame for a handle from get()"""
+        if slot >= self.capacity:
+            return self.spill.read(slot - self.capacity)
+        return self.frames[slot]
+
+    def release(self, slot):
+        """Return a slot taken with get() to the free pool"""
+        if slot >= self.capacity:
+            with self._spill_lock:
+                self._spill_pending -= 1
+                # Reuse the file from the start once the backlog is gone
+                if not self._spill_pending:
+                    self.spill.reset()
+            return
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify_all()
+
+    def close(self):
+        """Stop accepting waits; get() drains what is queued, then returns None"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def discard_spill(self):
+        """Close and delete the spill file once everything was consumed"""
+        if self.spill is not None:
+            self.spill.close(delete=True)
+            self.spill = None
@@ -8,6 +8,8 @@ from google.oauth2 import service_account
 import google.auth
 from google.auth.exceptions import DefaultCredentialsError
 
+from recording_paths import proxy_path_for
+
 class GCPIntegrations:
     def __init__(self, project_id, location="us-central1", credentials_path=None):
         self.project_id = project_id
@@ -120,16 +122,23 @@ class GCPIntegrations:
             print(error_msg)
             raise Exception(error_msg) from e
             
-    def process_recording(self, video_path, interaction_path, bucket_name):
-        """Process recording with improved error handling"""
+    def process_recording(self, video_path, interaction_path, bucket_name, use_proxy=True):
+        """Process recording with improved error handling.
+
+        With `use_proxy` the recording's low-resolution analysis proxy is
+        uploaded instead of the archival video when it exists.
+        """
         try:
             # First verify credentials are valid
             if not self.credentials:
                 raise Exception("GCP credentials not initialized")
                 
             # Upload video
-            print(f"Uploading video: {video_path}")
-            upload_result = self.upload_to_gcs(video_path, bucket_name)
+            upload_path = video_path
+            if use_proxy and os.path.exists(proxy_path_for(video_path)):
+                upload_path = str(proxy_path_for(video_path))
+            print(f"Uploading video: {upload_path}")
+            upload_result = self.upload_to_gcs(upload_path, bucket_name)
             if not upload_result:
                 raise Exception("Failed to upload video to GCS")
                 
@@ -0,0 +1,177 @@
+import ctypes
+
+import numpy as np
+
+
+class GdiOps:
+    """Platform calls used by GdiCaptureSession.
+
+    Kept behind this interface so the session lifecycle can run against a
+    fake implementation on machines without GDI.
+    """
+    def open(self, width, height):
+        """Allocate capture resources; return (handles, buffer address)"""
+        raise NotImplementedError
+
+    def blit(self, handles, left, top, width, height):
+        """Copy the screen region into the buffer; return False on failure"""
+        raise NotImplementedError
+
+    def close(self, handles):
+        raise NotImplementedError
+
+
+class Win32GdiOps(GdiOps):
+    """GDI implementation: screen DC -> memory DC backed by a top-down DIB section"""
+    SRCCOPY = 0x00CC0020
+    CAPTUREBLT = 0x40000000
+    BI_RGB = 0
+    DIB_RGB_COLORS = 0
+
+    class BITMAPINFOHEADER(ctypes.Structure):
+        _fields_ = [
+            ("biSize", ctypes.c_uint32),
+            ("biWidth", ctypes.c_int32),
+            ("biHeight", ctypes.c_int32),
+            ("biPlanes", ctypes.c_uint16),
+            ("biBitCount", ctypes.c_uint16),
+            ("biCompression", ctypes.c_uint32),
+            ("biSizeImage", ctypes.c_uint32),
+            ("biXPelsPerMeter", ctypes.c_int32),
+            ("biYPelsPerMeter", ctypes.c_int32),
+            ("biClrUsed", ctypes.c_uint32),
+            ("biClrImportant", ctypes.c_uint32),
+        ]
+
+    def __init__(self):
+        from ctypes import wintypes
+
+        self.user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self.gdi32 = ctypes.WinDLL('gdi32', use_last_error=True)
+
+        self.user32.GetDC.restype = wintypes.HDC
+        self.user32.GetDC.argtypes = [wintypes.HWND]
+        self.user32.ReleaseDC.argtypes = [wintypes.HWND, wintypes.HDC]
+        self.gdi32.CreateCompatibleDC.restype = wintypes.HDC
+        self.gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+        self.gdi32.CreateDIBSection.restype = wintypes.HBITMAP
+        self.gdi32.CreateDIBSection.argtypes = [
+            wintypes.HDC, ctypes.c_void_p, wintypes.UINT,
+            ctypes.POINTER(ctypes.c_void_p), wintypes.HANDLE, wintypes.DWORD
+        ]
+        self.gdi32.SelectObject.restype = wintypes.HGDIOBJ
+        self.gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+        self.gdi32.BitBlt.argtypes = [
+            wintypes.HDC, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+            wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.DWORD
+        ]
+        self.gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+        self.gdi32.DeleteDC.argtypes = [wintypes.HDC]
+
+    def open(self, width, height):
+        screen_dc = self.user32.GetDC(None)
+        mem_dc = self.gdi32.CreateCompatibleDC(screen_dc)
+
+        header = self.BITMAPINFOHEADER()
+        header.biSize = ctypes.sizeof(self.BITMAPINFOHEADER)
+        header.biWidth = width
+        header.biHeight = -height  # negative height = top-down rows
+        header.biPlanes = 1
+        header.biBitCount = 32
+        header.biCompression = self.BI_RGB
+
+        bits = ctypes.c_void_p()
+        bitmap = self.gdi32.CreateDIBSection(
+            mem_dc, ctypes.byref(header), self.DIB_RGB_COLORS, ctypes.byref(bits), None, 0
+        )
+        if not bitmap or not bits.value:
+            self.gdi32.DeleteDC(mem_dc)
+            self.user32.ReleaseDC(None, screen_dc)
+            raise ctypes.WinError(ctypes.get_last_error())
+
+        previous = self.gdi32.SelectObject(mem_dc, bitmap)
+        return (screen_dc, mem_dc, bitmap, previous), bits.value
+
+    def blit(self, handles, left, top, width, height):
+        screen_dc, mem_dc, _, _ = handles
+        ok = self.gdi32.BitBlt(mem_dc, 0, 0, width, height, screen_dc, left, top,
+                               self.SRCCOPY | self.CAPTUREBLT)
+        # Make sure GDI has finished writing before the pixels are read
+        self.gdi32.GdiFlush()
+        return bool(ok)
+
+    def close(self, handles):
+        screen_dc, mem_dc, bitmap, previous = handles
+        self.gdi32.SelectObject(mem_dc, previous)
+        self.gdi32.DeleteObject(bitmap)
+        self.gdi32.DeleteDC(mem_dc)
+        self.user32.ReleaseDC(None, screen_dc)
+
+
+class GdiCaptureSession:
+    """Persistent screen capture session.
+
+    Device contexts and the DIB section are allocated once and reused for
+    every frame. grab() returns a zero-copy (height, width, 4) BGRA view of
+    the DIB bits which is overwritten by the next grab(), so callers copy
+    or convert it before capturing again.
+    """
+    def __init__(self, width, height, left=0, top=0, ops=None):
+        self.width = width
+        self.height = height
+        self.left = left
+        self.top = top
+        self.ops = ops if ops is not None else Win32GdiOps()
+        self.frame = None
+        self.reopen_count = 0
+        self._handles = None
+
+    @property
+    def is_open(self):
+        return self._handles is not None
+
+    def open(self):
+        if self._handles is not None:
+            return
+        self._handles, address = self.ops.open(self.width, self.height)
+        size = self.width * self.height * 4
+        buffer = (ctypes.c_ubyte * size).from_address(address)
+        self.frame = np.frombuffer(buffer, dtype=np.uint8).reshape(self.height, self.width, 4)
+
+    def close(self):
+        if self._handles is None:
+            return
+        self.frame = None
+        handles, self._handles = self._handles, None
+        self.ops.close(handles)
+
+    def resize(self, width, height, left=None, top=None):
+        """Change the captured region, reallocating only if the size changed"""
+        if left is not None:
+            self.left = left
+        if top is not None:
+            self.top = top
+        if (width, height) != (self.width, self.height):
+            self.close()
+            self.width = width
+            self.height = height
+
+    def grab(self):
+        """Capture the region and return the shared BGRA view"""
+        self.open()
+        if not self.ops.blit(self._handles, self.left, self.top, self.width, self.height):
+            # DCs can go stale after display changes or session switches;
+            # rebuild them once before giving up on this frame
+            self.close()
+            self.open()
+            self.reopen_count += 1
+            if not self.ops.blit(self._handles, self.left, self.top, self.width, self.height):
+                raise OSError("BitBlt failed")
+        return self.frame
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,373 @@
+import heapq
+import itertools
+import json
+import os
+import platform
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from interaction_pipeline import coalesce_events, simplify_moves
+
+# Log layout: a fixed header, then 24-byte records. Strings (key names) are
+# interned: defined once by a STRING record followed by raw text records and
+# referenced by id from the `code` field afterwards. Event types without a
+# string use `code` for a plain value (the wheel delta of a scroll).
+LOG_MAGIC = b'CBINPUT1'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<8sIqq')
+LOG_HEADER_SIZE = 32
+RECORD = struct.Struct('<qBB2xiii')
+RECORD_DTYPE = np.dtype({
+    'names': ['timestamp_ns', 'event_type', 'detail', 'x', 'y', 'code'],
+    'formats': ['<i8', 'u1', 'u1', '<i4', '<i4', '<i4'],
+    'offsets': [0, 8, 9, 12, 16, 20],
+    'itemsize': RECORD.size,
+})
+
+EVENT_TYPES = ('mouse_move', 'mouse_down', 'mouse_up', 'mouse_double', 'scroll', 'keypress', 'element')
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES, start=1)}
+MOUSE_MOVE, MOUSE_DOWN, MOUSE_UP, MOUSE_DOUBLE, SCROLL, KEYPRESS, ELEMENT = range(1, len(EVENT_TYPES) + 1)
+# Element records describe the window under the click with the same
+# timestamp: x holds the window handle, the string is "class\0text"
+ELEMENT_SEPARATOR = '\0'
+STRING_TYPES = ('keypress', 'element')
+# Scroll values are wheel deltas in 1/120 notch units, as on Windows
+WHEEL_DELTA = 120
+# `mouse` library ButtonEvent.event_type values
+MOUSE_BUTTON_EVENTS = {'down': MOUSE_DOWN, 'up': MOUSE_UP, 'double': MOUSE_DOUBLE}
+STRING_RECORD = 255
+MOUSE_BUTTONS = ('left', 'right', 'middle', 'x', 'x2', 'wheel')
+BUTTON_CODES = {name: code for code, name in enumerate(MOUSE_BUTTONS)}
+UNKNOWN_BUTTON = 255
+NO_STRING = -1
+
+LogRecord = namedtuple('LogRecord', 'timestamp_ns event_type x y detail text value')
+
+
+class InteractionLog:
+    """Append-only binary log of input events.
+
+    Events are buffered column-wise in typed arrays, one per record field,
+    so an append from an input hook is a handful of C-level array appends
+    with no per-event objects. A background thread packs the columns into
+    records and writes them out every `flush_interval` seconds (or when
+    `buffer_records` are pending), so a crash loses at most the last
+    interval. The hooks never wait for the disk: the columns are swapped
+    out under a short lock and written by the flusher. Timestamps are raw
+    perf_counter_ns() readings, the same monotonic clock the video
+    timestamps use; the header stores the wall-clock time of the clock
+    origin, and formatting is left to export.
+    Pass the recording session's `origin_ns` so exported events carry their
+    time on the session (and video) timeline.
+
+    Without a `path` the log goes to a temporary file that close() deletes
+    unless `keep=True`.
+    """
+    def __init__(self, path=None, buffer_records=4096, flush_interval=0.5, origin_ns=None):
+        self.origin_ns = time.perf_counter_ns() if origin_ns is None else origin_ns
+        self.temporary = path is None
+        if self.temporary:
+            fd, path = tempfile.mkstemp(suffix='.cbin', prefix='interactions_')
+            os.close(fd)
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self.buffer_records = buffer_records
+        self.count = 0
+        self._columns = self._new_columns()
+        self._strings = {}
+        self._new_strings = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._file = open(self.path, 'wb')
+        self._write_header()
+
+        self._closing = False
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    @staticmethod
+    def _new_columns():
+        # timestamp, type, detail, x, y, string id
+        return (array('q'), array('B'), array('B'), array('i'), array('i'), array('i'))
+
+    def _write_header(self):
+        # Wall-clock time at the origin, read as one pair with the clock
+        wall_origin = time.time_ns() - (time.perf_counter_ns() - self.origin_ns)
+        header = LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, self.origin_ns, wall_origin)
+        self._file.write(header.ljust(LOG_HEADER_SIZE, b'\0'))
+        self._file.flush()
+
+    def append(self, event_type, timestamp_ns, x=0, y=0, detail=0, text=None, value=NO_STRING):
+        """Add an event of an EVENT_CODES type.
+
+        `text` is stored as a string id; otherwise the `code` field holds
+        `value`.
+        """
+        with self._lock:
+            if text is None:
+                string_id = value
+            else:
+                string_id = self._strings.get(text)
+                if string_id is None:
+                    string_id = self._strings[text] = len(self._strings)
+                    self._new_strings.append((string_id, text))
+            timestamps, types, details, xs, ys, codes = self._columns
+            timestamps.append(timestamp_ns)
+            types.append(event_type)
+            details.append(detail)
+            xs.append(x)
+            ys.append(y)
+            codes.append(string_id)
+            self.count += 1
+            if len(timestamps) >= self.buffer_records:
+                self._wake.set()
+
+    def flush(self):
+        """Write out everything appended so far"""
+        # The write lock keeps batches (and string definitions) in order
+        with self._write_lock:
+            with self._lock:
+                columns, self._columns = self._columns, self._new_columns()
+                new_strings, self._new_strings = self._new_strings, []
+
+            if new_strings:
+                # Definitions go first so every id is known before it is used
+                self._file.write(b''.join(_pack_string(*item) for item in new_strings))
+
+            count = len(columns[0])
+            if count:
+                records = np.zeros(count, dtype=RECORD_DTYPE)
+                for name, column in zip(RECORD_DTYPE.names, columns):
+                    records[name] = column
+                self._file.write(records.tobytes())
+            self._file.flush()
+
+    def _flush_loop(self):
+        while not self._closing:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing interaction log: {e}")
+
+    def close(self, keep=None):
+        """Flush and close; a temporary log is deleted unless `keep`"""
+        if self._file.closed:
+            return
+        self._closing = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        self._file.close()
+        if self.temporary and not keep:
+            self.discard()
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _pack_string(string_id, text):
+    data = text.encode('utf-8')
+    padded = data.ljust(-(-len(data) // RECORD.size) * RECORD.size, b'\0')
+    return RECORD.pack(0, STRING_RECORD, 0, string_id, len(data), 0) + padded
+
+
+def _read_header(f, path):
+    magic, version, clock_origin, wall_origin = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+    if magic != LOG_MAGIC:
+        raise ValueError(f"{path} is not an interaction log")
+    if version != LOG_VERSION:
+        raise ValueError(f"Unsupported interaction log version {version}")
+    f.seek(LOG_HEADER_SIZE)
+    return clock_origin, wall_origin
+
+
+def _iter_raw_records(f, chunk_records=4096):
+    """Yield complete 24-byte records; a record cut short by a crash is dropped"""
+    while True:
+        chunk = f.read(RECORD.size * chunk_records)
+        usable = len(chunk) - len(chunk) % RECORD.size
+        for offset in range(0, usable, RECORD.size):
+            yield chunk[offset:offset + RECORD.size]
+        if len(chunk) < RECORD.size * chunk_records:
+            return
+
+
+def iter_log_records(path):
+    """Stream the events of a log as LogRecord tuples, in file order"""
+    with open(path, 'rb') as f:
+        _read_header(f, path)
+        strings = {}
+        raw_records = _iter_raw_records(f)
+        for raw in raw_records:
+            timestamp_ns, code, detail, x, y, string_id = RECORD.unpack(raw)
+            if code == STRING_RECORD:
+                length = y
+                parts = [next(raw_records, b'') for _ in range(-(-length // RECORD.size))]
+                strings[x] = b''.join(parts)[:length].decode('utf-8', errors='replace')
+                continue
+            if not 0 < code <= len(EVENT_TYPES):
+                continue
+            event_type = EVENT_TYPES[code - 1]
+            text = strings.get(string_id) if event_type in STRING_TYPES else None
+            yield LogRecord(timestamp_ns, event_type, x, y, detail, text, string_id)
+
+
+def read_log_origin(path):
+    """Return (clock origin ns, wall-clock ns at that origin) from the header"""
+    with open(path, 'rb') as f:
+        return _read_header(f, path)
+
+
+def record_to_event(record, clock_origin, wall_origin):
+    """Convert a LogRecord to an event dict in the `recording_data` schema"""
+    wall_ns = wall_origin + (record.timestamp_ns - clock_origin)
+    event = {
+        "timestamp": datetime.fromtimestamp(wall_ns / 1e9).isoformat(),
+        # Seconds since the clock origin: the video timestamp of the event
+        "session_time": round((record.timestamp_ns - clock_origin) / 1e9, 6),
+        "type": record.event_type,
+    }
+    if record.event_type == 'keypress':
+        event["key"] = record.text
+        return event
+    if record.event_type == 'scroll':
+        event["direction"] = "down" if record.detail else "up"
+        if record.value != NO_STRING:
+            event["delta"] = record.value / WHEEL_DELTA
+    elif record.event_type != 'mouse_move':
+        event["button"] = MOUSE_BUTTONS[record.detail] if record.detail < len(MOUSE_BUTTONS) else None
+    event["position"] = {"x": record.x, "y": record.y}
+    return event
+
+
+def record_to_element(record):
+    """Convert an element record to the `element` dict attached to clicks"""
+    class_name, _, text = (record.text or '').partition(ELEMENT_SEPARATOR)
+    return {"class": class_name, "text": text, "window_handle": record.x & 0xFFFFFFFF}
+
+
+def read_interaction_log(path):
+    """Stream the events of a log as `recording_data` event dicts.
+
+    Element records are skipped here; export_log_json() attaches them to
+    their clicks.
+    """
+    clock_origin, wall_origin = read_log_origin(path)
+    for record in iter_log_records(path):
+        if record.event_type != 'element':
+            yield record_to_event(record, clock_origin, wall_origin)
+
+
+def build_recording_data(interactions, platform_name=None):
+    """Wrap events in the `recording_data` schema used by the analyzers"""
+    all_interactions = sorted(interactions, key=lambda x: x['timestamp'])
+    return {
+        "recording_data": {
+            "start_time": all_interactions[0]["timestamp"] if all_interactions else None,
+            "end_time": all_interactions[-1]["timestamp"] if all_interactions else None,
+            "platform": platform_name or platform.system(),
+            "interactions": all_interactions
+        }
+    }
+
+
+def _in_time_order(records, window_ns):
+    """Reorder a nearly sorted record stream by timestamp.
+
+    Hooks on different threads can append slightly out of order; holding
+    back `window_ns` of records in a heap puts them back in order without
+    reading the whole log into memory.
+    """
+    heap = []
+    for sequence, record in enumerate(records):
+        heapq.heappush(heap, (record.timestamp_ns, sequence, record))
+        while record.timestamp_ns - heap[0][0] > window_ns:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def _quiet_chunks(records, gap_ns, min_records, max_records):
+    """Split a sorted record stream into lists at pauses longer than `gap_ns`.
+
+    No mouse stroke, scroll burst or typing span crosses such a pause, so
+    the chunks can be simplified and coalesced one at a time. A chunk is
+    cut at `max_records` even without a pause, which keeps memory bounded
+    at the cost of possibly splitting a burst there.
+    """
+    chunk = []
+    for record in records:
+        if chunk and (len(chunk) >= max_records or (
+                len(chunk) >= min_records and record.timestamp_ns - chunk[-1].timestamp_ns > gap_ns)):
+            yield chunk
+            chunk = []
+        chunk.append(record)
+    if chunk:
+        yield chunk
+
+
+def export_log_json(path, filename, platform_name=None, move_tolerance=2.0, coalesce=True,
+                    reorder_window_ms=1000, chunk_records=4096, max_chunk_records=1 << 18):
+    """Write a binary log out as the JSON `recording_data` file.
+
+    Mouse paths are simplified to `move_tolerance` pixels; pass None to
+    export every recorded move. With `coalesce`, scroll bursts and runs of
+    keypresses are merged into single events (see coalesce_events()).
+
+    The log is streamed: records are put back in time order within
+    `reorder_window_ms`, then processed in chunks split at pauses of two
+    seconds (at least `chunk_records`, at most `max_chunk_records` long),
+    so memory stays bounded however long the recording is.
+    """
+    clock_origin, wall_origin = read_log_origin(path)
+    records = _in_time_order(iter_log_records(path), int(reorder_window_ms * 1e6))
+
+    def to_events(chunk):
+        if move_tolerance is not None:
+            chunk = simplify_moves(chunk, tolerance=move_tolerance)
+        elements = {record.timestamp_ns: record_to_element(record)
+                    for record in chunk if record.event_type == 'element'}
+        chunk = [record for record in chunk if record.event_type != 'element']
+
+        def to_event(record):
+            event = record_to_event(record, clock_origin, wall_origin)
+            element = elements.get(record.timestamp_ns) if record.event_type == 'mouse_down' else None
+            if element is not None:
+                element["position"] = event["position"]
+                event["element"] = element
+            return event
+
+        if coalesce:
+            events = coalesce_events(chunk, to_event)
+        else:
+            events = [to_event(record) for record in chunk]
+        # Spans are emitted when they close; chunks never overlap in time
+        return sorted(events, key=lambda x: x['timestamp'])
+
+    chunks = (to_events(chunk) for chunk in _quiet_chunks(records, 2 * 10**9, chunk_records, max_chunk_records))
+    events = next((events for events in chunks if events), [])
+    start_time = events[0]["timestamp"] if events else None
+    end_time = None
+    # Same layout as build_recording_data(), written an event at a time
+    with open(filename, 'w') as f:
+        f.write('{"recording_data": {"start_time": %s, "platform": %s, "interactions": ['
+                % (json.dumps(start_time), json.dumps(platform_name or platform.system())))
+        separator = ''
+        for events in itertools.chain([events], chunks):
+            for event in events:
+                f.write(separator + json.dumps(event))
+                separator = ', '
+            if events:
+                end_time = events[-1]["timestamp"]
+        f.write('], "end_time": %s}}' % json.dumps(end_time))
@@ -0,0 +1,200 @@
+"""Post-processing stages applied to interaction log records before export.
+
+Stages take and return lists of LogRecord tuples sorted by timestamp, so
+they run on compact numeric data instead of formatted event dicts.
+"""
+import numpy as np
+
+
+def rdp_mask(points, tolerance, keep=None):
+    """Ramer-Douglas-Peucker simplification of an (n, 2) point array.
+
+    Returns a boolean mask of the points to keep. Points already set in
+    `keep` are always kept and split the path, so they survive as segment
+    endpoints. Each split computes the distances of a whole segment at once
+    with numpy, which keeps long paths fast.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    count = len(points)
+    mask = np.zeros(count, dtype=bool) if keep is None else np.array(keep, dtype=bool)
+    if count == 0:
+        return mask
+    mask[0] = mask[-1] = True
+
+    anchors = np.flatnonzero(mask)
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        first = points[start]
+        direction = points[end] - first
+        offsets = points[start + 1:end] - first
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            mask[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return mask
+
+
+def simplify_moves(records, tolerance=2.0, keep_window_ms=100, max_gap_ms=1000):
+    """Drop redundant mouse_move records.
+
+    Repeated positions are removed, then the path is simplified with RDP at
+    `tolerance` pixels. Moves within `keep_window_ms` of a click or scroll
+    are kept as they are, and a pause longer than `max_gap_ms` starts a new
+    stroke so hovering stays visible.
+    """
+    moves = [i for i, record in enumerate(records) if record.event_type == 'mouse_move']
+    if len(moves) < 3:
+        return records
+
+    move_records = [records[i] for i in moves]
+    xy = np.array([(record.x, record.y) for record in move_records], dtype=np.float64)
+    times = np.array([record.timestamp_ns for record in move_records], dtype=np.int64)
+
+    # Consecutive duplicates carry no information
+    changed = np.ones(len(xy), dtype=bool)
+    changed[1:] = np.any(xy[1:] != xy[:-1], axis=1)
+    xy, times = xy[changed], times[changed]
+    kept_moves = np.flatnonzero(changed)
+
+    keep = np.zeros(len(xy), dtype=bool)
+    anchors = np.array([record.timestamp_ns for record in records
+                        if record.event_type not in ('mouse_move', 'keypress', 'element')],
+                       dtype=np.int64)
+    if len(anchors):
+        window = int(keep_window_ms * 1e6)
+        anchors.sort()
+        # Distance in time from each move to the nearest anchor
+        position = np.searchsorted(anchors, times)
+        before = anchors[np.clip(position - 1, 0, len(anchors) - 1)]
+        after = anchors[np.clip(position, 0, len(anchors) - 1)]
+        nearest = np.minimum(np.abs(times - before), np.abs(after - times))
+        keep |= nearest <= window
+
+    gaps = np.flatnonzero(np.diff(times) > int(max_gap_ms * 1e6))
+    keep[gaps] = True
+    keep[gaps + 1] = True
+
+    mask = rdp_mask(xy, tolerance, keep)
+    drop = set(moves[i] for i in kept_moves[~mask])
+    drop.update(moves[i] for i in np.flatnonzero(~changed))
+    return [record for i, record in enumerate(records) if i not in drop]
+
+
+# Keys that are not rendered into typed text, and keys that end a span
+MODIFIER_KEYS = {'shift', 'right shift', 'left shift', 'caps lock'}
+SPAN_TERMINATORS = {'enter', 'tab'}
+KEY_TEXT = {'space': ' ', 'enter': '\n', 'tab': '\t'}
+
+
+def render_keys(keys):
+    """Readable text for a run of key names; editing keys are applied"""
+    text = []
+    for key in keys:
+        if key is None or key in MODIFIER_KEYS:
+            continue
+        if key == 'backspace':
+            if text:
+                text.pop()
+        elif key in KEY_TEXT:
+            text.append(KEY_TEXT[key])
+        elif len(key) == 1:
+            text.append(key)
+        else:
+            text.append(f"[{key}]")
+    return ''.join(text)
+
+
+def _milliseconds(start_ns, end_ns):
+    return round((end_ns - start_ns) / 1e6, 1)
+
+
+def _scroll_span(records, to_event):
+    event = to_event(records[0])
+    if len(records) == 1:
+        return event
+    first, last = records[0], records[-1]
+    if "delta" in event:
+        event["delta"] = sum(to_event(record).get("delta", 0) for record in records)
+    event["ticks"] = len(records)
+    event["duration_ms"] = _milliseconds(first.timestamp_ns, last.timestamp_ns)
+    event["end_position"] = {"x": last.x, "y": last.y}
+    return event
+
+
+def _typed_span(records, to_event):
+    if len(records) == 1:
+        return to_event(records[0])
+    start = records[0].timestamp_ns
+    keys = [record.text for record in records]
+    first = to_event(records[0])
+    return {
+        "timestamp": first["timestamp"],
+        "session_time": first["session_time"],
+        "type": "typed_text",
+        "text": render_keys(keys),
+        # The raw keys and their timing keep the span lossless
+        "keys": keys,
+        "offsets_ms": [_milliseconds(start, record.timestamp_ns) for record in records],
+        "duration_ms": _milliseconds(start, records[-1].timestamp_ns),
+    }
+
+
+def coalesce_events(records, to_event, scroll_gap_ms=300, key_gap_ms=1500):
+    """Convert records to event dicts, merging bursts into single events.
+
+    Wheel ticks in the same direction less than `scroll_gap_ms` apart become
+    one scroll with the total delta, tick count, duration and end position.
+    Keypresses less than `key_gap_ms` apart become a `typed_text` span with
+    the rendered text plus every key and its offset; enter and tab close a
+    span so each form field gets its own. Clicks end open bursts; mouse
+    moves do not. Single events keep their original form.
+    """
+    scroll_gap = int(scroll_gap_ms * 1e6)
+    key_gap = int(key_gap_ms * 1e6)
+    events = []
+    scroll = []
+    keys = []
+
+    for record in records:
+        if record.event_type == 'scroll':
+            if scroll and (record.timestamp_ns - scroll[-1].timestamp_ns > scroll_gap
+                           or record.detail != scroll[-1].detail):
+                events.append(_scroll_span(scroll, to_event))
+                scroll = []
+            scroll.append(record)
+            continue
+
+        if record.event_type == 'keypress':
+            if keys and record.timestamp_ns - keys[-1].timestamp_ns > key_gap:
+                events.append(_typed_span(keys, to_event))
+                keys = []
+            keys.append(record)
+            if record.text in SPAN_TERMINATORS:
+                events.append(_typed_span(keys, to_event))
+                keys = []
+            continue
+
+        if record.event_type != 'mouse_move':
+            if scroll:
+                events.append(_scroll_span(scroll, to_event))
+                scroll = []
+            if keys:
+                events.append(_typed_span(keys, to_event))
+                keys = []
+        events.append(to_event(record))
+
+    if scroll:
+        events.append(_scroll_span(scroll, to_event))
+    if keys:
+        events.append(_typed_span(keys, to_event))
+    return events
@@ -0,0 +1,237 @@
+"""Per-interaction keyframes from a recording.
+
+Takes a recording and its interactions JSON and saves the frames just
+before and just after each click, keystroke run and scroll as JPEG
+screenshots, with a `keyframes.json` manifest linking events to them.
+Only the needed parts of the video are decoded: nearby requests are
+reached by decoding forward, distant ones by seeking. Frames still held
+in a recorder's DeltaFrameStore are rebuilt from memory instead. Near-
+identical screenshots are stored once, matched by perceptual (difference)
+hash.
+
+    python keyframes.py recordings/recording_X.mp4 recordings/interactions_X.json
+"""
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from analysis_proxy import area_downscale
+
+# Events whose before/after screens are kept
+KEY_EVENTS = ('mouse_down', 'mouse_double', 'keypress', 'typed_text', 'scroll')
+
+
+def dhash(frame, hash_size=64):
+    """Difference hash of a BGR frame as an int of hash_size * hash_size bits.
+
+    UI screens differ in small details (one changed field), so the grid is
+    much finer than the 8x8 used for photos: at 64 a changed word on a
+    1280-wide screen flips several bits, while re-encoding flips none.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def event_windows(interactions):
+    """Yield (index, event, start, end) in video seconds for the key events.
+
+    Uses the events' `session_time`; logs exported before it existed fall
+    back to the offset from the first event, which assumes the video
+    started then.
+    """
+    origin = None
+    for index, event in enumerate(interactions):
+        if event.get("type") not in KEY_EVENTS:
+            continue
+        start = event.get("session_time")
+        if start is None:
+            timestamp = datetime.fromisoformat(event["timestamp"])
+            if origin is None:
+                origin = datetime.fromisoformat(interactions[0]["timestamp"])
+            start = (timestamp - origin).total_seconds()
+        end = start + event.get("duration_ms", 0) / 1000
+        yield index, event, start, end
+
+
+class FrameReader:
+    """Returns the frame shown at a given time, decoding as little as possible.
+
+    Requests should come in increasing time order. A request less than
+    `seek_threshold` seconds ahead decodes forward from the current frame;
+    anything else seeks, backing off until the decoder lands at or before
+    the requested time (seeks are approximate for variable frame rate).
+    """
+    def __init__(self, path, seek_threshold=2.0):
+        self.capture = cv2.VideoCapture(str(path))
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video {path}")
+        self.seek_threshold = seek_threshold
+        self.seeks = 0
+        self.frames_decoded = 0
+        self._current = None  # (time, frame) shown at the last request
+        self._next = None  # frame read ahead, not shown yet
+
+    def _read(self):
+        ok, frame = self.capture.read()
+        if not ok:
+            return None
+        self.frames_decoded += 1
+        return self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000, frame
+
+    def _seek(self, t):
+        self.seeks += 1
+        margin = 1.0
+        while True:
+            target = max(0.0, t - margin)
+            self.capture.set(cv2.CAP_PROP_POS_MSEC, target * 1000)
+            item = self._read()
+            # Past the end nothing decodes; keep backing off then too
+            if item is not None and item[0] <= t or target == 0.0:
+                self._current, self._next = item, None
+                return
+            margin *= 2
+
+    def frame_at(self, t):
+        """Return (time, frame) of the last frame at or before `t`"""
+        current = self._current
+        if current is None or t < current[0] or t - current[0] > self.seek_threshold:
+            self._seek(t)
+        while True:
+            if self._next is None:
+                self._next = self._read()
+                if self._next is None:
+                    break
+            if self._next[0] > t + 1e-4:
+                break
+            self._current, self._next = self._next, None
+        return self._current
+
+    def close(self):
+        self.capture.release()
+
+
+class KeyframeExtractor:
+    """Saves deduplicated before/after screenshots for interaction events.
+
+    `before` and `after` are offsets in seconds from the start and the end
+    of each event; the after shot waits for the UI to settle. Frames whose
+    hashes differ by at most `threshold` bits from a saved one reuse it.
+    `max_width` shrinks saved screenshots by an integer factor.
+    """
+    def __init__(self, before=0.1, after=0.5, threshold=4, hash_size=64, max_width=None,
+                 jpeg_quality=85):
+        self.before = before
+        self.after = after
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+
+    def extract(self, video_path, interactions_path, output_dir, frames=None):
+        """Write the screenshots and keyframes.json to `output_dir`; returns the manifest.
+
+        `frames` is an optional in-memory source with frame_at(t), such as
+        a DeltaFrameStore; the video is only decoded for times it no longer
+        holds.
+        """
+        with open(interactions_path, 'r') as f:
+            interactions = json.load(f)["recording_data"]["interactions"]
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        requests = []
+        events = []
+        for index, event, start, end in event_windows(interactions):
+            entry = {"index": index, "type": event["type"], "session_time": start}
+            events.append(entry)
+            requests.append((max(0.0, start - self.before), entry, "before"))
+            requests.append((end + self.after, entry, "after"))
+        requests.sort(key=lambda request: request[0])
+
+        keyframes = []
+        hashes = []
+        by_time = {}
+        reader = None
+        stats = {"seeks": 0, "frames_decoded": 0, "frames_from_memory": 0}
+        try:
+            for t, entry, side in requests:
+                item = frames.frame_at(t) if frames is not None else None
+                if item is not None:
+                    stats["frames_from_memory"] += 1
+                else:
+                    if reader is None:
+                        reader = FrameReader(video_path)
+                    item = reader.frame_at(t)
+                if item is None:
+                    continue
+                frame_time, frame = item
+                name = by_time.get(frame_time)
+                if name is None:
+                    name = by_time[frame_time] = self._keep(frame, frame_time, output_dir,
+                                                            keyframes, hashes)
+                entry[side] = name
+        finally:
+            if reader is not None:
+                stats["seeks"] = reader.seeks
+                stats["frames_decoded"] = reader.frames_decoded
+                reader.close()
+
+        manifest = {
+            "video": str(video_path),
+            "interactions": str(interactions_path),
+            "keyframes": keyframes,
+            "events": events,
+            "stats": stats,
+        }
+        with open(output_dir / "keyframes.json", 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def _keep(self, frame, frame_time, output_dir, keyframes, hashes):
+        """Return the file for a frame, saving it unless a near-duplicate exists"""
+        frame_hash = dhash(frame, self.hash_size)
+        for existing, name in hashes:
+            if hamming(frame_hash, existing) <= self.threshold:
+                return name
+
+        name = f"keyframe_{len(keyframes):04d}.jpg"
+        if self.max_width and frame.shape[1] > self.max_width:
+            frame = area_downscale(frame, -(-frame.shape[1] // self.max_width))
+        cv2.imwrite(str(output_dir / name), frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        hashes.append((frame_hash, name))
+        keyframes.append({"file": name, "time": round(frame_time, 4)})
+        return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract per-interaction keyframes from a recording")
+    parser.add_argument("video")
+    parser.add_argument("interactions")
+    parser.add_argument("-o", "--output", help="output directory (default: <video>_keyframes)")
+    parser.add_argument("--before", type=float, default=0.1, help="seconds before each event")
+    parser.add_argument("--after", type=float, default=0.5, help="seconds after each event")
+    parser.add_argument("--threshold", type=int, default=4, help="max hash distance of duplicates")
+    parser.add_argument("--max-width", type=int, default=None)
+    args = parser.parse_args()
+
+    video = Path(args.video)
+    output = args.output or video.with_name(f"{video.stem}_keyframes")
+    extractor = KeyframeExtractor(before=args.before, after=args.after,
+                                  threshold=args.threshold, max_width=args.max_width)
+    manifest = extractor.extract(video, args.interactions, output)
+    print(f"{len(manifest['keyframes'])} keyframes for {len(manifest['events'])} events "
+          f"written to {output} ({manifest['stats']})")
+
+
+if __name__ == "__main__":
+    main()
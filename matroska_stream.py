@@ -0,0 +1,120 @@
+"""Minimal streaming Matroska writer for raw video with exact timestamps.
+
+Only what ffmpeg needs to read uncompressed frames from a pipe: an EBML
+header, a Segment and Clusters of unknown size (so nothing is ever
+seeked back to) and one SimpleBlock per frame. Unlike rawvideo, every
+frame carries its own timestamp, so a variable frame rate stream reaches
+the encoder with exact presentation times.
+"""
+import struct
+
+# Matroska element IDs, with their length marker bits included
+EBML = 0x1A45DFA3
+EBML_DOC_TYPE = 0x4282
+EBML_DOC_TYPE_VERSION = 0x4287
+EBML_DOC_TYPE_READ_VERSION = 0x4285
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+MUXING_APP = 0x4D80
+WRITING_APP = 0x5741
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+COLOUR_SPACE = 0x2EB524
+CLUSTER = 0x1F43B675
+CLUSTER_TIMESTAMP = 0xE7
+SIMPLE_BLOCK = 0xA3
+
+UNKNOWN_SIZE = b'\x01\xff\xff\xff\xff\xff\xff\xff'
+KEYFRAME = 0x80
+
+# Capture pixel formats as V_UNCOMPRESSED fourccs
+COLOUR_SPACES = {
+    'bgr': b'BGR\x18',
+    'bgra': b'BGRA',
+    'rgba': b'RGBA',
+}
+
+
+def _id(element_id):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+
+def _size(length):
+    # Always the 8-byte form; a few bytes per element do not matter here
+    return b'\x01' + length.to_bytes(7, 'big')
+
+
+def _uint(value):
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big')
+
+
+def element(element_id, payload):
+    if isinstance(payload, int):
+        payload = _uint(payload)
+    return _id(element_id) + _size(len(payload)) + payload
+
+
+class MatroskaVideoStream:
+    """Writes raw video frames as a live Matroska stream to `write`.
+
+    Timestamps are in units of `timestamp_scale_ns` (100 µs by default).
+    SimpleBlock times are 16-bit offsets from their cluster, so a new
+    cluster starts whenever a frame is more than `cluster_span` units
+    later than the current one.
+    """
+    def __init__(self, write, width, height, pixel_format='bgr', timestamp_scale_ns=100_000):
+        self._write = write
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.timestamp_scale_ns = timestamp_scale_ns
+        self.cluster_span = 30000
+        self._cluster = None
+
+    def write_header(self):
+        header = element(EBML, b''.join([
+            element(EBML_DOC_TYPE, b'matroska'),
+            element(EBML_DOC_TYPE_VERSION, 4),
+            element(EBML_DOC_TYPE_READ_VERSION, 2),
+        ]))
+        info = element(INFO, b''.join([
+            element(TIMESTAMP_SCALE, self.timestamp_scale_ns),
+            element(MUXING_APP, b'crewbuilder'),
+            element(WRITING_APP, b'crewbuilder'),
+        ]))
+        video = element(VIDEO, b''.join([
+            element(PIXEL_WIDTH, self.width),
+            element(PIXEL_HEIGHT, self.height),
+            element(COLOUR_SPACE, COLOUR_SPACES[self.pixel_format]),
+        ]))
+        tracks = element(TRACKS, element(TRACK_ENTRY, b''.join([
+            element(TRACK_NUMBER, 1),
+            element(TRACK_UID, 1),
+            element(TRACK_TYPE, 1),
+            element(CODEC_ID, b'V_UNCOMPRESSED'),
+            video,
+        ])))
+        self._write(header + _id(SEGMENT) + UNKNOWN_SIZE + info + tracks)
+
+    def timestamp(self, seconds):
+        """Convert seconds to stream timestamp units"""
+        return int(round(seconds * 1e9 / self.timestamp_scale_ns))
+
+    def write_frame(self, frame, timestamp):
+        """Write one frame at `timestamp` stream units (see timestamp())"""
+        if self._cluster is None or not 0 <= timestamp - self._cluster <= self.cluster_span:
+            self._cluster = timestamp
+            self._write(_id(CLUSTER) + UNKNOWN_SIZE + element(CLUSTER_TIMESTAMP, timestamp))
+        data = memoryview(frame).cast('B')
+        # Track 1, relative timestamp, keyframe flag
+        block_header = b'\x81' + struct.pack('>hB', timestamp - self._cluster, KEYFRAME)
+        self._write(_id(SIMPLE_BLOCK) + _size(len(block_header) + len(data)) + block_header)
+        self._write(data)
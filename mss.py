@@ -1,30 +1,111 @@
 import mss
 import sounddevice as sd
-import soundfile as sf
 import numpy as np
-import cv2
+import queue
+import shutil
 import time
 import threading
 from pathlib import Path
-import subprocess
+
+from audio_buffer import AudioFileWriter
+from capture_target import CaptureArea, default_target_ops
+from encoders import FFmpegPipeEncoder, StreamingVideoEncoder
+from recording_clock import AudioClockSync, FrameTicker, RecordingClock, TickStats
 
 class ScreenRecorder:
-    def __init__(self):
+    def __init__(self, target=None, sct=None):
         self.recording = False
-        self.frames = []
-        self.audio_frames = []
-        self.sct = mss.mss()
+        # Optional CaptureTarget; the whole virtual desktop otherwise
+        self.target = target
+        self.area = None
+        # Region grabbed when there is no target
+        self.monitor = None
+        self.frame_count = 0
+        self.audio_chunks = 0
+        self.encoder = None
+        self.output_path = None
+        # Without ffmpeg the audio goes to its own WAV file
+        self.audio_path = None
+        self.audio_writer = None
+        self.audio_queue = queue.Queue()
+        self.clock = RecordingClock()
+        self.audio_sync = None
+        self.start_time = None
+        self.capture_stats = None
+        # Seconds from each tick to its frame being queued for encoding
+        self.capture_latency = None
+        self._stop_event = threading.Event()
+        # An mss instance, or anything with its monitors and grab()
+        self.sct = sct if sct is not None else mss.mss()
+        # sd.InputStream or a stand-in with its signature
+        self.input_stream = sd.InputStream
         self.sample_rate = 44100
         self.fps = 30.0
         self.frame_time = 1/self.fps
+        # Memory budget for frames waiting to be encoded and what to do
+        # when it is full: 'drop_newest', 'drop_oldest' or 'block'
+        self.frame_buffer_bytes = 256 * 1024 * 1024
+        self.drop_policy = 'drop_newest'
+        # Encoder settings by name, see encoding_profiles
+        self.encoding_profile = 'archival'
         
     def start_recording(self):
         """Start both screen and audio recording"""
         try:
             print("Initializing recording...")
+            self.frame_count = 0
+            self.audio_chunks = 0
+            
+            # Encode and mux in a single ffmpeg pass while recording
+            if self.target is not None:
+                self.area = CaptureArea(self.target, default_target_ops(mss))
+                width, height = self.area.width, self.area.height
+            else:
+                # The encoder needs even dimensions, as CaptureArea rounds them
+                self.monitor = dict(self.sct.monitors[0])
+                self.monitor["width"] -= self.monitor["width"] % 2
+                self.monitor["height"] -= self.monitor["height"] % 2
+                width, height = self.monitor["width"], self.monitor["height"]
+            output_dir = Path("recordings")
+            output_dir.mkdir(exist_ok=True)
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            self.output_path = output_dir / f"recording_{timestamp}.mp4"
+            if shutil.which('ffmpeg'):
+                self.audio_writer = None
+                self.encoder = FFmpegPipeEncoder(
+                    self.output_path,
+                    width,
+                    height,
+                    fps=self.fps,
+                    input_format='bgra',
+                    buffer_bytes=self.frame_buffer_bytes,
+                    drop_policy=self.drop_policy,
+                    time_map=self._media_time,
+                    profile=self.encoding_profile,
+                    audio_rate=self.sample_rate
+                )
+            else:
+                # OpenCV writes the video; the audio is kept next to it
+                print("ffmpeg not found; saving video with OpenCV and audio separately")
+                self.audio_path = self.output_path.with_suffix('.wav')
+                self.audio_writer = AudioFileWriter(self.audio_path, self.sample_rate, 2)
+                self.encoder = StreamingVideoEncoder(
+                    self.output_path,
+                    width,
+                    height,
+                    fps=self.fps,
+                    input_format='bgra',
+                    buffer_bytes=self.frame_buffer_bytes,
+                    drop_policy=self.drop_policy,
+                    time_map=self._media_time,
+                    profile=self.encoding_profile
+                )
+            self.encoder.start()
+            
             self.recording = True
-            self.frames = []
-            self.audio_frames = []
+            self._stop_event.clear()
+            self.start_time = self.clock.start()
+            self.audio_sync = AudioClockSync(self.sample_rate, self.clock)
             
             # Start audio recording
             self.audio_thread = threading.Thread(target=self._record_audio)
@@ -47,6 +128,7 @@ class ScreenRecorder:
         """Stop recording and save the video"""
         print("Stopping recording...")
         self.recording = False
+        self._stop_event.set()
         
         # Wait for threads to finish
         if hasattr(self, 'screen_thread'):
@@ -59,33 +141,26 @@ class ScreenRecorder:
     def _record_screen(self):
         """Record screen frames"""
         try:
-            # Get the primary monitor
-            monitor = self.sct.monitors[0]
-            
-            last_frame_time = time.time()
-            frame_count = 0
+            ticker = FrameTicker(self.frame_time, self._stop_event)
+            self.capture_stats = ticker.stats
+            self.capture_latency = TickStats()
             
-            while self.recording:
-                current_time = time.time()
-                elapsed = current_time - last_frame_time
+            while ticker.wait():
+                current_time = self.clock.now()
                 
-                if elapsed >= self.frame_time:
-                    # Capture screen
-                    screenshot = self.sct.grab(monitor)
-                    frame = np.array(screenshot)
-                    
-                    # Convert from BGRA to BGR
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-                    self.frames.append(frame)
-                    
-                    frame_count += 1
-                    last_frame_time = current_time
-                    
-                    if frame_count % 30 == 0:  # Log every 30 frames
-                        print(f"Captured {frame_count} frames")
+                # Capture screen; the BGRA pixels go to ffmpeg unconverted
+                if self.area is not None:
+                    screenshot = self.sct.grab(self.area.update()._asdict())
+                    frame = self.area.fit(np.asarray(screenshot))
                 else:
-                    # Sleep for a short time to prevent CPU overuse
-                    time.sleep(max(0, self.frame_time - elapsed))
+                    frame = np.asarray(self.sct.grab(self.monitor))
+                self.encoder.write(frame, current_time - self.start_time)
+                self.capture_latency.record(self.clock.now() - current_time)
+                
+                self.frame_count += 1
+                
+                if self.frame_count % 30 == 0:  # Log every 30 frames
+                    print(f"Captured {self.frame_count} frames")
                     
         except Exception as e:
             print(f"Error in screen recording: {e}")
@@ -95,7 +170,7 @@ class ScreenRecorder:
         """Record audio"""
         try:
             # Configure audio stream
-            stream = sd.InputStream(
+            stream = self.input_stream(
                 channels=2,
                 samplerate=self.sample_rate,
                 blocksize=int(self.sample_rate * self.frame_time),  # Match video frame time
@@ -104,96 +179,73 @@ class ScreenRecorder:
             
             print("Starting audio stream...")
             with stream:
-                while self.recording:
-                    time.sleep(0.1)
+                # Audio for a separate file is written here, off the callback
+                while not self._stop_event.wait(0.1):
+                    self._drain_audio()
+            self._drain_audio()
                     
         except Exception as e:
             print(f"Error in audio recording: {e}")
+
+    def _write_audio(self, block):
+        if self.audio_writer is None:
+            self.encoder.write_audio(block)
+        else:
+            self.audio_queue.put(block.copy())
+
+    def _drain_audio(self):
+        while True:
+            try:
+                block = self.audio_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.audio_writer.write(block)
             
     def _audio_callback(self, indata, frames, time_info, status):
         """Callback for audio recording"""
+        self.audio_sync.observe(frames, time_info.inputBufferAdcTime, time_info.currentTime)
         if status:
             print(f"Audio status: {status}")
         if self.recording:
-            self.audio_frames.append(indata.copy())
+            if self.audio_sync.pad_start is None:
+                # Start the audio with silence up to its first sample's time
+                lead = self.audio_sync.leading_frames()
+                if lead > 0:
+                    self._write_audio(np.zeros((lead, indata.shape[1]), dtype=np.float32))
+                indata = indata[max(0, -lead):]
+            self._write_audio(indata)
+            self.audio_chunks += 1
+
+    def _media_time(self, timestamp):
+        """Place video timestamps on the audio device's clock"""
+        if self.audio_sync is None:
+            return timestamp
+        return self.audio_sync.media_time(timestamp)
             
     def _save_recording(self):
-        """Save the recording with audio"""
+        """Finalize the single-pass recording"""
         try:
-            if not self.frames:
-                print("No frames captured!")
+            if self.encoder is None:
                 return None, None
                 
-            print(f"Saving recording... ({len(self.frames)} frames, {len(self.audio_frames)} audio chunks)")
-                
-            # Create output directory
-            output_dir = Path("recordings")
-            output_dir.mkdir(exist_ok=True)
-            
-            # Generate output paths
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            temp_video = output_dir / f"temp_{timestamp}.mp4"
-            temp_audio = output_dir / f"temp_{timestamp}.wav"
-            final_video = output_dir / f"recording_{timestamp}.mp4"
-            
-            # Save video
-            height, width = self.frames[0].shape[:2]
-            video_writer = cv2.VideoWriter(
-                str(temp_video),
-                cv2.VideoWriter_fourcc(*'mp4v'),
-                self.fps,
-                (width, height)
-            )
-            
-            for frame in self.frames:
-                video_writer.write(frame)
-            video_writer.release()
-            
-            print("Video saved temporarily")
-            
-            # Save audio if we have any
-            have_audio = False
-            if self.audio_frames:
-                try:
-                    audio_data = np.concatenate(self.audio_frames, axis=0)
-                    sf.write(str(temp_audio), audio_data, self.sample_rate)
-                    have_audio = True
-                    print("Audio saved temporarily")
-                except Exception as e:
-                    print(f"Error saving audio: {e}")
-            
-            # Combine video and audio if we have both
-            if have_audio:
-                try:
-                    command = [
-                        'ffmpeg', '-y',
-                        '-i', str(temp_video),
-                        '-i', str(temp_audio),
-                        '-c:v', 'copy',
-                        '-c:a', 'aac',
-                        str(final_video)
-                    ]
-                    subprocess.run(command, check=True, capture_output=True)
-                    print("Video and audio combined")
-                except Exception as e:
-                    print(f"Error combining video and audio: {e}")
-                    # If combining fails, just use the video
-                    temp_video.rename(final_video)
-            else:
-                # If no audio, just rename the video file
-                temp_video.rename(final_video)
-            
-            # Cleanup
-            try:
-                if temp_video.exists():
-                    temp_video.unlink()
-                if temp_audio.exists():
-                    temp_audio.unlink()
-            except Exception as e:
-                print(f"Error cleaning up temporary files: {e}")
+            print(f"Saving recording... ({self.frame_count} frames, {self.audio_chunks} audio chunks)")
+            if self.capture_stats is not None:
+                print(f"Capture timing: {self.capture_stats.summary()}")
+            if self.audio_sync is not None:
+                print(f"Audio clock: {self.audio_sync.summary()}")
+            frames_written = self.encoder.close()
+            self.encoder = None
+            if self.audio_writer is not None:
+                self.audio_writer.close()
+                self.audio_writer = None
+                print(f"Audio saved to: {self.audio_path}")
+            
+            if not frames_written:
+                print("No frames captured!")
+                return None, None
             
-            print(f"Recording saved to: {final_video}")
-            return str(final_video), None
+            print(f"Recording saved to: {self.output_path}")
+            return str(self.output_path), None
             
         except Exception as e:
             print(f"Error saving recording: {e}")
@@ -0,0 +1,193 @@
+"""Encode a recording in parallel chunks on a pool of worker processes.
+
+The encoder thread places frames on the constant frame rate grid as
+StreamingVideoEncoder does, but instead of encoding them itself it copies
+them into shared memory blocks of `chunk_frames` frames. Each full block
+is encoded by a worker process into its own file; only the block's name
+and shape cross the process boundary, never the pixels. Chunks hold whole
+GOPs, so each one starts on a keyframe exactly where a single-pass encode
+would have put one, and ffmpeg's concat demuxer joins them without
+re-encoding.
+"""
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from encoders import PIXEL_FORMATS, StreamingVideoEncoder, to_bgr
+from sessions import concat_media
+
+# Keyframe interval of OpenCV's mp4v writer (ffmpeg's MPEG-4 default)
+MP4V_GOP = 12
+
+
+def encode_chunk(shm_name, shape, count, path, fps, input_format, fourcc='mp4v'):
+    """Worker: encode the first `count` frames of a shared memory block to `path`"""
+    block = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray((count,) + tuple(shape), dtype=np.uint8, buffer=block.buf)
+        height, width = shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+        if not writer.isOpened():
+            raise IOError(f"Could not open video writer for {path}")
+        converted = None
+        if PIXEL_FORMATS[input_format][1] is not None:
+            converted = np.empty((height, width, 3), dtype=np.uint8)
+        for frame in frames:
+            writer.write(to_bgr(frame, input_format, dst=converted))
+        writer.release()
+        del frames
+    finally:
+        block.close()
+    return path, count
+
+
+class ParallelChunkEncoder(StreamingVideoEncoder):
+    """StreamingVideoEncoder that fans chunks of frames out to worker processes.
+
+    Chunks are `chunk_frames` long, rounded up to whole GOPs of `gop`
+    frames; by default as long as `chunk_budget_bytes` allows with one
+    block per worker plus one being filled. Every requested worker is
+    used; past the budget the chunks stay one GOP long. When every block is busy the
+    encoder thread waits for the oldest chunk, so the frame store's drop
+    policy still applies if all workers fall behind. Colour conversion
+    happens in the workers.
+
+    Without `segment_seconds` the chunks go to a temporary directory and are
+    concatenated into `path` on close. With it, `path` is a session segment
+    pattern and every chunk is written as a segment for the session to
+    stitch, so `segment_seconds` only enables that mode.
+    """
+    def __init__(self, path, width, height, fps=30, input_format='bgr',
+                 buffer_bytes=256 * 1024 * 1024, drop_policy='drop_newest',
+                 spill_path=None, segment_seconds=None, time_map=None, profile=None,
+                 workers=None, chunk_frames=None, chunk_budget_bytes=1024 * 1024 * 1024,
+                 gop=MP4V_GOP):
+        super().__init__(path, width, height, fps=fps, input_format=input_format,
+                         buffer_bytes=buffer_bytes, drop_policy=drop_policy,
+                         spill_path=spill_path, segment_seconds=segment_seconds,
+                         time_map=time_map, profile=profile)
+        # Chunk boundaries replace the base class's segment rotation
+        self.segment_frames = None
+        self.frame_shape = (height, width, PIXEL_FORMATS[input_format][0])
+        frame_bytes = int(np.prod(self.frame_shape))
+        gop_bytes = gop * frame_bytes
+
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # One block per worker plus the one being filled share the budget;
+        # the chunks shrink as the frames grow, but never below one GOP
+        if chunk_frames is None:
+            chunk_frames = chunk_budget_bytes // ((self.workers + 1) * frame_bytes)
+            if (self.workers + 1) * gop_bytes > chunk_budget_bytes:
+                print(f"Warning: {self.workers} workers need "
+                      f"{(self.workers + 1) * gop_bytes // 2**20} MiB of chunk blocks at "
+                      f"{width}x{height}, over the {chunk_budget_bytes // 2**20} MiB budget")
+        self.chunk_frames = max(1, math.ceil(chunk_frames / gop)) * gop
+        self.chunks_encoded = 0
+        self._pool = None
+        self._blocks = []
+        self._free = []
+        self._pending = []
+        self._block = None
+        self._fill = 0
+        self._chunk_paths = []
+        self._chunk_dir = None
+
+    def _open_output(self):
+        # Spawned workers behave the same on every platform and do not
+        # inherit the recorder's threads
+        self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                         mp_context=multiprocessing.get_context('spawn'))
+        # Start the workers now rather than on the first chunk of the recording
+        for _ in range(self.workers):
+            self._pool.submit(int)
+        if self.segment_seconds is None:
+            self._chunk_dir = tempfile.mkdtemp(prefix='chunks_', dir=Path(self.path).parent)
+
+    def _start_segment(self):
+        pass
+
+    def _prepare(self, frame):
+        # Stored frames go to the workers in their native format
+        return frame
+
+    def _chunk_path(self, index):
+        if self.segment_seconds is not None:
+            return self.path % index
+        return os.path.join(self._chunk_dir, f"chunk_{index:05d}.mp4")
+
+    def _acquire_block(self):
+        if not self._free:
+            if len(self._blocks) <= self.workers:
+                size = self.chunk_frames * int(np.prod(self.frame_shape))
+                block = shared_memory.SharedMemory(create=True, size=size)
+                self._blocks.append(block)
+                self._free.append(block)
+            else:
+                self._collect_oldest()
+        block = self._free.pop()
+        frames = np.ndarray((self.chunk_frames,) + self.frame_shape, dtype=np.uint8,
+                            buffer=block.buf)
+        return block, frames
+
+    def _collect_oldest(self):
+        future, block, path = self._pending.pop(0)
+        try:
+            future.result()
+            self.chunks_encoded += 1
+        except Exception as e:
+            print(f"Error encoding chunk {path}: {e}")
+        finally:
+            self._free.append(block)
+
+    def _write_frame(self, frame):
+        if self._block is None:
+            self._block = self._acquire_block()
+            self._fill = 0
+        np.copyto(self._block[1][self._fill], frame)
+        self._fill += 1
+        if self._fill == self.chunk_frames:
+            self._submit()
+
+    def _submit(self):
+        block, frames = self._block
+        self._block = None
+        # Views must not outlive the block once it is unlinked
+        del frames
+        path = self._chunk_path(len(self._chunk_paths))
+        self._chunk_paths.append(path)
+        future = self._pool.submit(encode_chunk, block.name, self.frame_shape, self._fill,
+                                   path, self.fps, self.input_format, self.profile.fourcc)
+        self._pending.append((future, block, path))
+
+    def _close_output(self):
+        try:
+            if self._block is not None and self._fill:
+                self._submit()
+            while self._pending:
+                self._collect_oldest()
+        finally:
+            self._block = None
+            self._pool.shutdown()
+            for block in self._blocks:
+                block.close()
+                block.unlink()
+            self._blocks = []
+            self._free = []
+        self.segment_paths = list(self._chunk_paths)
+
+        if self._chunk_dir is None:
+            return
+        try:
+            if self._chunk_paths:
+                concat_media(self._chunk_paths, None, self.path, self._chunk_dir, 'mp4')
+        finally:
+            shutil.rmtree(self._chunk_dir, ignore_errors=True)
+            self._chunk_dir = None
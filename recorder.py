@@ -1,7 +1,6 @@
 import cv2
 import numpy as np
 import time
-import json
 from datetime import datetime
 import threading
 import platform
@@ -10,46 +9,169 @@ import mouse
 import keyboard
 import sounddevice as sd
 import subprocess
+import shutil
+import queue
 from PIL import Image
 import pystray
 import sys
+from collections import deque
 from pathlib import Path
-from scipy.io import wavfile
+
+from analysis_proxy import AnalysisProxy
+from audio_buffer import AudioChunkBuffer, AudioFileWriter
+from capture_target import CaptureArea, Region, StaticTargetOps, default_target_ops, parse_capture_target
+from encoders import StreamingVideoEncoder, FFmpegPipeEncoder, to_bgr
+from frame_delta import ChangeDetector, DeltaFrameStore
+from frame_scheduler import AdaptiveFrameScheduler
+from gdi_capture import GdiCaptureSession
+from element_resolver import ElementResolver, default_element_ops
+from interaction_log import (BUTTON_CODES, ELEMENT, ELEMENT_SEPARATOR, KEYPRESS, MOUSE_BUTTON_EVENTS,
+                             MOUSE_DOWN, MOUSE_MOVE, SCROLL, UNKNOWN_BUTTON, WHEEL_DELTA,
+                             InteractionLog, export_log_json)
+from keyframes import KeyframeExtractor
+from parallel_encoder import ParallelChunkEncoder
+from recording_clock import AudioClockSync, FrameTicker, RecordingClock, TickStats
+from recording_paths import proxy_path_for
+from sessions import RecordingSession
 
 # Platform specific imports
 if platform.system() == 'Windows':
-    import win32gui
-    import win32ui
     import win32con
     import win32api
     from ctypes import windll
     from win32api import GetSystemMetrics
 elif platform.system() == 'Darwin':  # macOS
-    from Quartz import (CGWindowListCreateImage, CGRectInfinite,
+    from Quartz import (CGWindowListCreateImage, CGRectInfinite, CGRectMake,
+                       CGImageGetWidth, CGImageGetHeight, CGImageGetBytesPerRow,
                        kCGWindowListOptionOnScreenOnly, kCGNullWindowID)
     from CoreFoundation import CFRelease
     import Cocoa
     import AppKit
 
+
+def _import_mss_package():
+    """Import python-mss even though this repo's mss.py shadows the name"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    module = sys.modules.get('mss')
+    if module is not None and not hasattr(module, 'ScreenShotError'):
+        del sys.modules['mss']
+
+    original_path = sys.path[:]
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != here]
+    try:
+        import mss as mss_package
+    finally:
+        sys.path[:] = original_path
+    return mss_package
+
+
+# Registered capture backends by name
+SCREEN_BACKENDS = {}
+
+
+def register_screen_backend(name, *systems):
+    """Class decorator that registers a ScreenRecorder backend.
+
+    `systems` are the platform.system() values the backend is the default
+    for; backends without any can only be selected by name.
+    """
+    def decorator(cls):
+        cls.backend_name = name
+        cls.systems = systems
+        SCREEN_BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def create_screen_recorder(backend=None, **options):
+    """Create the named capture backend, or the default one for this platform"""
+    if backend is None:
+        system = platform.system()
+        for name, cls in SCREEN_BACKENDS.items():
+            if system in cls.systems:
+                backend = name
+                break
+        else:
+            raise NotImplementedError(f"Platform {system} not supported")
+
+    if backend not in SCREEN_BACKENDS:
+        raise ValueError(f"Unknown capture backend '{backend}'. "
+                         f"Available: {', '.join(SCREEN_BACKENDS)}")
+    return SCREEN_BACKENDS[backend](**options)
+
+
 class ScreenRecorder:
-    """Base class for screen recording functionality"""
-    def __init__(self):
+    """Base class for screen recording functionality.
+
+    With a capture `target` (see capture_target) only that monitor,
+    rectangle or window is captured; `area` then holds its CaptureArea and
+    width/height are the target's size instead of the screen's.
+    """
+    backend_name = None
+    systems = ()
+    # Channel layout of the arrays returned by capture_raw()
+    pixel_format = 'bgr'
+
+    def __init__(self, target=None):
         self.width = 0
         self.height = 0
+        self.target = target
+        self.area = None
         self.initialize_dimensions()
 
+    def _init_area(self, ops):
+        """Resolve the capture target and size the frames to it"""
+        self.area = CaptureArea(self.target, ops)
+        self.width = self.area.width
+        self.height = self.area.height
+        region = self.area.region
+        print(f"Capture target: {self.width}x{self.height} at ({region.left}, {region.top})")
+
+    def to_capture(self, x, y):
+        """Map desktop coordinates (as seen by input hooks) into the frame"""
+        if self.area is None:
+            return x, y
+        return self.area.to_capture(x, y)
+
     def initialize_dimensions(self):
         raise NotImplementedError("Subclasses must implement initialize_dimensions")
 
+    def capture_raw(self):
+        """Capture a frame in the backend's native pixel_format.
+
+        The returned array may be a buffer that the next capture overwrites.
+        """
+        raise NotImplementedError("Subclasses must implement capture_raw")
+
     def capture_screen(self):
-        raise NotImplementedError("Subclasses must implement capture_screen")
+        """Capture a frame as a new BGR array"""
+        frame = self.capture_raw()
+        if frame is None:
+            return None
+        converted = to_bgr(frame, self.pixel_format)
+        return converted.copy() if converted is frame else converted
 
+    def close(self):
+        """Release capture resources held between frames"""
+        pass
+
+@register_screen_backend('gdi', 'Windows')
 class WindowsScreenRecorder(ScreenRecorder):
     """Windows-specific screen recorder implementation"""
+    pixel_format = 'bgra'
+
+    def __init__(self, target=None):
+        self.session = None
+        super().__init__(target)
+
     def initialize_dimensions(self):
         try:
             # Set DPI awareness
             windll.user32.SetProcessDPIAware()
+
+            if self.target is not None:
+                self._init_area(default_target_ops())
+                return
             
             # Get screen dimensions
             self.width = GetSystemMetrics(win32con.SM_CXSCREEN)
@@ -64,46 +186,43 @@ class WindowsScreenRecorder(ScreenRecorder):
             print(f"Error initializing Windows screen recorder: {e}")
             raise
 
-    def capture_screen(self):
+    def capture_raw(self):
         try:
-            # Get handle to desktop window
-            hwnd = win32gui.GetDesktopWindow()
-            
-            # Create device contexts and bitmap
-            window_dc = win32gui.GetWindowDC(hwnd)
-            img_dc = win32ui.CreateDCFromHandle(window_dc)
-            mem_dc = img_dc.CreateCompatibleDC()
-            
-            screenshot = win32ui.CreateBitmap()
-            screenshot.CreateCompatibleBitmap(img_dc, self.width, self.height)
-            mem_dc.SelectObject(screenshot)
-            
-            # Copy screen to bitmap
-            mem_dc.BitBlt((0, 0), (self.width, self.height), 
-                         img_dc, (0, 0), win32con.SRCCOPY)
-            
-            # Convert bitmap to numpy array
-            bmp_str = screenshot.GetBitmapBits(True)
-            img = np.frombuffer(bmp_str, dtype='uint8')
-            img.shape = (self.height, self.width, 4)
-            
-            # Cleanup
-            mem_dc.DeleteDC()
-            win32gui.DeleteObject(screenshot.GetHandle())
-            img_dc.DeleteDC()
-            win32gui.ReleaseDC(hwnd, window_dc)
-            
-            # Convert from BGRA to BGR
-            return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            # DCs and the DIB section are allocated once and reused; the
+            # BGRA view is converted later by the encoder stage
+            if self.area is not None:
+                region = self.area.update()
+                if self.session is None:
+                    self.session = GdiCaptureSession(region.width, region.height,
+                                                     region.left, region.top)
+                else:
+                    self.session.resize(region.width, region.height, region.left, region.top)
+                return self.area.fit(self.session.grab())
+            if self.session is None:
+                self.session = GdiCaptureSession(self.width, self.height)
+            return self.session.grab()
             
         except Exception as e:
             print(f"Error capturing screen on Windows: {e}")
             return None
 
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+@register_screen_backend('quartz', 'Darwin')
 class MacScreenRecorder(ScreenRecorder):
     """macOS-specific screen recorder implementation"""
+    pixel_format = 'rgba'
+
     def initialize_dimensions(self):
         try:
+            if self.target is not None:
+                # Quartz resolves displays and windows; mss is Linux-only here
+                self._init_area(default_target_ops())
+                return
+
             # Get main screen dimensions
             screen = Cocoa.NSScreen.mainScreen()
             frame = screen.frame()
@@ -119,7 +238,9 @@ class MacScreenRecorder(ScreenRecorder):
             print(f"Error initializing macOS screen recorder: {e}")
             raise
 
-    def capture_screen(self):
+    def capture_raw(self):
+        if self.area is not None:
+            return self._capture_area()
         try:
             # Capture screen content
             screenshot = CGWindowListCreateImage(
@@ -145,157 +266,497 @@ class MacScreenRecorder(ScreenRecorder):
                 # Release CoreFoundation objects
                 CFRelease(screenshot)
                 
-                # Convert RGBA to BGR
-                return cv2.cvtColor(array, cv2.COLOR_RGBA2BGR)
+                # RGBA is converted later by the encoder stage
+                return array
                 
         except Exception as e:
             print(f"Error capturing screen on macOS: {e}")
             return None
 
+    def _capture_area(self):
+        try:
+            region = self.area.update()
+            screenshot = CGWindowListCreateImage(
+                CGRectMake(region.left, region.top, region.width, region.height),
+                kCGWindowListOptionOnScreenOnly,
+                kCGNullWindowID,
+                0
+            )
+            if not screenshot:
+                return None
+            width = CGImageGetWidth(screenshot)
+            height = CGImageGetHeight(screenshot)
+            row_bytes = CGImageGetBytesPerRow(screenshot)
+            data = screenshot.dataProvider().data()
+            # Rows may be padded; drop the padding with a strided view
+            array = np.frombuffer(data, dtype=np.uint8).reshape((height, row_bytes // 4, 4))[:, :width]
+            CFRelease(screenshot)
+            return self.area.fit(array)
+        except Exception as e:
+            print(f"Error capturing screen on macOS: {e}")
+            return None
+
+@register_screen_backend('mss', 'Linux')
+class LinuxScreenRecorder(ScreenRecorder):
+    """X11 screen recorder using python-mss (XShm where available)"""
+    pixel_format = 'bgra'
+
+    def __init__(self, monitor=1, target=None):
+        self.monitor_index = monitor
+        self.monitor = None
+        self._mss = _import_mss_package()
+        # mss handles are bound to the thread that created them
+        self._local = threading.local()
+        super().__init__(target)
+
+    def initialize_dimensions(self):
+        try:
+            if self.target is not None:
+                self._init_area(default_target_ops(self._mss))
+                return
+
+            with self._mss.mss() as sct:
+                monitor = sct.monitors[self.monitor_index]
+            
+            # Ensure even dimensions for video encoding
+            self.width = monitor["width"] - (monitor["width"] % 2)
+            self.height = monitor["height"] - (monitor["height"] % 2)
+            self.monitor = {
+                "left": monitor["left"],
+                "top": monitor["top"],
+                "width": self.width,
+                "height": self.height,
+            }
+            
+            print(f"Linux screen dimensions: {self.width}x{self.height}")
+        except Exception as e:
+            print(f"Error initializing Linux screen recorder: {e}")
+            raise
+
+    def capture_raw(self):
+        try:
+            sct = getattr(self._local, 'sct', None)
+            if sct is None:
+                sct = self._local.sct = self._mss.mss()
+            
+            if self.area is not None:
+                return self.area.fit(np.asarray(sct.grab(self.area.update()._asdict())))
+
+            # Zero-copy BGRA view of the grabbed pixels
+            return np.asarray(sct.grab(self.monitor))
+            
+        except Exception as e:
+            print(f"Error capturing screen on Linux: {e}")
+            return None
+
+@register_screen_backend('synthetic')
+class SyntheticScreenRecorder(ScreenRecorder):
+    """Deterministic frame source for headless benchmarks and regression tests.
+
+    Replays `source` (a video file, looped) when given, otherwise generates
+    `pattern`: 'static' (never changes), 'moving_box' (a small region
+    changes every frame, like a typical business UI) or 'noise' (every
+    pixel changes, the worst case). Frames depend only on the frame index.
+    The generated frame is the whole desktop; capture targets are resolved
+    against `target_ops`, by default a single monitor of that size.
+    """
+    PATTERNS = ('static', 'moving_box', 'noise')
+
+    def __init__(self, width=1280, height=720, source=None, pattern='moving_box', seed=0,
+                 target=None, target_ops=None):
+        if source is None and pattern not in self.PATTERNS:
+            raise ValueError(f"Unknown pattern '{pattern}'. Available: {', '.join(self.PATTERNS)}")
+        self.requested_size = (width, height)
+        self.source = source
+        self.pattern = pattern
+        self.seed = seed
+        self.target_ops = target_ops
+        self.frame_index = 0
+        self.desktop_size = None
+        self._capture = None
+        self._background = None
+        super().__init__(target)
+
+    def initialize_dimensions(self):
+        width, height = self.requested_size
+        if self.source is not None:
+            self._capture = cv2.VideoCapture(str(self.source))
+            if not self._capture.isOpened():
+                raise IOError(f"Could not open synthetic source {self.source}")
+            width = int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        self.width = width - (width % 2)
+        self.height = height - (height % 2)
+        self.desktop_size = (self.width, self.height)
+
+        # A light grid that resembles form-based UI screens
+        background = np.full((self.height, self.width, 3), 235, dtype=np.uint8)
+        background[::40, :] = 200
+        background[:, ::160] = 200
+        background[:48, :] = (120, 80, 40)
+        self._background = background
+
+        if self.target is not None:
+            if self.target_ops is None:
+                desktop = Region(0, 0, self.width, self.height)
+                self.target_ops = StaticTargetOps([desktop, desktop])
+            self._init_area(self.target_ops)
+
+    def capture_raw(self):
+        frame = self._generate()
+        if frame is None or self.area is None:
+            return frame
+        region = self.area.update()
+        return self.area.fit(frame[region.top:region.top + region.height,
+                                   region.left:region.left + region.width])
+
+    def _generate(self):
+        index = self.frame_index
+        self.frame_index += 1
+        width, height = self.desktop_size
+
+        if self._capture is not None:
+            ok, frame = self._capture.read()
+            if not ok:
+                self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = self._capture.read()
+                if not ok:
+                    return None
+            return np.ascontiguousarray(frame[:height, :width])
+
+        if self.pattern == 'static':
+            return self._background.copy()
+
+        if self.pattern == 'noise':
+            rng = np.random.default_rng((self.seed, index))
+            return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+        frame = self._background.copy()
+        box = 64
+        span_x = max(1, width - box)
+        span_y = max(1, height - box - 48)
+        x = (index * 8) % span_x
+        y = 48 + (index * 3) % span_y
+        frame[y:y + box, x:x + box] = (40, 40, 200)
+        cv2.putText(frame, str(index), (10, 34), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.0, (255, 255, 255), 2)
+        return frame
+
 class AudioRecorder:
-    """Handles audio recording functionality"""
+    """Handles audio recording functionality.
+
+    The PortAudio callback only copies each block into a preallocated
+    AudioChunkBuffer; the recording thread drains filled chunks to the
+    encoder `sink` or streams them to disk as they fill, so memory stays
+    constant and stopping does not depend on the session length.
+
+    Blocks are placed on `clock` (the session's shared clock) by an
+    AudioClockSync; the output starts with silence up to the session time
+    of the first sample, so audio time 0 is session time 0.
+    """
     def __init__(self):
-        self.audio_frames = []
         self.recording = False
         self.sample_rate = 44100
+        self.channels = 2
+        # The session's shared clock; a private one is started if unset
+        self.clock = None
+        self.sync = None
+        # Session time of the first sample, known once audio arrives
         self.start_time = None
+        # Optional encoder that consumes blocks directly instead of a file
+        self.sink = None
+        # Where audio is streamed when there is no sink (.wav or .flac).
+        # With a %05d chunk_pattern a new file starts every chunk_seconds.
+        self.output_path = None
+        self.chunk_pattern = None
+        self.chunk_seconds = 10
+        self.chunk_paths = []
+        # sd.InputStream or a stand-in with its signature, e.g. a synthetic
+        # source for benchmarks
+        self.input_stream = sd.InputStream
+        self.buffer = None
+        self.writer = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._skip_frames = None
 
     def start_recording(self):
         self.recording = True
-        self.audio_frames = []
-        self.start_time = time.time()
+        self.chunk_paths = []
+        clock = self.clock
+        if clock is None:
+            clock = RecordingClock()
+            clock.start()
+        self.sync = AudioClockSync(self.sample_rate, clock)
+        self.start_time = None
+        self._skip_frames = None
+        self._stop_event.clear()
+        # One-second chunks, enough for a few seconds of writer stalls
+        self.buffer = AudioChunkBuffer(self.channels, self.sample_rate)
+        self.writer = None
+        if self.sink is None:
+            if self.chunk_pattern is not None:
+                self.writer = AudioFileWriter(self.chunk_pattern, self.sample_rate, self.channels,
+                                              split_frames=int(self.chunk_seconds * self.sample_rate))
+                self.chunk_paths = self.writer.paths
+            elif self.output_path is not None:
+                self.writer = AudioFileWriter(self.output_path, self.sample_rate, self.channels)
         
         # Start audio recording thread
-        threading.Thread(target=self._record_audio, daemon=True).start()
+        self._thread = threading.Thread(target=self._record_audio, daemon=True)
+        self._thread.start()
 
     def stop_recording(self):
         self.recording = False
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
     def _record_audio(self):
         try:
-            with sd.InputStream(channels=2, callback=self._audio_callback,
-                              samplerate=self.sample_rate,
-                              blocksize=int(self.sample_rate/10)):  # 100ms blocks
-                while self.recording:
-                    time.sleep(0.001)  # Tiny sleep to prevent CPU overuse
+            with self.input_stream(channels=self.channels, callback=self._audio_callback,
+                                   samplerate=self.sample_rate,
+                                   blocksize=int(self.sample_rate/10)):  # 100ms blocks
+                # The stream runs on PortAudio's thread; drain what it buffered
+                while not self._stop_event.wait(0.25):
+                    self._drain()
         except Exception as e:
             print(f"Error recording audio: {e}")
 
+        self.buffer.finish()
+        self._drain()
+        if self.writer is not None:
+            self.writer.close()
+        if self.buffer.dropped_frames:
+            print(f"Audio buffer overflow: dropped {self.buffer.dropped_frames} frames")
+
+    def _drain(self):
+        try:
+            for block in self.buffer.drain():
+                if self._skip_frames is None:
+                    self._align_start()
+                if self._skip_frames:
+                    skip = min(self._skip_frames, len(block))
+                    block = block[skip:]
+                    self._skip_frames -= skip
+                if len(block):
+                    self._write(block)
+        except Exception as e:
+            print(f"Error writing audio: {e}")
+
+    def _write(self, block):
+        if self.sink is not None:
+            self.sink.write_audio(block)
+        elif self.writer is not None:
+            self.writer.write(block)
+
+    def _align_start(self):
+        """Pad with silence so the first sample plays at its session time"""
+        frames = self.sync.leading_frames()
+        self.start_time = self.sync.pad_start
+        self._skip_frames = max(0, -frames)
+        silence = np.zeros((min(max(frames, 0), self.sample_rate), self.channels), dtype=np.float32)
+        while frames > 0:
+            count = min(frames, len(silence))
+            self._write(silence[:count])
+            frames -= count
 
+    def media_time(self, timestamp):
+        """Map a session timestamp onto the audio timeline (for video encoders)"""
+        sync = self.sync
+        return timestamp if sync is None else sync.media_time(timestamp)
 
-    def _audio_callback(self, indata, frames, time, status):
+    def _audio_callback(self, indata, frames, time_info, status):
+        self.sync.observe(frames, time_info.inputBufferAdcTime, time_info.currentTime)
         if status:
             print(status)
-        self.audio_frames.append(indata.copy())
+        self.buffer.write(indata)
 
     def save_audio(self, filename):
-        if not self.audio_frames:
-            return False
-            
-        try:
-            audio_data = np.concatenate(self.audio_frames, axis=0)
-            wavfile.write(filename, self.sample_rate, audio_data)
-            return True
-        except Exception as e:
-            print(f"Error saving audio: {e}")
+        """Audio is streamed while recording; report whether it reached `filename`"""
+        if self.writer is None or not self.writer.frames_written:
             return False
+        return str(filename) in self.writer.paths
+
+class SystemInputHooks:
+    """OS-wide mouse and keyboard hooks from the mouse and keyboard packages"""
+    def install(self, callback):
+        mouse.hook(callback)
+        keyboard.hook(callback)
+
+    def remove(self):
+        mouse.unhook_all()
+        keyboard.unhook_all()
+
+    def position(self):
+        return mouse.get_position()
+
 
 class InteractionRecorder:
-    """Records mouse and keyboard interactions"""
+    """Records mouse and keyboard interactions.
+
+    The OS input hooks only timestamp the raw event and hand it to a worker
+    thread through a SimpleQueue; everything else (position tracking,
+    activity notification, UI-element lookup, logging) happens on the
+    worker, so a slow step never becomes input lag for the user being
+    recorded. Clicks are resolved to UI elements in batches, whenever the
+    queue runs empty or `element_batch_size` clicks are pending.
+    """
     def __init__(self):
-        self.interactions = []
-        self.mouse_positions = []
-        self.last_mouse_time = time.time()
-        self.mouse_sample_rate = 0.05  # 50ms
         self.recording = False
+        # Where events come from; synthetic sources replace it in benchmarks
+        self.input_hooks = SystemInputHooks()
+        # Called on every input event, e.g. to raise the capture frame rate
+        self.on_activity = None
+        # Pixel tolerance for simplifying mouse paths on export (None keeps all)
+        self.move_tolerance = 2.0
+        # Binary event log; a temporary file unless a path is given
+        self.log = None
+        # Shared session clock; event times are exported relative to it
+        self.clock = None
+        # Maps desktop coordinates into the captured frame, e.g.
+        # ScreenRecorder.to_capture; None logs desktop coordinates
+        self.coordinate_map = None
+        # Nanoseconds spent in each recent hook call
+        self.hook_durations = deque(maxlen=4096)
+        # Last known pointer position, kept current from move events, and
+        # the last one logged
+        self._position = (0, 0)
+        self._logged_position = None
+        self._events = queue.SimpleQueue()
+        self._worker = None
+        self.element_batch_size = 32
+        self._pending_clicks = []
+        self.element_resolver = None
+        try:
+            ops = default_element_ops()
+            if ops is not None:
+                self.element_resolver = ElementResolver(ops)
+        except Exception as e:
+            print(f"Error initializing element resolver: {e}")
+        self._stop_event = threading.Event()
 
-    def start_recording(self):
+    def start_recording(self, log_path=None):
         self.recording = True
-        self.interactions = []
-        self.mouse_positions = []
+        self._stop_event.clear()
+        self.hook_durations.clear()
+        origin_ns = self.clock.origin_ns if self.clock is not None else None
+        self.log = InteractionLog(log_path, origin_ns=origin_ns)
+        self._position = self.input_hooks.position()
+        self._logged_position = None
+
+        self._worker = threading.Thread(target=self._process_events, daemon=True)
+        self._worker.start()
         
         # Hook mouse and keyboard events
-        mouse.hook(self._mouse_callback)
-        keyboard.hook(self._keyboard_callback)
-        
-        # Start mouse position tracking thread
-        threading.Thread(target=self._track_mouse, daemon=True).start()
+        self.input_hooks.install(self._hook)
 
     def stop_recording(self):
         self.recording = False
-        mouse.unhook_all()
-        keyboard.unhook_all()
+        self._stop_event.set()
+        self.input_hooks.remove()
+        if self._worker is not None:
+            # Drain what the hooks queued before closing the log
+            self._events.put(None)
+            self._worker.join(timeout=2.0)
+            self._worker = None
+        if self.log is not None:
+            # Kept until save_interactions() has exported it
+            self.log.close(keep=True)
 
-    def _mouse_callback(self, event):
-        if not self.recording:
-            return
-            
-        try:
-            if isinstance(event, mouse.ButtonEvent):
-                x, y = mouse.get_position()
-                self.interactions.append({
-                    "timestamp": datetime.now().isoformat(),
-                    "type": f"mouse_{event.event_type}",
-                    "button": event.button,
-                    "position": {"x": x, "y": y}
-                })
-            elif isinstance(event, mouse.WheelEvent):
-                x, y = mouse.get_position()
-                self.interactions.append({
-                    "timestamp": datetime.now().isoformat(),
-                    "type": "scroll",
-                    "direction": "down" if event.delta < 0 else "up",
-                    "position": {"x": x, "y": y}
-                })
-        except Exception as e:
-            print(f"Error in mouse callback: {e}")
+    def _hook(self, event):
+        """Runs on the OS input thread: timestamp, enqueue, return"""
+        start = time.perf_counter_ns()
+        self._events.put((start, event))
+        self.hook_durations.append(time.perf_counter_ns() - start)
 
-    def _keyboard_callback(self, event):
-        if not self.recording:
+    def hook_latency(self):
+        """Percentiles of the time spent in the input hooks, in microseconds"""
+        samples = sorted(self.hook_durations)
+        if not samples:
+            return {"samples": 0}
+        pick = lambda fraction: samples[min(len(samples) - 1, int(fraction * len(samples)))] / 1000
+        return {
+            "samples": len(samples),
+            "p50_us": pick(0.5),
+            "p99_us": pick(0.99),
+            "max_us": samples[-1] / 1000,
+        }
+
+    def _process_events(self):
+        """Enrichment worker: turns queued hook events into log records"""
+        while True:
+            item = self._events.get()
+            if item is None:
+                self._resolve_clicks()
+                break
+            timestamp, event = item
+
+            if self.on_activity is not None:
+                self.on_activity()
+            try:
+                if isinstance(event, keyboard.KeyboardEvent):
+                    self._keyboard_event(event, timestamp)
+                else:
+                    self._mouse_event(event, timestamp)
+            except Exception as e:
+                print(f"Error processing input event: {e}")
+
+            if self._pending_clicks and (self._events.empty() or
+                                         len(self._pending_clicks) >= self.element_batch_size):
+                self._resolve_clicks()
+
+    def _resolve_clicks(self):
+        """Log the UI elements under the pending clicks"""
+        if not self._pending_clicks:
             return
-            
+        clicks, self._pending_clicks = self._pending_clicks, []
+        elements = self.element_resolver.resolve_batch([(x, y) for _, x, y in clicks])
+        for (timestamp, x, y), element in zip(clicks, elements):
+            if element is None:
+                continue
+            text = f"{element['class']}{ELEMENT_SEPARATOR}{element['text']}"
+            # Window handles are 32-bit values even on 64-bit Windows
+            handle = ((element["window_handle"] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            self.log.append(ELEMENT, timestamp, handle, text=text)
+
+    def _frame_position(self):
+        """The pointer position in capture coordinates"""
+        if self.coordinate_map is None:
+            return self._position
+        return self.coordinate_map(*self._position)
+
+    def _mouse_event(self, event, timestamp):
+        if isinstance(event, mouse.MoveEvent):
+            self._position = (event.x, event.y)
+            # Moves are event driven; only log actual position changes
+            if self._position != self._logged_position:
+                self._logged_position = self._position
+                self.log.append(MOUSE_MOVE, timestamp, *self._frame_position())
+        elif isinstance(event, mouse.ButtonEvent):
+            x, y = self._frame_position()
+            event_type = MOUSE_BUTTON_EVENTS[event.event_type]
+            self.log.append(event_type, timestamp, x, y,
+                            detail=BUTTON_CODES.get(event.button, UNKNOWN_BUTTON))
+            if event_type == MOUSE_DOWN and self.element_resolver is not None:
+                # Element lookup works in desktop coordinates
+                self._pending_clicks.append((timestamp, *self._position))
+        elif isinstance(event, mouse.WheelEvent):
+            x, y = self._frame_position()
+            self.log.append(SCROLL, timestamp, x, y, detail=1 if event.delta < 0 else 0,
+                            value=int(round(event.delta * WHEEL_DELTA)))
+
+    def _keyboard_event(self, event, timestamp):
         if event.event_type == keyboard.KEY_DOWN:
-            self.interactions.append({
-                "timestamp": datetime.now().isoformat(),
-                "type": "keypress",
-                "key": event.name
-            })
-
-    def _track_mouse(self):
-        while self.recording:
-            current_time = time.time()
-            if current_time - self.last_mouse_time >= self.mouse_sample_rate:
-                try:
-                    x, y = mouse.get_position()
-                    self.mouse_positions.append({
-                        "timestamp": datetime.now().isoformat(),
-                        "type": "mouse_move",
-                        "position": {"x": x, "y": y}
-                    })
-                    self.last_mouse_time = current_time
-                except Exception as e:
-                    print(f"Error tracking mouse: {e}")
-            time.sleep(0.01)
+            self.log.append(KEYPRESS, timestamp, text=event.name)
 
     def save_interactions(self, filename):
         try:
-            # Combine and sort all interactions
-            all_interactions = sorted(
-                self.interactions + self.mouse_positions,
-                key=lambda x: x['timestamp']
-            )
-            
-            data = {
-                "recording_data": {
-                    "start_time": all_interactions[0]["timestamp"] if all_interactions else None,
-                    "end_time": all_interactions[-1]["timestamp"] if all_interactions else None,
-                    "platform": platform.system(),
-                    "interactions": all_interactions
-                }
-            }
-            
-            with open(filename, 'w') as f:
-                json.dump(data, f, indent=2)
-            
+            export_log_json(self.log.path, filename, move_tolerance=self.move_tolerance)
+            if self.log.temporary:
+                self.log.discard()
             return True
         except Exception as e:
             print(f"Error saving interactions: {e}")
@@ -303,94 +764,314 @@ class InteractionRecorder:
 
 class CrossPlatformScreenRecorder:
     """Main screen recorder class that coordinates all recording functionality"""
-    def __init__(self, app_reference):
+    def __init__(self, app_reference, backend=None, backend_options=None, capture_target=None):
         self.app = app_reference
         self.recording = False
-        self.frames = []
-        self.frame_times = []  # Store frame timestamps
+        self.fps = 30
+        # Mux audio in a single ffmpeg pass when it is available
+        self.encoder_backend = 'ffmpeg' if shutil.which('ffmpeg') else 'opencv'
+        # 'parallel' encodes with OpenCV in chunks on `encoder_workers`
+        # processes (all cores by default); see parallel_encoder
+        self.encoder_workers = None
+        # Encoder settings by name: 'archival', 'analysis', 'low_cpu_live'
+        # or 'lossless' (see encoding_profiles)
+        self.encoding_profile = 'archival'
+        self.encoder = None
+        # Memory budget for frames waiting to be encoded and what to do
+        # when it is full: 'drop_newest', 'drop_oldest' or 'block'
+        self.frame_buffer_bytes = 256 * 1024 * 1024
+        self.drop_policy = 'drop_newest'
+        # Spill the encoder backlog to a memory-mapped file instead of
+        # dropping frames once frame_buffer_bytes is used up
+        self.spill_to_disk = False
+        # Write rolling segments, chunked audio and an interaction log to a
+        # session directory so a crash loses at most one segment; None
+        # keeps everything until stop_recording()
+        self.segment_seconds = 10
+        self.session = None
+        # Only hand changed frames to the encoder (it repeats the previous
+        # frame for the skipped ones) and keep recent frames as tile deltas
+        # in memory, within delta_budget_bytes, for extract_keyframes()
+        self.delta_mode = False
+        self.delta_budget_bytes = 256 * 1024 * 1024
+        self.delta_store = None
+        # Also write a small low frame rate copy for model analysis, in the
+        # same pass (see analysis_proxy)
+        self.analysis_proxy = True
+        self.proxy_fps = 2
+        self.proxy_max_width = 960
+        self.proxy = None
+        # Drop to a low frame rate while idle, burst on input or screen changes
+        self.adaptive_fps = False
+        self.frame_scheduler = None
+        self.change_detector = None
+        self.frame_count = 0
+        self.clock = RecordingClock()
         self.start_time = None
+        self.end_time = None
+        self.screen_thread = None
+        self.capture_stats = None
+        # Seconds from each tick to its frame being queued for encoding
+        self.capture_latency = None
+        self._stop_event = threading.Event()
+        self.session_paths = None
         
-        # Initialize recorders
-        if platform.system() == 'Windows':
-            self.screen_recorder = WindowsScreenRecorder()
-        elif platform.system() == 'Darwin':
-            self.screen_recorder = MacScreenRecorder()
-        else:
-            raise NotImplementedError(f"Platform {platform.system()} not supported")
+        # Initialize recorders. `capture_target` limits the capture to a
+        # monitor, rectangle or window: a CaptureTarget or a spec such as
+        # 'window:Chrome' (see parse_capture_target)
+        backend_options = dict(backend_options or {})
+        if capture_target is not None:
+            if isinstance(capture_target, str):
+                capture_target = parse_capture_target(capture_target)
+            backend_options["target"] = capture_target
+        self.screen_recorder = create_screen_recorder(backend, **backend_options)
             
+        # Video frames, audio blocks and input events share one clock
         self.audio_recorder = AudioRecorder()
+        self.audio_recorder.clock = self.clock
         self.interaction_recorder = InteractionRecorder()
+        self.interaction_recorder.clock = self.clock
+        # Pointer positions are logged in the captured frame's coordinates
+        self.interaction_recorder.coordinate_map = self.screen_recorder.to_capture
         
         # Create output directory
         self.output_dir = Path("recordings")
         self.output_dir.mkdir(exist_ok=True)
 
+    def _frame_interval(self, now):
+        if self.frame_scheduler is None:
+            return 1/self.fps
+        return self.frame_scheduler.interval(now)
+
+    def _frame_changed(self, frame, timestamp):
+        """Return whether the frame differs from the previous one"""
+        if self.delta_store is not None:
+            return self.delta_store.add(frame, timestamp) > 0
+        if self.change_detector is not None:
+            return self.change_detector.changed_tiles(frame) > 0
+        return True
+
     def _record_screen(self):
-        """Record screen frames with timestamps"""
-        frame_interval = 1/30  # Target 30 FPS
-        next_frame_time = time.time()
-
-        while self.recording:
-            current_time = time.time()
-            if current_time >= next_frame_time:
-                frame = self.screen_recorder.capture_screen()
-                if frame is not None:
-                    self.frames.append(frame)
-                    self.frame_times.append(current_time - self.start_time)
-                next_frame_time = current_time + frame_interval
-            else:
-                time.sleep(0.001)
+        """Capture screen frames and hand them to the encoder"""
+        # Re-check the interval at the full frame rate so input activity
+        # cuts an idle wait short
+        ticker = FrameTicker(self._frame_interval, self._stop_event, max_wait=1/self.fps)
+        self.capture_stats = ticker.stats
+        self.capture_latency = TickStats()
+
+        while ticker.wait():
+            current_time = self.clock.now()
+            frame = self.screen_recorder.capture_raw()
+            if frame is not None:
+                timestamp = current_time - self.start_time
+                # Unchanged frames are skipped; the encoder repeats the
+                # previous frame in their slots so timing is preserved
+                if self._frame_changed(frame, timestamp):
+                    self.encoder.write(frame, timestamp)
+                    if self.frame_scheduler is not None:
+                        self.frame_scheduler.notify_activity(current_time)
+                self.frame_count += 1
+                self.capture_latency.record(self.clock.now() - current_time)
+
+    def _create_session_paths(self):
+        """Generate output filenames for a new recording"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        video = self.output_dir / f"recording_{timestamp}.mp4"
+        return {
+            "video": video,
+            "proxy": proxy_path_for(video),
+            "audio": self.output_dir / f"audio_{timestamp}.wav",
+            "interactions": self.output_dir / f"interactions_{timestamp}.json",
+            "spill": self.output_dir / f"frames_{timestamp}.spill",
+            "session": self.output_dir / f"session_{timestamp}",
+        }
+
+    def _use_segments(self):
+        """Segments are stitched with ffmpeg; without it record a single file"""
+        if not self.segment_seconds:
+            return False
+        if not shutil.which('ffmpeg'):
+            print("ffmpeg not found; recording a single file instead of segments")
+            return False
+        return True
+
+    def _create_session(self):
+        """Create the session directory and manifest for segmented output"""
+        return RecordingSession.create(
+            self.session_paths["session"],
+            self.session_paths["video"],
+            self.session_paths["interactions"],
+            fps=self.fps,
+            width=self.screen_recorder.width,
+            height=self.screen_recorder.height,
+            segment_seconds=self.segment_seconds,
+            segment_format='ts' if self.encoder_backend == 'ffmpeg' else 'mp4',
+            move_tolerance=self.interaction_recorder.move_tolerance,
+            pixel_format=self.screen_recorder.pixel_format,
+            profile=self.encoding_profile,
+            proxy={
+                "path": str(Path(self.session_paths["proxy"]).resolve()),
+                "fps": self.proxy_fps,
+                "max_width": self.proxy_max_width,
+                "backend": self.encoder_backend,
+            } if self.analysis_proxy else None
+        )
+
+    def _create_encoder(self):
+        """Create the encoder for the selected backend"""
+        width = self.screen_recorder.width
+        height = self.screen_recorder.height
+        input_format = self.screen_recorder.pixel_format
+        drop_policy = 'spill' if self.spill_to_disk else self.drop_policy
+        spill_path = self.session_paths["spill"] if self.spill_to_disk else None
+
+        if self.session is not None:
+            output = self.session.video_segment_pattern
+            segment_seconds = self.segment_seconds
+        else:
+            output = self.session_paths["video"]
+            segment_seconds = None
+
+        if self.encoder_backend == 'ffmpeg':
+            encoder = FFmpegPipeEncoder(
+                output, width, height, fps=self.fps,
+                input_format=input_format,
+                buffer_bytes=self.frame_buffer_bytes,
+                drop_policy=drop_policy,
+                spill_path=spill_path,
+                segment_seconds=segment_seconds,
+                time_map=self.audio_recorder.media_time,
+                profile=self.encoding_profile,
+                audio_rate=self.audio_recorder.sample_rate,
+                audio_channels=self.audio_recorder.channels
+            )
+            self.audio_recorder.sink = encoder
+            self.audio_recorder.chunk_pattern = None
+            return encoder
+
+        self.audio_recorder.sink = None
+        if self.session is not None:
+            self.audio_recorder.chunk_pattern = self.session.audio_chunk_pattern
+            self.audio_recorder.chunk_seconds = self.segment_seconds
+        else:
+            self.audio_recorder.chunk_pattern = None
+            self.audio_recorder.output_path = self.session_paths["audio"]
+            output = self.session_paths["video"].with_suffix('.temp.mp4')
+        if self.encoder_backend == 'parallel':
+            return ParallelChunkEncoder(output, width, height, fps=self.fps,
+                                        input_format=input_format,
+                                        buffer_bytes=self.frame_buffer_bytes,
+                                        drop_policy=drop_policy,
+                                        spill_path=spill_path,
+                                        segment_seconds=segment_seconds,
+                                        time_map=self.audio_recorder.media_time,
+                                        profile=self.encoding_profile,
+                                        workers=self.encoder_workers)
+        return StreamingVideoEncoder(output, width, height, fps=self.fps,
+                                     input_format=input_format,
+                                     buffer_bytes=self.frame_buffer_bytes,
+                                     drop_policy=drop_policy,
+                                     spill_path=spill_path,
+                                     segment_seconds=segment_seconds,
+                                     time_map=self.audio_recorder.media_time,
+                                     profile=self.encoding_profile)
+
+    def _create_proxy(self):
+        """Attach the analysis proxy to the archival encoder"""
+        if not self.analysis_proxy:
+            return None
+        try:
+            proxy = AnalysisProxy(
+                self.session_paths["proxy"],
+                self.screen_recorder.width,
+                self.screen_recorder.height,
+                input_format=self.screen_recorder.pixel_format,
+                fps=self.proxy_fps,
+                max_width=self.proxy_max_width,
+                backend=self.encoder_backend,
+                time_map=self.audio_recorder.media_time
+            )
+            proxy.start()
+        except Exception as e:
+            print(f"Error starting analysis proxy: {e}")
+            return None
+        self.encoder.taps.append(proxy.offer)
+        return proxy
+
+    def _close_proxy(self):
+        """Finish the proxy; call after the archival encoder has closed"""
+        if self.proxy is None:
+            return
+        try:
+            if self.proxy.close(end_timestamp=self.end_time - self.start_time):
+                print(f"Analysis proxy saved to: {self.proxy.path}")
+        except Exception as e:
+            print(f"Error saving analysis proxy: {e}")
+        self.proxy = None
 
     def start_recording(self):
         """Start all recording processes"""
         try:
+            self.session_paths = self._create_session_paths()
+            self.session = self._create_session() if self._use_segments() else None
+            if self.session is not None:
+                self.session_paths["spill"] = self.session.spill_path
+            self.frame_count = 0
+            self.delta_store = None
+            if self.delta_mode:
+                self.delta_store = DeltaFrameStore(budget_bytes=self.delta_budget_bytes,
+                                                   pixel_format=self.screen_recorder.pixel_format)
+            # The delta store already tells changed frames apart
+            self.change_detector = ChangeDetector() if self.adaptive_fps and not self.delta_mode else None
+            if self.adaptive_fps:
+                self.frame_scheduler = AdaptiveFrameScheduler(active_fps=self.fps)
+                self.interaction_recorder.on_activity = self.frame_scheduler.notify_activity
+            else:
+                self.frame_scheduler = None
+                self.interaction_recorder.on_activity = None
+
+            # Frames are encoded while recording instead of kept in memory
+            self.encoder = self._create_encoder()
+            self.encoder.start()
+            self.proxy = self._create_proxy()
+
             self.recording = True
-            self.frames = []
-            self.frame_times = []
-            self.start_time = time.time()
+            self._stop_event.clear()
+            self.start_time = self.clock.start()
             
             # Start audio first
             self.audio_recorder.start_recording()
             
             # Start screen recording
-            threading.Thread(target=self._record_screen, daemon=True).start()
+            self.screen_thread = threading.Thread(target=self._record_screen, daemon=True)
+            self.screen_thread.start()
             
             # Start interaction recording
-            self.interaction_recorder.start_recording()
+            log_path = self.session.interaction_log_path if self.session is not None else None
+            self.interaction_recorder.start_recording(log_path=log_path)
             
         except Exception as e:
             print(f"Error starting recording: {e}")
             self.stop_recording()
 
     def _save_video_with_audio(self, video_path, audio_path):
-        """Combine video frames with audio ensuring sync"""
+        """Finalize the streamed video and mux in the audio"""
         try:
-            if not self.frames:
+            frames_written = self.encoder.close(end_timestamp=self.end_time - self.start_time)
+            if not frames_written:
                 return False
-                
-            temp_video = str(video_path.with_suffix('.temp.mp4'))
-            
-            # Calculate actual achieved FPS
-            if len(self.frame_times) > 1:
-                actual_fps = len(self.frame_times) / (self.frame_times[-1] - self.frame_times[0])
-            else:
-                actual_fps = 30
-            
-            # Save video frames
-            height, width = self.frames[0].shape[:2]
-            out = cv2.VideoWriter(
-                temp_video,
-                cv2.VideoWriter_fourcc(*'mp4v'),
-                actual_fps,
-                (width, height)
-            )
-            
-            for frame in self.frames:
-                out.write(frame)
-            out.release()
+
+            temp_video = str(self.encoder.path)
+            if self.encoder.frames_dropped:
+                print(f"Encoder dropped {self.encoder.frames_dropped} frames")
+
+            # The ffmpeg backend already wrote the final muxed file
+            if temp_video == str(video_path):
+                return True
             
-            # Combine video and audio using ffmpeg with explicit sync
-            if os.path.exists(audio_path):
+            # Both streams start at session time 0 and the frames already
+            # follow the audio clock, so they are muxed as they are
+            if os.path.exists(audio_path) and shutil.which('ffmpeg'):
                 command = [
                     'ffmpeg', '-y',
                     '-i', temp_video,
@@ -399,14 +1080,15 @@ class CrossPlatformScreenRecorder:
                     '-c:a', 'aac',
                     '-map', '0:v:0',
                     '-map', '1:a:0',
-                    '-vsync', '1',
-                    '-async', '1',
                     str(video_path)
                 ]
                 subprocess.run(command, check=True)
                 os.remove(temp_video)
+                os.remove(audio_path)
             else:
-                os.rename(temp_video, video_path)
+                if os.path.exists(audio_path):
+                    print(f"ffmpeg not found; audio kept separately in {audio_path}")
+                os.replace(temp_video, video_path)
             
             return True
             
@@ -420,16 +1102,33 @@ class CrossPlatformScreenRecorder:
             
         try:
             self.recording = False
+            self.end_time = self.clock.now()
+            self._stop_event.set()
+            if self.screen_thread is not None:
+                self.screen_thread.join(timeout=2.0)
+            self.screen_recorder.close()
+            if self.capture_stats is not None:
+                print(f"Capture timing: {self.capture_stats.summary()}")
+            print(f"Input hook latency: {self.interaction_recorder.hook_latency()}")
             
             # Stop all recorders
             self.audio_recorder.stop_recording()
             self.interaction_recorder.stop_recording()
+            if self.audio_recorder.sync is not None:
+                print(f"Audio clock: {self.audio_recorder.sync.summary()}")
             
-            # Generate filenames
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            video_path = self.output_dir / f"recording_{timestamp}.mp4"
-            audio_path = self.output_dir / f"audio_{timestamp}.wav"
-            interactions_path = self.output_dir / f"interactions_{timestamp}.json"
+            video_path = self.session_paths["video"]
+            audio_path = self.session_paths["audio"]
+            interactions_path = self.session_paths["interactions"]
+
+            if self.session is not None:
+                # Everything is already on disk; only the segments are stitched
+                self.encoder.close(end_timestamp=self.end_time - self.start_time)
+                if self.encoder.frames_dropped:
+                    print(f"Encoder dropped {self.encoder.frames_dropped} frames")
+                self._close_proxy()
+                self.session.finalize()
+                return str(video_path), str(interactions_path)
             
             # Save interactions
             self.interaction_recorder.save_interactions(interactions_path)
@@ -439,10 +1138,7 @@ class CrossPlatformScreenRecorder:
             
             # Save video with audio
             self._save_video_with_audio(video_path, audio_path)
-            
-            # Clean up
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
+            self._close_proxy()
             
             return str(video_path), str(interactions_path)
             
@@ -450,3 +1146,18 @@ class CrossPlatformScreenRecorder:
             print(f"Error stopping recording: {e}")
             return None, None
 
+    def extract_keyframes(self, output_dir=None, **options):
+        """Save per-interaction keyframes of the last recording (see keyframes).
+
+        With delta_mode the frames are rebuilt from the delta store, and
+        the video is only decoded for events older than the store keeps.
+        """
+        video_path = self.session_paths["video"]
+        if output_dir is None:
+            output_dir = video_path.with_name(f"{video_path.stem}_keyframes")
+        try:
+            return KeyframeExtractor(**options).extract(video_path, self.session_paths["interactions"],
+                                                        output_dir, frames=self.delta_store)
+        except Exception as e:
+            print(f"Error extracting keyframes: {e}")
+            return None
\ No newline at end of file
@@ -0,0 +1,237 @@
+import threading
+import time
+from array import array
+from collections import deque
+
+
+class RecordingClock:
+    """Shared monotonic clock for a recording session.
+
+    Based on time.perf_counter(), which is monotonic and high resolution on
+    every platform (time.monotonic() only ticks every ~16ms on older Windows
+    Pythons).
+    """
+    def __init__(self):
+        self.origin = None
+        self.origin_ns = None
+
+    def start(self):
+        # perf_counter() is perf_counter_ns() in seconds, so input hooks
+        # can keep integer timestamps on the same timeline
+        self.origin_ns = time.perf_counter_ns()
+        self.origin = self.origin_ns / 1e9
+        return self.origin
+
+    @staticmethod
+    def now():
+        """Raw clock reading in seconds"""
+        return time.perf_counter()
+
+    def elapsed(self, now=None):
+        """Seconds since start()"""
+        now = time.perf_counter() if now is None else now
+        return now - self.origin
+
+
+class TickStats:
+    """Jitter and dropped-tick statistics for a FrameTicker"""
+    def __init__(self, max_samples=4096):
+        self.ticks = 0
+        self.dropped = 0
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+        self.max_samples = max_samples
+        self._jitter = array('d')
+        self._next_sample = 0
+
+    def record(self, jitter):
+        self.ticks += 1
+        # Keep the most recent samples only
+        if len(self._jitter) < self.max_samples:
+            self._jitter.append(jitter)
+        else:
+            self._jitter[self._next_sample] = jitter
+            self._next_sample = (self._next_sample + 1) % self.max_samples
+
+    def percentile(self, fraction):
+        if not self._jitter:
+            return 0.0
+        ordered = sorted(self._jitter)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        """Return the statistics as a dict, with times in milliseconds"""
+        samples = self._jitter
+        return {
+            "ticks": self.ticks,
+            "dropped": self.dropped,
+            "jitter_mean_ms": (sum(samples) / len(samples) * 1000) if samples else 0.0,
+            "jitter_p50_ms": self.percentile(0.5) * 1000,
+            "jitter_p99_ms": self.percentile(0.99) * 1000,
+            "jitter_max_ms": (max(samples) * 1000) if samples else 0.0,
+            "cpu_fraction": (self.cpu_time / self.wall_time) if self.wall_time else 0.0,
+        }
+
+
+class FrameTicker:
+    """Deadline-based periodic ticks that sleep on a stop event.
+
+    Deadlines advance on a fixed grid so timing never drifts; ticks that are
+    missed entirely are counted as dropped instead of being bunched up.
+    `interval` may be a number or a callable taking the current clock
+    reading, which is re-evaluated at most every `max_wait` seconds while
+    waiting so a shorter interval takes effect promptly.
+    """
+    def __init__(self, interval, stop_event, max_wait=None):
+        self._interval = interval if callable(interval) else (lambda now: interval)
+        self.stop_event = stop_event
+        self.max_wait = max_wait
+        self.stats = TickStats()
+        self._deadline = None
+        self._last_interval = None
+        self._started = None
+        self._cpu_started = None
+
+    def wait(self):
+        """Block until the next tick. Returns False once stop is requested."""
+        now = time.perf_counter()
+        if self._deadline is None:
+            self._deadline = now
+            self._started = now
+            self._cpu_started = time.thread_time()
+            self.stats.record(0.0)
+            return not self.stop_event.is_set()
+
+        while True:
+            interval = self._interval(now)
+            if interval != self._last_interval:
+                # Rate changed: restart the grid from the last tick
+                self._last_interval = interval
+                deadline = self._deadline + interval
+                if deadline < now:
+                    deadline = now
+            else:
+                deadline = self._deadline + interval
+
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+            timeout = min(remaining, self.max_wait) if self.max_wait else remaining
+            if self.stop_event.wait(timeout):
+                return False
+            now = time.perf_counter()
+
+        late = now - deadline
+        missed = int(late // interval)
+        self.stats.dropped += missed
+        self.stats.record(late - missed * interval)
+        self._deadline = deadline + missed * interval
+
+        self.stats.wall_time = now - self._started
+        self.stats.cpu_time = time.thread_time() - self._cpu_started
+        return not self.stop_event.is_set()
+
+
+class AudioClockSync:
+    """Places audio samples on the session clock of a RecordingClock.
+
+    PortAudio stamps each input block with the time its first sample hit
+    the ADC (`inputBufferAdcTime`), on the stream's own clock. The offset
+    to the session clock is the smallest `now - currentTime` seen over
+    recent callbacks, since callback latency only ever adds to it. A
+    least-squares fit of sample position against session time, kept as
+    running sums, then gives the session time of sample 0 and the sample
+    rate the device really runs at.
+
+    Audio is written untouched, padded with silence so sample 0 plays at
+    its session time; media_time() maps video timestamps onto that audio
+    timeline, so clock drift is corrected by moving frame timestamps
+    instead of resampling audio.
+    """
+    def __init__(self, sample_rate, clock, offset_window=64, min_fit_seconds=2.0):
+        self.sample_rate = sample_rate
+        self.clock = clock
+        self.min_fit_seconds = min_fit_seconds
+        self.samples = 0
+        # Session time at which the leading silence was computed
+        self.pad_start = None
+        self._offsets = deque(maxlen=offset_window)
+        self._lock = threading.Lock()
+        self._first = None
+        self._last = None
+        self._sums = [0, 0.0, 0.0, 0.0, 0.0]  # n, t, s, t*t, t*s
+
+    def observe(self, frames, adc_time, current_time, now=None):
+        """Record a callback block; returns its first sample's session time.
+
+        `now` is the session clock reading at callback entry. Host APIs
+        that do not report ADC times pass 0, in which case the block is
+        assumed to have ended at `current_time`.
+        """
+        now = self.clock.now() if now is None else now
+        if not adc_time:
+            adc_time = current_time - frames / self.sample_rate
+        self._offsets.append(now - current_time)
+        t = adc_time + min(self._offsets) - self.clock.origin
+
+        with self._lock:
+            if self._first is None:
+                self._first = t
+            self._last = t
+            # Relative to the first block so the sums stay well conditioned
+            x = t - self._first
+            s = self.samples
+            sums = self._sums
+            sums[0] += 1
+            sums[1] += x
+            sums[2] += s
+            sums[3] += x * x
+            sums[4] += x * s
+            self.samples += frames
+        return t
+
+    def fit(self):
+        """Return (session time of sample 0, measured sample rate)"""
+        with self._lock:
+            if self._first is None:
+                return None, float(self.sample_rate)
+            n, st, ss, stt, sts = self._sums
+            first, span = self._first, self._last - self._first
+        rate = float(self.sample_rate)
+        if span >= self.min_fit_seconds:
+            rate = (n * sts - st * ss) / (n * stt - st * st)
+        # Intercept: sample 0 sits at -a/rate on the relative time axis
+        return first + (st - ss / rate) / n, rate
+
+    def leading_frames(self):
+        """Frames of silence (negative: frames to skip) before sample 0.
+
+        Call once, before the first block is written; later media_time()
+        results are relative to the start fixed here.
+        """
+        start, _ = self.fit()
+        if start is None:
+            start = 0.0
+        frames = int(round(start * self.sample_rate))
+        self.pad_start = frames / self.sample_rate
+        return frames
+
+    def media_time(self, timestamp):
+        """Map a session timestamp to the playback time of the audio"""
+        start, rate = self.fit()
+        if start is None or self.pad_start is None:
+            return timestamp
+        # The sample captured at `timestamp`, played at the nominal rate
+        return self.pad_start + (timestamp - start) * rate / self.sample_rate
+
+    def summary(self):
+        start, rate = self.fit()
+        drift = rate / self.sample_rate - 1
+        elapsed = (self._last or 0.0) - (start or 0.0)
+        return {
+            "audio_start_ms": (start or 0.0) * 1000,
+            "measured_rate": rate,
+            "drift_ppm": drift * 1e6,
+            # How far audio would be off by the end without correction
+            "drift_ms": elapsed * drift * 1000,
+        }
@@ -0,0 +1,12 @@
+"""File naming rules shared by the recorder and the modules that pick up its outputs.
+
+Kept free of heavy imports so upload and tooling code can use it without
+pulling in the capture and encoding stack.
+"""
+from pathlib import Path
+
+
+def proxy_path_for(video_path):
+    """Where the analysis proxy of `video_path` is written"""
+    video_path = Path(video_path)
+    return video_path.with_name(f"{video_path.stem}.proxy.mp4")
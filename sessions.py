@@ -0,0 +1,324 @@
+"""Segmented, crash-safe recording sessions.
+
+A session directory holds rolling video segments, chunked audio (when the
+encoder does not mux it into the segments), an append-only interaction log,
+the encoder's spill file and a `session.json` manifest. finalize() stitches
+the pieces into the usual recording and interactions files; running this
+module recovers sessions left unfinished by a crash. Segments and chunks
+the crash cut short are left out, frames still in the spill file become a
+last segment and a half-written analysis proxy is rebuilt:
+
+    python sessions.py recordings/session_20250217_093124
+    python sessions.py --all recordings
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import struct
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+from analysis_proxy import proxy_from_video
+from encoders import FFmpegPipeEncoder, StreamingVideoEncoder
+from frame_store import read_spill_file
+from interaction_log import export_log_json
+
+MANIFEST_NAME = "session.json"
+MP4_BOX = struct.Struct('>I4s')
+TS_PACKET_BYTES = 188
+WAV_HEADER_BYTES = 44
+
+
+def _mp4_has_index(path):
+    """Whether an MP4 file contains a complete moov box; a killed writer leaves none"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        position = 0
+        while position + MP4_BOX.size <= size:
+            f.seek(position)
+            box_size, kind = MP4_BOX.unpack(f.read(MP4_BOX.size))
+            if box_size == 1:
+                box_size = struct.unpack('>Q', f.read(8))[0]
+            elif box_size == 0:
+                box_size = size - position
+            if box_size < MP4_BOX.size or position + box_size > size:
+                return False
+            if kind == b'moov':
+                return True
+            position += box_size
+    return False
+
+
+def media_complete(path):
+    """Whether a segment or audio chunk can be stitched.
+
+    MPEG-TS stays readable up to its last packet and WAV chunks are only
+    checked for samples; MP4 is unreadable until its index is written.
+    """
+    path = Path(path)
+    size = path.stat().st_size
+    if path.suffix == '.mp4':
+        return _mp4_has_index(path)
+    if path.suffix == '.ts':
+        return size >= TS_PACKET_BYTES
+    if path.suffix == '.wav':
+        return size > WAV_HEADER_BYTES
+    return size > 0
+
+
+class RecordingSession:
+    """On-disk layout and manifest of a segmented recording"""
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / MANIFEST_NAME
+        self.manifest = {}
+        # Files finalize() had to leave out
+        self.dropped = []
+
+    @classmethod
+    def create(cls, directory, video_path, interactions_path, fps, width, height,
+               segment_seconds, segment_format='ts', move_tolerance=2.0, pixel_format='bgr',
+               profile=None, proxy=None):
+        session = cls(directory)
+        session.directory.mkdir(parents=True, exist_ok=True)
+        session.manifest = {
+            "version": 1,
+            "status": "recording",
+            "created": datetime.now().isoformat(),
+            "fps": fps,
+            "width": width,
+            "height": height,
+            "segment_seconds": segment_seconds,
+            "segment_format": segment_format,
+            "video_segments": f"segment_%05d.{segment_format}",
+            "audio_chunks": "audio_%05d.wav",
+            "interaction_log": "interactions.cbin",
+            "frame_spill": "frames.spill",
+            "move_tolerance": move_tolerance,
+            "pixel_format": pixel_format,
+            "profile": profile,
+            # Absolute, so recovery works from any directory
+            "outputs": {
+                "video": str(Path(video_path).resolve()),
+                "interactions": str(Path(interactions_path).resolve()),
+            },
+            # Analysis proxy settings: path, fps, max_width and backend
+            "proxy": proxy,
+        }
+        session.save()
+        return session
+
+    @classmethod
+    def load(cls, directory):
+        session = cls(directory)
+        with open(session.manifest_path, 'r') as f:
+            session.manifest = json.load(f)
+        return session
+
+    def save(self):
+        """Write the manifest atomically so a crash never leaves it half written"""
+        temp_path = self.manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    @property
+    def status(self):
+        return self.manifest.get("status")
+
+    @property
+    def video_segment_pattern(self):
+        return str(self.directory / self.manifest["video_segments"])
+
+    @property
+    def audio_chunk_pattern(self):
+        return str(self.directory / self.manifest["audio_chunks"])
+
+    @property
+    def interaction_log_path(self):
+        return self.directory / self.manifest["interaction_log"]
+
+    @property
+    def spill_path(self):
+        return self.directory / self.manifest.get("frame_spill", "frames.spill")
+
+    def _existing(self, pattern):
+        prefix, suffix = pattern.split('%05d')
+        return sorted(self.directory.glob(f"{Path(prefix).name}*{suffix}"))
+
+    def video_segments(self):
+        return self._existing(self.manifest["video_segments"])
+
+    def audio_chunks(self):
+        return self._existing(self.manifest["audio_chunks"])
+
+    def _complete(self, paths):
+        complete = [path for path in paths if media_complete(path)]
+        self.dropped += [path.name for path in paths if path not in complete]
+        return complete
+
+    def _encode_spill(self, path):
+        """Encode the frames left in the spill file into `path`; returns the count"""
+        records = read_spill_file(self.spill_path)
+        first = next(records, None)
+        if first is None:
+            return 0
+        fps = self.manifest["fps"]
+        height, width, channels = first[1].shape
+        pixel_format = self.manifest.get("pixel_format") or ('bgr' if channels == 3 else 'bgra')
+        encoder_class = FFmpegPipeEncoder if self.manifest["segment_format"] == 'ts' else StreamingVideoEncoder
+        encoder = encoder_class(path, width, height, fps=fps, input_format=pixel_format,
+                                buffer_bytes=8 * first[1].nbytes, drop_policy='block',
+                                profile=self.manifest.get("profile"))
+        encoder.start()
+        start = last = first[0]
+        count = 0
+        for timestamp, frame in itertools.chain([first], records):
+            encoder.write(frame, timestamp - start)
+            last = timestamp
+            count += 1
+        encoder.close(end_timestamp=last - start + 1 / fps)
+        return count
+
+    def _recover_spill(self):
+        """Turn frames the encoder never took into a segment after the last one"""
+        if not self.spill_path.exists():
+            return None
+        pattern = self.manifest["video_segments"]
+        prefix, suffix = pattern.split('%05d')
+        numbers = [int(path.name[len(prefix):-len(suffix)]) for path in self.video_segments()]
+        path = self.directory / (pattern % (max(numbers, default=-1) + 1))
+        try:
+            frames = self._encode_spill(path)
+        except Exception as e:
+            print(f"Error recovering spilled frames: {e}")
+            self.dropped.append(self.spill_path.name)
+            return None
+        os.remove(self.spill_path)
+        if not frames:
+            return None
+        print(f"Recovered {frames} spilled frames into {path.name}")
+        return path
+
+    def _rebuild_proxy(self, video_path):
+        """Replace an analysis proxy the crash left unfinished"""
+        proxy = self.manifest.get("proxy")
+        if not proxy or not os.path.exists(proxy["path"]) or media_complete(proxy["path"]):
+            return
+        os.remove(proxy["path"])
+        if video_path is None:
+            return
+        try:
+            proxy_from_video(video_path, proxy["path"], fps=proxy["fps"],
+                             max_width=proxy["max_width"], backend=proxy["backend"])
+        except Exception as e:
+            print(f"Error rebuilding analysis proxy: {e}")
+            self.dropped.append(Path(proxy["path"]).name)
+
+    def finalize(self, keep_segments=False):
+        """Stitch segments into the final outputs; returns (video, interactions).
+
+        Files that could not be used are listed in `dropped`; the session
+        directory is then kept so nothing is deleted.
+        """
+        outputs = self.manifest["outputs"]
+        video_path = None
+        interactions_path = None
+        self.dropped = []
+
+        segments = self._complete(self.video_segments())
+        spill_segment = self._recover_spill()
+        if spill_segment is not None:
+            segments.append(spill_segment)
+        if segments:
+            concat_media(segments, self._complete(self.audio_chunks()), outputs["video"],
+                         self.directory, self.manifest["segment_format"])
+            video_path = outputs["video"]
+        self._rebuild_proxy(video_path)
+
+        if self.interaction_log_path.exists():
+            export_log_json(self.interaction_log_path, outputs["interactions"],
+                            move_tolerance=self.manifest.get("move_tolerance", 2.0))
+            interactions_path = outputs["interactions"]
+
+        self.manifest["status"] = "finalized"
+        self.manifest["finalized"] = datetime.now().isoformat()
+        self.manifest["dropped"] = self.dropped
+        self.save()
+
+        if video_path and not keep_segments and not self.dropped:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+        return video_path, interactions_path
+
+
+def _write_concat_list(paths, list_path):
+    with open(list_path, 'w') as f:
+        for path in paths:
+            escaped = str(Path(path).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+
+def concat_media(segments, audio_chunks, output, work_dir, segment_format='ts'):
+    """Join segments with ffmpeg's concat demuxer without re-encoding video"""
+    work_dir = Path(work_dir)
+    video_list = work_dir / "video_segments.txt"
+    _write_concat_list(segments, video_list)
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error',
+               '-f', 'concat', '-safe', '0', '-i', str(video_list)]
+    if audio_chunks:
+        audio_list = work_dir / "audio_chunks.txt"
+        _write_concat_list(audio_chunks, audio_list)
+        command += ['-f', 'concat', '-safe', '0', '-i', str(audio_list),
+                    '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy', '-c:a', 'aac']
+    else:
+        # Segments already carry their audio
+        command += ['-c', 'copy']
+        if segment_format == 'ts':
+            command += ['-bsf:a', 'aac_adtstoasc']
+    command.append(str(output))
+    subprocess.run(command, check=True)
+
+
+def find_unfinished_sessions(root):
+    """Return session directories under `root` that were never finalized"""
+    sessions = []
+    for manifest in sorted(Path(root).glob(f"*/{MANIFEST_NAME}")):
+        session = RecordingSession.load(manifest.parent)
+        if session.status != "finalized":
+            sessions.append(session)
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recover unfinished recording sessions")
+    parser.add_argument("sessions", nargs="*", help="Session directories to finalize")
+    parser.add_argument("--all", metavar="ROOT", help="Recover every unfinished session under ROOT")
+    parser.add_argument("--keep-segments", action="store_true",
+                        help="Keep the session directory after stitching")
+    args = parser.parse_args()
+
+    sessions = [RecordingSession.load(path) for path in args.sessions]
+    if args.all:
+        sessions += find_unfinished_sessions(args.all)
+    if not sessions:
+        parser.error("No sessions to recover")
+
+    for session in sessions:
+        try:
+            video_path, interactions_path = session.finalize(keep_segments=args.keep_segments)
+            if session.dropped:
+                print(f"Partially recovered {session.directory}: {video_path}, {interactions_path}; "
+                      f"left out {', '.join(session.dropped)}")
+            else:
+                print(f"Recovered {session.directory}: {video_path}, {interactions_path}")
+        except Exception as e:
+            print(f"Error recovering {session.directory}: {e}")
+
+
+if __name__ == "__main__":
+    main()